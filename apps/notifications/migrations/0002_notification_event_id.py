@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="event_id",
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
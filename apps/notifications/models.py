@@ -21,6 +21,8 @@ class Notification(models.Model):
     )
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Sự kiện đơn hàng sinh ra thông báo; dùng để dựng lại thông báo khi replay mà không tạo trùng
+    event_id = models.CharField(max_length=100, null=True, blank=True, unique=True)
 
     class Meta:
         ordering = ['-created_at']
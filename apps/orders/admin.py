@@ -1,7 +1,20 @@
 from django.contrib import admin
 
-from apps.orders.models import Order, OrderItem
+from apps.orders.models import Order, OrderItem, OutboxEvent, ReplayCheckpoint
 
 # Register your models here.
 admin.site.register(Order)
-admin.site.register(OrderItem)
\ No newline at end of file
+admin.site.register(OrderItem)
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'topic', 'key', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('event_type', 'topic')
+    search_fields = ('key',)
+
+
+@admin.register(ReplayCheckpoint)
+class ReplayCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('name', 'topic', 'partition', 'offset', 'end_offset', 'events', 'updated_at')
+    list_filter = ('name',)
@@ -0,0 +1,59 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from events.schema import ENCODING_BINARY, ENCODING_JSON, decode_event, encode_event
+
+
+def large_order_event(items):
+    return {
+        "event_id": str(uuid.uuid4()),
+        "event_type": "ORDER_CREATED",
+        "order_id": 123456,
+        "user_id": 4242,
+        "email": "buyer@example.com",
+        "items": [{"product_id": 1000 + index * 7, "quantity": index % 5 + 1} for index in range(items)],
+        "stock_reserved": True,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare size and encode/decode cost of the JSON and binary event encodings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, nargs='+', default=[1, 20, 200, 2000],
+                            help='Order sizes (line items) to measure')
+        parser.add_argument('--iterations', type=int, default=2000, help='Encode/decode rounds per measurement')
+        parser.add_argument('--threshold', type=int, default=settings.EVENT_COMPRESSION_THRESHOLD,
+                            help='Compression threshold in bytes for the binary+zlib variant')
+
+    def handle(self, *args, **options):
+        variants = [
+            ('json', ENCODING_JSON, 0),
+            ('binary', ENCODING_BINARY, 0),
+            ('binary+zlib', ENCODING_BINARY, options['threshold']),
+        ]
+        iterations = options['iterations']
+        for items in options['items']:
+            event = large_order_event(items)
+            self.stdout.write(f"{items} items:")
+            for name, encoding, threshold in variants:
+                payload = encode_event(event, encoding=encoding, compression_threshold=threshold)
+                if decode_event(payload) != event:
+                    raise CommandError(f"{name} did not round-trip the event")
+
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    encode_event(event, encoding=encoding, compression_threshold=threshold)
+                encode_us = (time.perf_counter() - started) / iterations * 1e6
+
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    decode_event(payload)
+                decode_us = (time.perf_counter() - started) / iterations * 1e6
+
+                self.stdout.write(
+                    f"  {name:>12}: {len(payload):>8,} bytes, encode {encode_us:9.1f} us, decode {decode_us:9.1f} us"
+                )
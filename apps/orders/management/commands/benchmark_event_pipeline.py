@@ -0,0 +1,175 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+
+from apps.notifications.models import Notification
+from apps.orders.models import ProcessedEvent
+from apps.products.models import Category, Product
+from apps.users.models import User
+from events.consumers.order_consumer import BATCH_SIZE, build_consumer_config, run_consumer
+from events.producers.order_producer import OrderEventProducer, build_producer_config
+from events.schema import ENCODING_BINARY, ENCODING_JSON, encode_event
+from events.transport.memory import InMemoryBroker, InMemoryConsumer, InMemoryProducer
+
+INITIAL_STOCK = 1_000_000
+DELETE_CHUNK_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = ('Measure end-to-end order event throughput: produce to an in-process broker and consume with the '
+            'real consumer loop and handlers against the configured database. Test rows are removed afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=5000,
+                            help='Orders to simulate; each produces ORDER_CREATED plus ORDER_DELIVERED or ORDER_CANCELED')
+        parser.add_argument('--items', type=int, default=3, help='Line items per order')
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--partitions', type=int, default=6)
+        parser.add_argument('--consumers', type=int, default=2, help='Consumers in the group (threads)')
+        parser.add_argument('--batch-size', type=int, default=settings.KAFKA_CONSUMER_BATCH_SIZE)
+        parser.add_argument('--concurrency', type=int, default=settings.KAFKA_CONSUMER_CONCURRENCY)
+        parser.add_argument('--encoding', choices=[ENCODING_JSON, ENCODING_BINARY], default=ENCODING_JSON)
+        parser.add_argument('--timeout', type=float, default=300.0, help='Give up after this many seconds')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated products, users and ledger rows')
+
+    def handle(self, *args, **options):
+        run = uuid.uuid4().hex[:8]
+        # Không gửi email thật trong benchmark
+        with override_settings(NOTIFICATION_EMAIL_BACKEND='django.core.mail.backends.dummy.EmailBackend'):
+            category, products, users = self._fixtures(run, options)
+            events = []
+            try:
+                events, expected_stock = self._events(products, users, options)
+                broker = InMemoryBroker(options['partitions'])
+                producer = OrderEventProducer(client=InMemoryProducer(build_producer_config(), broker=broker))
+                try:
+                    self._produce(producer, events, options['encoding'])
+                    self._consume(broker, producer, len(events), run, options)
+                finally:
+                    producer.close()
+                self._verify(products, users, events, expected_stock)
+            finally:
+                if not options['keep']:
+                    self._cleanup(category, products, users, events)
+
+    def _fixtures(self, run, options):
+        category = Category.objects.create(category_name=f'bench-{run}')
+        products = Product.objects.bulk_create([
+            Product(
+                product_name=f'bench-{run}-{index}', description='benchmark', price=10,
+                category=category, stock_quantity=INITIAL_STOCK, image='sample.jpg',
+            )
+            for index in range(options['products'])
+        ])
+        users = User.objects.bulk_create([
+            User(username=f'bench-{run}-{index}', email=f'bench-{run}-{index}@example.com')
+            for index in range(options['users'])
+        ])
+        return category, products, users
+
+    def _events(self, products, users, options):
+        events, expected_stock = [], {product.pk: INITIAL_STOCK for product in products}
+        for order_id in range(1, options['orders'] + 1):
+            user = users[order_id % len(users)]
+            items = [
+                {'product_id': products[(order_id * 7 + index) % len(products)].pk, 'quantity': index % 3 + 1}
+                for index in range(options['items'])
+            ]
+            base = {'order_id': order_id, 'user_id': user.pk, 'email': user.email}
+            events.append(dict(base, event_id=str(uuid.uuid4()), event_type='ORDER_CREATED',
+                               items=items, stock_reserved=True))
+            if order_id % 3:
+                events.append(dict(base, event_id=str(uuid.uuid4()), event_type='ORDER_DELIVERED'))
+            else:
+                events.append(dict(base, event_id=str(uuid.uuid4()), event_type='ORDER_CANCELED', items=items))
+                for item in items:
+                    expected_stock[item['product_id']] += item['quantity']
+        return events, expected_stock
+
+    def _produce(self, producer, events, encoding):
+        started = time.perf_counter()
+        for event in events:
+            producer.produce(settings.ORDER_TOPIC, encode_event(event, encoding=encoding), key=event['order_id'])
+        remaining = producer.flush()
+        elapsed = time.perf_counter() - started
+        if remaining:
+            raise CommandError(f'{remaining} events were not delivered to the broker')
+        self.stdout.write(f'Produced {len(events)} events in {elapsed:.2f}s ({len(events) / elapsed:,.0f} events/s)')
+
+    def _consume(self, broker, producer, total, run, options):
+        group = f'bench-pipeline-{run}'
+        config = build_consumer_config(**{'group.id': group})
+        stop_event = threading.Event()
+        errors = []
+
+        def worker():
+            try:
+                run_consumer(
+                    batch_size=options['batch_size'], timeout=0.2, concurrency=options['concurrency'],
+                    metrics_port=0, consumer=InMemoryConsumer(config, broker=broker), producer=producer,
+                    stop_event=stop_event,
+                )
+            except Exception as exc:
+                errors.append(exc)
+                stop_event.set()
+            finally:
+                connections.close_all()
+
+        partitions = range(broker.partitions(settings.ORDER_TOPIC))
+        batches_before = BATCH_SIZE.count()
+        threads = [threading.Thread(target=worker, name=f'bench-consumer-{index}') for index in range(options['consumers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while not stop_event.is_set():
+                committed = sum(
+                    max(0, broker.committed(group, settings.ORDER_TOPIC, partition)) for partition in partitions
+                )
+                if committed >= total:
+                    break
+                if time.perf_counter() - started > options['timeout']:
+                    raise CommandError(f'Timed out after {committed} of {total} events')
+                time.sleep(0.01)
+            elapsed = time.perf_counter() - started
+        finally:
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise CommandError(f'Consumer failed: {errors[0]}')
+
+        batches = BATCH_SIZE.count() - batches_before
+        self.stdout.write(
+            f"Consumed {total} events in {elapsed:.2f}s ({total / elapsed:,.0f} events/s) with "
+            f"{options['consumers']} consumers x {options['concurrency']} threads, {batches} batches "
+            f"(avg {total / max(1, batches):.0f} events/batch, {options['encoding']} encoding)"
+        )
+
+    def _verify(self, products, users, events, expected_stock):
+        stock = dict(Product.objects.filter(pk__in=expected_stock).values_list('pk', 'stock_quantity'))
+        wrong = [pk for pk, quantity in expected_stock.items() if stock.get(pk) != quantity]
+        notifications = Notification.objects.filter(user__in=users).count()
+        expected_notifications = sum(1 for event in events if event['event_type'] != 'ORDER_CANCELED')
+        problems = []
+        if wrong:
+            problems.append(f'{len(wrong)} products have unexpected stock')
+        if notifications != expected_notifications:
+            problems.append(f'{notifications} notifications instead of {expected_notifications}')
+        if problems:
+            raise CommandError('; '.join(problems))
+        self.stdout.write(self.style.SUCCESS('Stock and notifications match the produced events'))
+
+    def _cleanup(self, category, products, users, events):
+        event_ids = [event['event_id'] for event in events]
+        for start in range(0, len(event_ids), DELETE_CHUNK_SIZE):
+            ProcessedEvent.objects.filter(event_id__in=event_ids[start:start + DELETE_CHUNK_SIZE]).delete()
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        Product.objects.filter(pk__in=[product.pk for product in products]).delete()
+        category.delete()
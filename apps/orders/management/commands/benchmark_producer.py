@@ -0,0 +1,70 @@
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from events.producers.order_producer import OrderEventProducer, build_producer_config
+from events.transport.memory import InMemoryBroker, InMemoryProducer
+
+
+def sample_event(index, distinct_orders):
+    order_id = index % distinct_orders + 1
+    return {
+        "event_type": "ORDER_CREATED",
+        "order_id": order_id,
+        "user_id": order_id,
+        "email": f"user{order_id}@example.com",
+        "items": [{"product_id": index % 97 + 1, "quantity": 1}],
+        "stock_reserved": True,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Measure order event producer throughput against an in-process stand-in broker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=20000, help='Messages to send in batched mode')
+        parser.add_argument('--sync-messages', type=int, default=500,
+                            help='Messages to send in flush-per-message mode (the old behaviour)')
+        parser.add_argument('--latency-ms', type=float, default=2.0, help='Simulated broker round trip per request')
+        parser.add_argument('--partitions', type=int, default=3)
+        parser.add_argument('--orders', type=int, default=1000, help='Distinct order ids (message keys)')
+        parser.add_argument('--linger-ms', type=int, default=settings.KAFKA_PRODUCER_LINGER_MS)
+        parser.add_argument('--batch-size', type=int, default=settings.KAFKA_PRODUCER_BATCH_NUM_MESSAGES)
+        parser.add_argument('--queue-size', type=int, default=settings.KAFKA_PRODUCER_QUEUE_MAX_MESSAGES)
+
+    def handle(self, *args, **options):
+        config = build_producer_config(**{
+            'linger.ms': options['linger_ms'],
+            'batch.num.messages': options['batch_size'],
+            'queue.buffering.max.messages': options['queue_size'],
+        })
+        for mode, count in (('sync', options['sync_messages']), ('batched', options['messages'])):
+            if count <= 0:
+                continue
+            broker = InMemoryBroker(options['partitions'], latency=options['latency_ms'] / 1000)
+            producer = OrderEventProducer(client=InMemoryProducer(config, broker=broker))
+            started = time.perf_counter()
+            for index in range(count):
+                producer.produce(settings.ORDER_TOPIC, sample_event(index, options['orders']))
+                if mode == 'sync':
+                    producer.flush()
+            remaining = producer.close()
+            elapsed = time.perf_counter() - started
+
+            self.stdout.write(
+                f"{mode:>8}: {count} messages in {elapsed:.3f}s "
+                f"({count / elapsed:,.0f} msg/s, {broker.requests} broker requests, {remaining} undelivered)"
+            )
+            self._check_key_affinity(broker, options['partitions'])
+
+    def _check_key_affinity(self, broker, partitions):
+        # Mọi message cùng key phải nằm trên một partition, offset tăng dần
+        seen = defaultdict(set)
+        for partition in range(partitions):
+            for message in broker.messages(settings.ORDER_TOPIC, partition):
+                seen[message.key()].add(partition)
+        split = [key for key, parts in seen.items() if len(parts) > 1]
+        if split:
+            self.stderr.write(f"{len(split)} keys were spread over several partitions")
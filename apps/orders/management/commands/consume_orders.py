@@ -1,8 +1,31 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from events.consumers.order_consumer import run_consumer
+from events.consumers.workers import run_worker_pool
 
 class Command(BaseCommand):
     help = 'Run Kafka consumer for order-events'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.KAFKA_CONSUMER_BATCH_SIZE,
+                            help='Maximum messages applied per DB transaction')
+        parser.add_argument('--timeout', type=float, default=settings.KAFKA_CONSUMER_BATCH_TIMEOUT,
+                            help='Seconds to wait for a batch to fill')
+        parser.add_argument('--workers', type=int, default=settings.KAFKA_CONSUMER_WORKERS,
+                            help='Consumer processes in the group; partitions are split between them')
+        parser.add_argument('--concurrency', type=int, default=settings.KAFKA_CONSUMER_CONCURRENCY,
+                            help='Threads per worker; events of one order_id stay on one thread')
+        parser.add_argument('--metrics-port', type=int, default=settings.KAFKA_CONSUMER_METRICS_PORT,
+                            help='Port of the Prometheus /metrics endpoint (worker N uses port + N, 0 disables)')
+
     def handle(self, *args, **options):
-        run_consumer()
+        consumer_options = {
+            'batch_size': options['batch_size'],
+            'timeout': options['timeout'],
+            'concurrency': options['concurrency'],
+            'metrics_port': options['metrics_port'],
+        }
+        if options['workers'] > 1:
+            run_worker_pool(options['workers'], **consumer_options)
+        else:
+            run_consumer(**consumer_options)
@@ -0,0 +1,135 @@
+import json
+
+from confluent_kafka import TopicPartition
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from events.consumers.order_consumer import build_consumer_config
+from events.producers.order_producer import get_producer
+from events.retry import (
+    HEADER_ATTEMPT, HEADER_NOT_BEFORE, HEADER_ORIGINAL_TIMESTAMP, HEADER_ORIGINAL_TOPIC, message_headers,
+)
+from events.schema import decode_event
+from events.transport import create_consumer
+
+HEADER_REDRIVEN_FROM = 'x-redriven-from'
+
+
+class Command(BaseCommand):
+    help = 'Inspect or re-drive messages in the order dead-letter topic'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['inspect', 'redrive'])
+        parser.add_argument('--limit', type=int, default=100, help='Maximum messages to read')
+        parser.add_argument('--all', action='store_true',
+                            help='Inspect from the start of the topic instead of the messages not yet re-driven')
+        parser.add_argument('--partition', type=int, help='Only this DLQ partition (use with --offset)')
+        parser.add_argument('--offset', type=int, help='Only the message at this offset')
+        parser.add_argument('--dry-run', action='store_true', help='Show what would be re-driven')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Broker timeout in seconds')
+
+    def handle(self, *args, **options):
+        if (options['partition'] is None) != (options['offset'] is None):
+            raise CommandError('--partition and --offset must be used together')
+
+        consumer = create_consumer(build_consumer_config(**{'group.id': settings.ORDER_DLQ_REDRIVE_GROUP}))
+        try:
+            ranges = self._ranges(consumer, options)
+            messages = list(self._read(consumer, ranges, options['limit'], options['timeout']))
+            if options['action'] == 'inspect' or options['dry_run']:
+                for msg in messages:
+                    self._print(msg)
+                self.stdout.write(f'{len(messages)} messages')
+                return
+            self._redrive(consumer, messages, single=options['offset'] is not None)
+        finally:
+            consumer.close()
+
+    def _ranges(self, consumer, options):
+        """
+        (partition, offset bắt đầu, high watermark) cần đọc cho mỗi partition DLQ.
+        """
+        topic = settings.ORDER_DLQ_TOPIC
+        timeout = options['timeout']
+        if options['offset'] is not None:
+            return [(options['partition'], options['offset'], options['offset'] + 1)]
+
+        metadata = consumer.list_topics(topic, timeout=timeout).topics.get(topic)
+        if metadata is None or metadata.error is not None:
+            raise CommandError(f'Topic {topic} not found')
+        partitions = [TopicPartition(topic, partition) for partition in sorted(metadata.partitions)]
+        committed = {tp.partition: tp.offset for tp in consumer.committed(partitions, timeout=timeout)}
+
+        ranges = []
+        for tp in partitions:
+            low, high = consumer.get_watermark_offsets(tp, timeout=timeout)
+            start = low if options['all'] or committed[tp.partition] < 0 else max(low, committed[tp.partition])
+            if start < high:
+                ranges.append((tp.partition, start, high))
+        return ranges
+
+    def _read(self, consumer, ranges, limit, timeout):
+        topic = settings.ORDER_DLQ_TOPIC
+        ends = {partition: high for partition, _, high in ranges}
+        if not ends:
+            return
+        consumer.assign([TopicPartition(topic, partition, start) for partition, start, _ in ranges])
+        read = 0
+        while ends and read < limit:
+            msg = consumer.poll(timeout)
+            if msg is None:
+                self.stderr.write('Timed out waiting for DLQ messages')
+                return
+            if msg.error():
+                self.stderr.write(f'Consumer error: {msg.error()}')
+                continue
+            if msg.partition() not in ends:
+                continue
+            if msg.offset() + 1 >= ends[msg.partition()]:
+                ends.pop(msg.partition())
+            read += 1
+            yield msg
+
+    def _print(self, msg):
+        value = msg.value() or b''
+        try:
+            payload = decode_event(value)
+        except ValueError:
+            payload = value[:500].decode('utf-8', 'replace')
+        self.stdout.write(json.dumps({
+            'partition': msg.partition(),
+            'offset': msg.offset(),
+            'key': msg.key().decode('utf-8', 'replace') if msg.key() else None,
+            'headers': message_headers(msg),
+            'payload': payload,
+        }, ensure_ascii=False))
+
+    def _redrive(self, consumer, messages, single):
+        producer = get_producer()
+        for msg in messages:
+            headers = message_headers(msg)
+            target = headers.get(HEADER_ORIGINAL_TOPIC, settings.ORDER_TOPIC)
+            # Bắt đầu lại số lần thử, giữ nguyên bước bị lỗi (x-stage) và vị trí gốc.
+            # Bỏ timestamp gốc để thời gian nằm trong DLQ không bị tính vào độ trễ xử lý
+            redriven = {
+                name: value for name, value in headers.items()
+                if name not in (HEADER_ATTEMPT, HEADER_NOT_BEFORE, HEADER_ORIGINAL_TIMESTAMP)
+            }
+            redriven[HEADER_REDRIVEN_FROM] = f'{msg.topic()}:{msg.partition()}:{msg.offset()}'
+            producer.produce_raw(target, msg.value(), key=msg.key(), headers=list(redriven.items()))
+            self.stdout.write(f'Re-drove {msg.partition()}@{msg.offset()} to {target}')
+
+        remaining = producer.flush()
+        if remaining:
+            raise CommandError(f'{remaining} messages were not acknowledged; DLQ offsets were not committed')
+
+        # Một message lẻ không dời vị trí của nhóm re-drive để không bỏ sót các message trước nó
+        if messages and not single:
+            offsets = {}
+            for msg in messages:
+                offsets[msg.partition()] = max(offsets.get(msg.partition(), -1), msg.offset() + 1)
+            consumer.commit(
+                offsets=[TopicPartition(settings.ORDER_DLQ_TOPIC, p, o) for p, o in offsets.items()],
+                asynchronous=False,
+            )
+        self.stdout.write(f'Re-drove {len(messages)} messages')
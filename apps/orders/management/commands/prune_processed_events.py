@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from events.ledger import prune_ledger
+
+
+class Command(BaseCommand):
+    help = 'Delete processed-event ledger entries older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.EVENT_LEDGER_RETENTION_DAYS,
+                            help='Keep entries processed within this many days')
+
+    def handle(self, *args, **options):
+        deleted = prune_ledger(options['days'])
+        self.stdout.write(f'Deleted {deleted} processed event entries')
@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from events.outbox import mark_for_replay, purge_sent_events, relay_pending_events
+
+
+class Command(BaseCommand):
+    help = 'Publish pending outbox events to Kafka in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Relay one batch and exit')
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--purge', action='store_true',
+                            help='Delete sent events older than OUTBOX_RETENTION_DAYS and exit')
+        parser.add_argument('--replay', action='store_true',
+                            help='Mark already sent events as pending again so they are re-published, then exit')
+        parser.add_argument('--id', type=int, action='append', dest='event_ids',
+                            help='Replay only this event id (repeatable)')
+        parser.add_argument('--since', help='Replay events created at or after this ISO datetime')
+        parser.add_argument('--until', help='Replay events created before this ISO datetime')
+        parser.add_argument('--event-type', help='Replay only this event type, e.g. ORDER_CREATED')
+
+    def handle(self, *args, **options):
+        if options['purge']:
+            deleted = purge_sent_events()
+            self.stdout.write(f'Deleted {deleted} sent outbox events')
+            return
+
+        if options['replay']:
+            since = self._parse_datetime(options['since'])
+            until = self._parse_datetime(options['until'])
+            if not (options['event_ids'] or since or until or options['event_type']):
+                raise CommandError('Use --id, --since, --until or --event-type to select events to replay')
+            count = mark_for_replay(options['event_ids'], since, until, options['event_type'])
+            self.stdout.write(f'Marked {count} outbox events for replay')
+            return
+
+        self.stdout.write('Outbox relay started')
+        try:
+            while True:
+                sent, failed = relay_pending_events(options['batch_size'])
+                if options['once']:
+                    self.stdout.write(f'Relayed {sent} outbox events, {failed} failed')
+                    return
+                if not sent:
+                    # Outbox rỗng hoặc broker đang lỗi: chờ trước khi thử lại
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Outbox relay stopped')
+
+    @staticmethod
+    def _parse_datetime(value):
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f'Invalid datetime: {value}')
+        return parsed
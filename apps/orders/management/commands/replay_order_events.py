@@ -0,0 +1,201 @@
+import time
+
+from confluent_kafka import TopicPartition
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from events.consumers.order_consumer import build_consumer_config, decode_message
+from events.replay import (
+    EFFECTS, EFFECTS_ALL, EFFECTS_NONE, EFFECTS_STOCK, apply_replay_batch, load_checkpoints, save_progress, start_checkpoints,
+)
+from events.transport import create_consumer
+
+REPORT_INTERVAL = 5.0
+
+
+class Command(BaseCommand):
+    help = ('Replay order events from Kafka to re-apply stock changes and/or rebuild notifications. '
+            'Progress is checkpointed in the database under --name; run again with the same name to resume. '
+            'Emails are never sent.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', required=True, help='Checkpoint name of this replay')
+        parser.add_argument('--from-offset', type=int, help='Start at this offset in every selected partition')
+        parser.add_argument('--from-timestamp', help='Start at the first event at or after this ISO datetime')
+        parser.add_argument('--until-timestamp', help='Stop before the first event at or after this ISO datetime')
+        parser.add_argument('--partition', type=int, action='append', dest='partitions',
+                            help='Replay only this partition (repeatable)')
+        parser.add_argument('--effects', choices=EFFECTS, default=EFFECTS_ALL,
+                            help='all, stock (stock changes only), notifications (rebuild rows only) or none')
+        parser.add_argument('--dry-run', action='store_true', help='Read and count events without writing anything')
+        parser.add_argument('--ignore-ledger', action='store_true',
+                            help='Re-apply stock changes of events already recorded as processed')
+        parser.add_argument('--restart', action='store_true', help='Discard the checkpoint and start over')
+        parser.add_argument('--batch-size', type=int, default=settings.KAFKA_CONSUMER_BATCH_SIZE)
+        parser.add_argument('--timeout', type=float, default=10.0, help='Broker timeout in seconds')
+
+    def handle(self, *args, **options):
+        if options['from_offset'] is not None and options['from_timestamp']:
+            raise CommandError('Use either --from-offset or --from-timestamp')
+        effects = EFFECTS_NONE if options['dry_run'] else options['effects']
+        if options['ignore_ledger'] and effects != EFFECTS_NONE:
+            self.stderr.write('--ignore-ledger: stock changes of already processed events will be applied again')
+
+        name = options['name']
+        topic = settings.ORDER_TOPIC
+        consumer = create_consumer(build_consumer_config(**{
+            'group.id': f'order-replay-{name}',
+            'enable.partition.eof': False,
+        }))
+        try:
+            ranges = self._ranges(consumer, topic, effects, options)
+            if not ranges:
+                self.stdout.write('Nothing to replay')
+                return
+            self._replay(consumer, topic, ranges, effects, options)
+        finally:
+            consumer.close()
+
+    def _ranges(self, consumer, topic, effects, options):
+        """
+        [(partition, offset đầu, offset cuối)] còn phải replay, từ checkpoint nếu có.
+        """
+        name = options['name']
+        checkpoints = [] if options['restart'] else load_checkpoints(name)
+        if checkpoints:
+            self.stdout.write(f'Resuming replay {name} from its checkpoint')
+            return [(c.partition, c.offset, c.end_offset) for c in checkpoints if not c.done]
+
+        timeout = options['timeout']
+        metadata = consumer.list_topics(topic, timeout=timeout).topics.get(topic)
+        if metadata is None or metadata.error is not None:
+            raise CommandError(f'Topic {topic} not found')
+        partitions = sorted(metadata.partitions)
+        if options['partitions']:
+            unknown = set(options['partitions']) - set(partitions)
+            if unknown:
+                raise CommandError(f'Unknown partitions: {sorted(unknown)}')
+            partitions = sorted(options['partitions'])
+
+        starts = self._offsets_for(consumer, topic, partitions, options['from_timestamp'], timeout)
+        ends = self._offsets_for(consumer, topic, partitions, options['until_timestamp'], timeout)
+        # Replay tồn kho ghi sự kiện vào sổ ProcessedEvent, và consumer bỏ qua sự kiện
+        # đã có trong sổ (kể cả thông báo/email). Vì vậy chỉ replay tới offset mà
+        # consumer group đang chạy đã commit.
+        live = self._live_offsets(topic, partitions, timeout) if effects in (EFFECTS_ALL, EFFECTS_STOCK) else {}
+        ranges = []
+        for partition in partitions:
+            low, high = consumer.get_watermark_offsets(TopicPartition(topic, partition), timeout=timeout)
+            start = options['from_offset'] if options['from_offset'] is not None else starts.get(partition, low)
+            # Dừng ở high watermark lúc bắt đầu: sự kiện mới đến sau đó do consumer xử lý
+            end = min(high, ends.get(partition, high))
+            if partition in live and live[partition] < end:
+                self.stdout.write(
+                    f'Partition {partition}: stopping at offset {live[partition]} '
+                    f'committed by {settings.KAFKA_ORDER_CONSUMER_GROUP} instead of {end}'
+                )
+                end = live[partition]
+            ranges.append((partition, max(low, min(start, high)), end))
+
+        if options['dry_run']:
+            return ranges
+        start_checkpoints(name, topic, ranges)
+        return [(partition, start, end) for partition, start, end in ranges if start < end]
+
+    def _live_offsets(self, topic, partitions, timeout):
+        """
+        Offset đã commit của consumer group đang chạy; partition chưa commit
+        gì thì là 0 vì consumer sẽ đọc nó từ đầu.
+        """
+        live = create_consumer(build_consumer_config(**{'enable.partition.eof': False}))
+        try:
+            committed = live.committed([TopicPartition(topic, partition) for partition in partitions], timeout=timeout)
+        finally:
+            live.close()
+        return {tp.partition: max(0, tp.offset) for tp in committed}
+
+    def _offsets_for(self, consumer, topic, partitions, value, timeout):
+        if not value:
+            return {}
+        moment = parse_datetime(value)
+        if moment is None:
+            raise CommandError(f'Invalid datetime: {value}')
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        timestamp = int(moment.timestamp() * 1000)
+        found = consumer.offsets_for_times(
+            [TopicPartition(topic, partition, timestamp) for partition in partitions], timeout=timeout
+        )
+        # offset < 0: không có sự kiện nào từ thời điểm đó, tức là hết partition
+        return {tp.partition: tp.offset for tp in found if tp.offset >= 0}
+
+    def _replay(self, consumer, topic, ranges, effects, options):
+        name = options['name']
+        ends = {partition: end for partition, start, end in ranges if start < end}
+        consumer.assign([TopicPartition(topic, partition, start) for partition, start, end in ranges if start < end])
+        remaining = sum(end - start for _, start, end in ranges if start < end)
+        self.stdout.write(f'Replaying {remaining} messages from {len(ends)} partitions (effects: {effects})')
+
+        totals = {'events': 0, 'undecodable': 0, 'stock': 0, 'skipped': 0, 'notifications': 0}
+        started = last_report = time.monotonic()
+        while ends:
+            messages = consumer.consume(num_messages=options['batch_size'], timeout=options['timeout'])
+            if not messages:
+                raise CommandError(
+                    f'Timed out waiting for messages; {len(ends)} partitions unfinished. '
+                    f'Run again with --name {name} to resume'
+                )
+
+            offsets, counts, events = {}, {}, []
+            for msg in messages:
+                if msg.error():
+                    self.stderr.write(f'Consumer error: {msg.error()}')
+                    continue
+                partition = msg.partition()
+                if partition not in ends or msg.offset() >= ends[partition]:
+                    continue
+                position = (msg.topic(), partition)
+                offsets[position] = msg.offset() + 1
+                counts[position] = counts.get(position, 0) + 1
+                data = decode_message(msg)
+                if isinstance(data, dict):
+                    events.append(data)
+                else:
+                    totals['undecodable'] += 1
+            if not offsets:
+                continue
+
+            if effects == EFFECTS_NONE:
+                stats = {}
+            else:
+                with transaction.atomic():
+                    stats = apply_replay_batch(events, effects, ignore_ledger=options['ignore_ledger'])
+                    save_progress(name, offsets, counts)
+            totals['events'] += len(events)
+            for key, value in stats.items():
+                totals[key] += value
+
+            for (_, partition), offset in offsets.items():
+                if offset >= ends[partition]:
+                    ends.pop(partition)
+                    consumer.pause([TopicPartition(topic, partition)])
+            remaining -= sum(counts.values())
+
+            now = time.monotonic()
+            if now - last_report >= REPORT_INTERVAL or not ends:
+                last_report = now
+                self._report(totals, now - started, remaining)
+
+        self.stdout.write(self.style.SUCCESS(f'Replay {name} finished'))
+
+    def _report(self, totals, elapsed, remaining):
+        rate = totals['events'] / elapsed if elapsed > 0 else 0
+        self.stdout.write(
+            f"{totals['events']} events in {elapsed:.1f}s ({rate:,.0f} events/s), "
+            f"stock applied {totals['stock']}, already processed {totals['skipped']}, "
+            f"notifications {totals['notifications']}, undecodable {totals['undecodable']}, "
+            f"{max(0, remaining)} messages left"
+        )
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0006_outbox_event"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProcessedEvent",
+            fields=[
+                (
+                    "event_id",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                ("event_type", models.CharField(max_length=50)),
+                (
+                    "processed_at",
+                    models.DateTimeField(auto_now_add=True, db_index=True),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0007_processed_event"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReplayCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("topic", models.CharField(max_length=255)),
+                ("partition", models.PositiveIntegerField()),
+                ("offset", models.BigIntegerField(help_text="Offset kế tiếp cần đọc")),
+                (
+                    "end_offset",
+                    models.BigIntegerField(help_text="Replay dừng trước offset này"),
+                ),
+                ("events", models.PositiveBigIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["name", "topic", "partition"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("name", "topic", "partition"),
+                        name="replay_checkpoint_unique",
+                    )
+                ],
+            },
+        ),
+    ]
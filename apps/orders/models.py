@@ -4,6 +4,7 @@ Models for managing orders and order items in the e-commerce system.
 from itertools import product
 
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 from apps.products.models import Product
@@ -40,6 +41,12 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Phục vụ phân trang keyset theo (created_at, id): admin xem toàn bộ,
+            # khách hàng chỉ xem đơn của mình.
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_id_idx'),
+        ]
 
     def update_total_price(self) -> None:
         """
@@ -73,3 +80,75 @@ class OrderItem(models.Model):
 
     def __str__(self) -> str:
         return f"{self.product} x{self.quantity}"
+
+
+class OutboxEvent(models.Model):
+    """
+    Sự kiện chờ gửi lên Kafka (transactional outbox).
+    Được ghi trong cùng transaction với thay đổi đơn hàng và được gửi đi bởi
+    `manage.py relay_outbox`, nên sự kiện không bị mất và không bị gửi cho
+    transaction đã rollback.
+    """
+    topic = models.CharField(max_length=255)
+    key = models.CharField(max_length=255, null=True, blank=True)
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # Relay chỉ quét các sự kiện chưa gửi theo thứ tự ghi
+            models.Index(
+                fields=['id'], name='outbox_unsent_idx', condition=models.Q(sent_at__isnull=True)
+            ),
+            models.Index(fields=['created_at'], name='outbox_created_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.event_type} #{self.pk} -> {self.topic}"
+
+
+class ProcessedEvent(models.Model):
+    """
+    Sổ ghi các sự kiện consumer đã xử lý, để bỏ qua sự kiện bị giao lại
+    (at-least-once). Được ghi trong cùng transaction với tác động của sự kiện.
+    """
+    event_id = models.CharField(max_length=100, primary_key=True)
+    event_type = models.CharField(max_length=50)
+    processed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self) -> str:
+        return f"{self.event_type} {self.event_id}"
+
+
+class ReplayCheckpoint(models.Model):
+    """
+    Vị trí replay của `manage.py replay_order_events --name`, mỗi partition một
+    dòng. Được cập nhật trong cùng transaction với tác động của mỗi lô nên lượt
+    replay bị dừng có thể chạy tiếp từ đúng chỗ đã dừng.
+    """
+    name = models.CharField(max_length=100)
+    topic = models.CharField(max_length=255)
+    partition = models.PositiveIntegerField()
+    offset = models.BigIntegerField(help_text="Offset kế tiếp cần đọc")
+    end_offset = models.BigIntegerField(help_text="Replay dừng trước offset này")
+    events = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name', 'topic', 'partition']
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'topic', 'partition'], name='replay_checkpoint_unique'),
+        ]
+
+    @property
+    def done(self) -> bool:
+        return self.offset >= self.end_offset
+
+    def __str__(self) -> str:
+        return f"{self.name} {self.topic}[{self.partition}] {self.offset}/{self.end_offset}"
@@ -8,4 +8,4 @@ class IsOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user.is_staff:
             return True
-        return obj.user == request.user
+        return obj.user_id == request.user.pk
@@ -4,12 +4,14 @@ from rest_framework import serializers
 
 from apps.orders.models import Order, OrderItem, OrderStatus
 from apps.products.models import Product
+from apps.products.stock import aggregate_deltas, bulk_adjust_stock
+from config.serializers import SparseFieldsetsMixin
 
 
 class OrderItemCreateSerializer(serializers.ModelSerializer):
-    product_id = serializers.PrimaryKeyRelatedField(
-        queryset=Product.objects.all(), source='product'
-    )
+    # Chỉ validate kiểu; sản phẩm được lấy và khóa một lần cho cả đơn trong OrderCreateSerializer
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, default=1)
 
     class Meta:
         model = OrderItem
@@ -31,7 +33,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
             'unit_price',
         )
 
-class OrderCreateSerializer(serializers.ModelSerializer):
+class OrderCreateSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     items = OrderItemCreateSerializer(many=True, write_only=True)  # dùng để tạo
     order_items = OrderItemSerializer(many=True, read_only=True) # dùng để hiển thị sau khi tạo
 
@@ -45,36 +47,67 @@ class OrderCreateSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         """
-        Tạo đơn hàng kèm các OrderItem liên kết.
+        Tạo đơn hàng kèm các OrderItem liên kết và giữ tồn kho ngay trong request:
+        - lấy và khóa (SELECT ... FOR UPDATE) toàn bộ sản phẩm bằng một truy vấn,
+          theo thứ tự khóa chính để tránh deadlock giữa các đơn đồng thời;
+        - trừ kho cho tất cả sản phẩm bằng một câu UPDATE;
+        - tạo toàn bộ OrderItem bằng bulk_create.
         """
         items_data = validated_data.pop('items')
 
         if not items_data:
             raise serializers.ValidationError({'items': 'Đơn hàng phải có ít nhất một sản phẩm.'})
 
+        quantities = aggregate_deltas(
+            (item['product_id'], item['quantity']) for item in items_data
+        )
+
         with transaction.atomic():
-            order = Order.objects.create(user=validated_data['user'], total_price=0)
+            products = {
+                product.pk: product
+                for product in Product.objects.select_for_update()
+                .filter(pk__in=quantities)
+                .order_by('pk')
+                .only('id', 'price', 'stock_quantity')
+            }
+
+            missing = sorted(set(quantities) - set(products))
+            if missing:
+                raise serializers.ValidationError(
+                    {'items': f"Sản phẩm không tồn tại: {', '.join(map(str, missing))}."}
+                )
 
-            final_total_price = Decimal('0.00')
+            insufficient = [
+                f"#{product_id} (còn {products[product_id].stock_quantity})"
+                for product_id, quantity in quantities.items()
+                if products[product_id].stock_quantity < quantity
+            ]
+            if insufficient:
+                raise serializers.ValidationError(
+                    {'items': f"Không đủ hàng tồn kho cho sản phẩm {', '.join(insufficient)}."}
+                )
 
+            # Các dòng sản phẩm đã được khóa theo thứ tự id ở trên
+            result = bulk_adjust_stock(
+                ((product_id, -quantity) for product_id, quantity in quantities.items()), lock_rows=False
+            )
+            if result['rejected']:
+                # Không xảy ra khi các dòng đã bị khóa, giữ lại để an toàn
+                raise serializers.ValidationError({'items': 'Không đủ hàng tồn kho.'})
+
+            order_items = []
+            final_total_price = Decimal('0.00')
             for item_data in items_data:
-                product = item_data['product']
+                product = products[item_data['product_id']]
                 quantity = item_data['quantity']
-
-                # Tạo OrderItem
                 unit_price = product.price * quantity
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=quantity,
-                    unit_price=unit_price
-                )
-
+                order_items.append(OrderItem(product=product, quantity=quantity, unit_price=unit_price))
                 final_total_price += unit_price
 
-            # Cập nhật lại tổng giá đơn hàng
-            order.total_price = final_total_price
-            order.save(update_fields=["total_price"])
+            order = Order.objects.create(user=validated_data['user'], total_price=final_total_price)
+            for order_item in order_items:
+                order_item.order = order
+            OrderItem.objects.bulk_create(order_items)
 
         return order
 
@@ -1,3 +1,1274 @@
-from django.test import TestCase
+import io
+import json
+import threading
+import time
+import uuid
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.orders.models import Order, OrderItem, OutboxEvent, ProcessedEvent
+from apps.products.models import Category, Product
+from apps.users.models import User
+from events.consumers.processing import handle_batch, handle_event, process_events
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class QueryBudgetMixin:
+    """
+    Harness kiểm tra ngân sách số truy vấn cho từng endpoint.
+    Số truy vấn phải không đổi theo kích thước trang để bắt được N+1.
+    """
+    QUERY_BUDGETS = {}
+
+    def assertWithinQueryBudget(self, endpoint, request, status_code=200):
+        budget = self.QUERY_BUDGETS[endpoint]
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertEqual(response.status_code, status_code, response.content)
+        executed = [query['sql'] for query in queries.captured_queries]
+        self.assertLessEqual(
+            len(executed), budget,
+            f"{endpoint} ran {len(executed)} queries (budget {budget}):\n" + "\n".join(executed)
+        )
+        return len(executed)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderQueryBudgetTests(QueryBudgetMixin, TestCase):
+    QUERY_BUDGETS = {
+        'orders-list': 3,          # COUNT + orders + order_items/products
+        'orders-list-cursor': 2,   # orders + order_items/products
+        'orders-retrieve': 2,      # order + order_items/products
+        # view savepoint + serializer savepoint + lock products + stock savepoint/UPDATE/release
+        # + order + items + release + order re-fetch + order_items/products + outbox INSERT + release
+        'orders-create': 13,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(category_name='Books')
+        products = [
+            Product.objects.create(
+                product_name=f'Product {index}', description='...', price=10,
+                category=category, stock_quantity=100, image='sample.jpg',
+            )
+            for index in range(5)
+        ]
+        cls.light_user = User.objects.create_user('light', 'light@example.com', 'password')
+        cls.heavy_user = User.objects.create_user('heavy', 'heavy@example.com', 'password')
+        cls.create_orders(cls.light_user, products[:1], count=1)
+        cls.create_orders(cls.heavy_user, products, count=10)
+
+    @staticmethod
+    def create_orders(user, products, count):
+        for _ in range(count):
+            order = Order.objects.create(user=user, total_price=10 * len(products))
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=1, unit_price=10)
+                for product in products
+            ])
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        light = self.assertWithinQueryBudget(
+            'orders-list', lambda: self.client_for(self.light_user).get('/api/v1/orders/')
+        )
+        heavy = self.assertWithinQueryBudget(
+            'orders-list', lambda: self.client_for(self.heavy_user).get('/api/v1/orders/')
+        )
+        self.assertEqual(light, heavy)
+
+    def test_cursor_list_within_budget(self):
+        self.assertWithinQueryBudget(
+            'orders-list-cursor', lambda: self.client_for(self.heavy_user).get('/api/v1/orders/?cursor=')
+        )
+
+    def test_retrieve_within_budget(self):
+        order = self.heavy_user.orders.first()
+        self.assertWithinQueryBudget(
+            'orders-retrieve', lambda: self.client_for(self.heavy_user).get(f'/api/v1/orders/{order.pk}/')
+        )
+
+    def test_list_payload_includes_items(self):
+        response = self.client_for(self.heavy_user).get('/api/v1/orders/')
+        orders = response.json()['data']['data']
+        self.assertEqual(len(orders), 10)
+        self.assertEqual(len(orders[0]['order_items']), 5)
+        self.assertEqual(orders[0]['order_items'][0]['product_name'].split()[0], 'Product')
+
+    def test_create_large_cart_within_budget(self):
+        category = Category.objects.create(category_name='Bulk')
+        products = Product.objects.bulk_create([
+            Product(
+                product_name=f'Bulk {index}', description='...', price=2,
+                category=category, stock_quantity=10, image='sample.jpg',
+            )
+            for index in range(200)
+        ])
+        items = [{'product_id': product.pk, 'quantity': 3} for product in products]
+
+        self.assertWithinQueryBudget(
+            'orders-create',
+            lambda: self.client_for(self.light_user).post('/api/v1/orders/', {'items': items}, format='json'),
+            status_code=201,
+        )
+
+        self.assertEqual(
+            set(Product.objects.filter(category=category).values_list('stock_quantity', flat=True)), {7}
+        )
+        order = self.light_user.orders.latest('created_at')
+        self.assertEqual(order.order_items.count(), 200)
+        self.assertEqual(order.total_price, 1200)
+
+    def test_create_rejects_insufficient_stock_without_side_effects(self):
+        product = Product.objects.filter(product_name='Product 0').get()
+        orders_before = Order.objects.count()
+
+        response = self.client_for(self.light_user).post(
+            '/api/v1/orders/',
+            {'items': [{'product_id': product.pk, 'quantity': 60}, {'product_id': product.pk, 'quantity': 60}]},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(OutboxEvent.objects.exists())
+        product.refresh_from_db()
+        self.assertEqual(product.stock_quantity, 100)
+        self.assertEqual(Order.objects.count(), orders_before)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderIdempotencyTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(category_name='Books')
+        self.product = Product.objects.create(
+            product_name='Product', description='...', price=10,
+            category=category, stock_quantity=10, image='sample.jpg',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('buyer', 'buyer@example.com', 'password'))
+
+    def post_order(self, quantity, key):
+        return self.client.post(
+            '/api/v1/orders/',
+            {'items': [{'product_id': self.product.pk, 'quantity': quantity}]},
+            format='json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_stored_response(self):
+        first = self.post_order(1, 'retry-1')
+        second = self.post_order(1, 'retry-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+
+    def test_reusing_key_with_different_body_is_rejected(self):
+        self.post_order(1, 'retry-2')
+        response = self.post_order(2, 'retry-2')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class FakeProducer:
+    """
+    Producer giả: produce ghi lại message, flush gọi callback giao nhận.
+    Sự kiện có key trong `fail_keys` hoặc loại trong `fail_types` giao nhận lỗi;
+    loại trong `reject_types` làm produce() ném BufferError.
+    """
+
+    def __init__(self, fail_keys=(), fail_types=(), reject_types=()):
+        self.fail_keys = set(fail_keys)
+        self.fail_types = set(fail_types)
+        self.reject_types = set(reject_types)
+        self.messages = []
+        self.pending = []
+
+    def produce(self, topic, event, key=None, on_delivery=None):
+        if event.get('event_type') in self.reject_types:
+            raise BufferError('queue full')
+        self.messages.append((topic, key, event))
+        failed = key in self.fail_keys or event.get('event_type') in self.fail_types
+        self.pending.append((failed, on_delivery))
+
+    def flush(self, timeout=None):
+        for failed, on_delivery in self.pending:
+            on_delivery('broker unavailable' if failed else None, None)
+        self.pending = []
+        return 0
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class OrderOutboxTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(category_name='Books')
+        self.product = Product.objects.create(
+            product_name='Product', description='...', price=10,
+            category=category, stock_quantity=10, image='sample.jpg',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('buyer', 'buyer@example.com', 'password'))
+
+    def create_order(self):
+        response = self.client.post(
+            '/api/v1/orders/', {'items': [{'product_id': self.product.pk, 'quantity': 1}]}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()['data']['data']['id']
+
+    def relay(self, producer):
+        from events.outbox import relay_pending_events
+        with mock.patch('events.producers.order_producer.get_producer', return_value=producer):
+            return relay_pending_events()
+
+    def test_order_writes_are_recorded_in_outbox(self):
+        order_id = self.create_order()
+        self.client.post(f'/api/v1/orders/{order_id}/cancel/')
+
+        events = list(OutboxEvent.objects.values_list('event_type', 'key', 'sent_at'))
+        self.assertEqual(events, [('ORDER_CREATED', str(order_id), None), ('ORDER_CANCELED', str(order_id), None)])
+
+    def test_relay_marks_delivered_events_and_retries_failures(self):
+        first = self.create_order()
+        second = self.create_order()
+
+        producer = FakeProducer(fail_keys={str(second)})
+        self.assertEqual(self.relay(producer), (1, 1))
+        self.assertEqual([key for _, key, _ in producer.messages], [str(first), str(second)])
+        failed = OutboxEvent.objects.get(key=str(second))
+        self.assertIsNone(failed.sent_at)
+        self.assertEqual(failed.attempts, 1)
+
+        producer = FakeProducer()
+        self.assertEqual(self.relay(producer), (1, 0))
+        self.assertEqual([key for _, key, _ in producer.messages], [str(second)])
+        self.assertFalse(OutboxEvent.objects.filter(sent_at__isnull=True).exists())
+
+    def test_events_after_a_rejected_event_with_the_same_key_are_held_back(self):
+        first = self.create_order()
+        self.client.post(f'/api/v1/orders/{first}/cancel/')
+        second = self.create_order()
+
+        producer = FakeProducer(reject_types={'ORDER_CREATED'})
+        with self.assertLogs('events.outbox', 'WARNING'):
+            self.assertEqual(self.relay(producer), (0, 3))
+        # ORDER_CANCELED không được gửi trước ORDER_CREATED của cùng đơn
+        self.assertEqual(producer.messages, [])
+        canceled = OutboxEvent.objects.get(event_type='ORDER_CANCELED')
+        self.assertEqual((canceled.sent_at, canceled.attempts), (None, 0))
+        self.assertEqual(OutboxEvent.objects.get(key=str(second)).attempts, 1)
+
+        producer = FakeProducer()
+        self.assertEqual(self.relay(producer), (3, 0))
+        self.assertEqual(
+            [(key, event['event_type']) for _, key, event in producer.messages],
+            [(str(first), 'ORDER_CREATED'), (str(first), 'ORDER_CANCELED'), (str(second), 'ORDER_CREATED')],
+        )
+
+    def test_events_after_an_undelivered_event_with_the_same_key_are_not_marked_sent(self):
+        order_id = self.create_order()
+        self.client.post(f'/api/v1/orders/{order_id}/cancel/')
+
+        with self.assertLogs('events.outbox', 'WARNING'):
+            self.assertEqual(self.relay(FakeProducer(fail_types={'ORDER_CREATED'})), (0, 2))
+        self.assertFalse(OutboxEvent.objects.filter(sent_at__isnull=False).exists())
+        self.assertEqual(OutboxEvent.objects.get(event_type='ORDER_CANCELED').attempts, 0)
+
+    def test_relay_skips_while_another_relay_holds_the_lock(self):
+        from events.outbox import RELAY_LOCK_ID
+        self.create_order()
+        other = connection.copy()
+        self.addCleanup(other.close)
+        with other.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s)', [RELAY_LOCK_ID])
+
+        producer = FakeProducer()
+        self.assertEqual(self.relay(producer), (0, 0))
+        self.assertEqual(producer.messages, [])
+
+        with other.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [RELAY_LOCK_ID])
+        self.assertEqual(self.relay(producer), (1, 0))
+
+
+class RowLockProbeProducer(FakeProducer):
+    """
+    Trong lúc flush, thử khóa các dòng outbox từ một kết nối khác.
+    """
+
+    def flush(self, timeout=None):
+        other = connection.copy()
+        try:
+            with other.cursor() as cursor:
+                cursor.execute(f'SELECT id FROM {OutboxEvent._meta.db_table} FOR UPDATE NOWAIT')
+                self.locked_elsewhere = len(cursor.fetchall())
+        finally:
+            other.close()
+        return super().flush(timeout)
+
+
+class OutboxRelayLockTests(TransactionTestCase):
+    def test_rows_are_not_locked_while_waiting_for_the_broker(self):
+        from events.outbox import enqueue_event, relay_pending_events
+        enqueue_event('orders', {'event_type': 'ORDER_CREATED'}, key=1)
+        enqueue_event('orders', {'event_type': 'ORDER_CANCELED'}, key=1)
+
+        producer = RowLockProbeProducer()
+        with mock.patch('events.producers.order_producer.get_producer', return_value=producer):
+            self.assertEqual(relay_pending_events(), (2, 0))
+        self.assertEqual(producer.locked_elsewhere, 2)
+        self.assertFalse(OutboxEvent.objects.filter(sent_at__isnull=True).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConsumerStockConcurrencyTests(TransactionTestCase):
+    """
+    Nhiều consumer cùng cập nhật một nhóm sản phẩm không được làm mất cập nhật.
+    """
+    WORKERS = 8
+    EVENTS_PER_WORKER = 25
+
+    def setUp(self):
+        category = Category.objects.create(category_name='Books')
+        self.products = [
+            Product.objects.create(
+                product_name=f'Product {index}', description='...', price=10,
+                category=category, stock_quantity=1000, image='sample.jpg',
+            )
+            for index in range(3)
+        ]
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+
+    def make_event(self, event_type, order_id, quantity):
+        return {
+            'event_type': event_type,
+            'order_id': order_id,
+            'user_id': self.user.pk,
+            'email': self.user.email,
+            # Sản phẩm lặp lại trong cùng sự kiện phải được gộp
+            'items': [
+                {'product_id': product.pk, 'quantity': quantity} for product in self.products
+            ] + [{'product_id': self.products[0].pk, 'quantity': quantity}],
+        }
+
+    def test_parallel_consumers_do_not_lose_stock_updates(self):
+        barrier = threading.Barrier(self.WORKERS)
+        errors = []
+
+        def worker(index):
+            events = [
+                self.make_event('ORDER_CANCELED' if n % 2 else 'ORDER_CREATED', index * 1000 + n, quantity=n % 3 + 1)
+                for n in range(self.EVENTS_PER_WORKER)
+            ]
+            try:
+                barrier.wait()
+                if index % 2:
+                    handle_batch(events)
+                else:
+                    for event in events:
+                        handle_event(event)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        per_worker = sum(
+            (n % 3 + 1) * (1 if n % 2 else -1) for n in range(self.EVENTS_PER_WORKER)
+        )
+        expected = {
+            self.products[0].pk: 1000 + 2 * per_worker * self.WORKERS,
+            self.products[1].pk: 1000 + per_worker * self.WORKERS,
+            self.products[2].pk: 1000 + per_worker * self.WORKERS,
+        }
+        self.assertEqual(
+            dict(Product.objects.filter(pk__in=expected).values_list('pk', 'stock_quantity')), expected
+        )
+
+    def test_event_updates_only_stock_column(self):
+        with CaptureQueriesContext(connection) as queries:
+            handle_event(self.make_event('ORDER_CANCELED', 1, quantity=1))
+
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), len(self.products))
+        for sql in updates:
+            set_clause = sql.split(' SET ', 1)[1].split(' WHERE ', 1)[0]
+            self.assertEqual(set_clause.count('='), 1, sql)
+            self.assertIn('"stock_quantity" = ("products_product"."stock_quantity" + ', set_clause)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProcessedEventTestCase(TestCase):
+    def setUp(self):
+        category = Category.objects.create(category_name='Books')
+        self.product = Product.objects.create(
+            product_name='Product', description='...', price=10,
+            category=category, stock_quantity=10, image='sample.jpg',
+        )
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+
+    def canceled_event(self, event_id):
+        return {
+            'event_id': event_id,
+            'event_type': 'ORDER_CANCELED',
+            'order_id': 1,
+            'user_id': self.user.pk,
+            'email': self.user.email,
+            'items': [{'product_id': self.product.pk, 'quantity': 3}],
+        }
+
+
+class EventLedgerTests(ProcessedEventTestCase):
+    def test_redelivered_events_are_applied_once(self):
+        event_id = str(uuid.uuid4())
+        event = self.canceled_event(event_id)
+
+        # Trùng trong cùng lô, giao lại ở lô sau và ở đường xử lý từng sự kiện
+        handle_batch([event, dict(event)])
+        process_events([dict(event)])
+        with self.captureOnCommitCallbacks(execute=True):
+            handle_event(dict(event))
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 13)
+        self.assertEqual(ProcessedEvent.objects.filter(event_id=event_id).count(), 1)
+
+    def test_published_events_carry_an_event_id(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        client.post('/api/v1/orders/', {'items': [{'product_id': self.product.pk, 'quantity': 1}]}, format='json')
+
+        payload = OutboxEvent.objects.get().payload
+        self.assertEqual(str(uuid.UUID(payload['event_id'])), payload['event_id'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, ORDER_RETRY_DELAYS=[30, 300], EMAIL_DISPATCH_RETRY_BACKOFF=0)
+class ConsumerTestCase(TestCase):
+    def setUp(self):
+        from events.producers.order_producer import OrderEventProducer
+        from events.retry import FailureRouter
+        from events.transport.memory import InMemoryBroker, InMemoryProducer
+
+        self.broker = InMemoryBroker(num_partitions=1)
+        self.producer = OrderEventProducer(client=InMemoryProducer(broker=self.broker))
+        self.router = FailureRouter(self.producer)
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'password')
+
+    def tearDown(self):
+        self.producer.close()
+
+    def message(self, value, topic='order-events', offset=0, headers=None):
+        from events.transport.memory import InMemoryMessage
+        return InMemoryMessage(topic, 0, offset, b'1', value, headers=headers)
+
+    def delivered_event(self):
+        return json.dumps({
+            'event_id': str(uuid.uuid4()), 'event_type': 'ORDER_DELIVERED',
+            'order_id': 1, 'user_id': self.user.pk, 'email': self.user.email,
+        }).encode()
+
+    def routed(self, topic):
+        from events.retry import message_headers
+        return [(message_headers(msg), msg.value()) for msg in self.broker.messages(topic)]
+
+
+class RetryRoutingTests(ConsumerTestCase):
+    def test_failures_go_to_retry_topics_then_dlq(self):
+        from events.consumers.order_consumer import apply_messages
+
+        broken = json.dumps({'event_id': 'e1', 'event_type': 'ORDER_CANCELED', 'order_id': 1}).encode()
+        apply_messages([self.message(broken), self.message(b'not json', offset=1)], None, self.router)
+
+        [(headers, value)] = self.routed('order-events.retry.30s')
+        self.assertEqual((headers['x-attempt'], headers['x-stage'], headers['x-original-offset']), ('1', 'apply', '0'))
+        self.assertEqual(value, broken)
+        [(headers, _)] = self.routed('order-events.dlq')
+        self.assertEqual(headers['x-stage'], 'decode')
+
+        retried = self.message(broken, topic='order-events.retry.300s', headers=[('x-attempt', b'2')])
+        apply_messages([retried], None, self.router)
+        self.assertEqual(len(self.routed('order-events.dlq')), 2)
+
+    def test_email_failure_retries_only_the_notification(self):
+        from events.consumers.order_consumer import apply_messages
+
+        value = self.delivered_event()
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('SMTP down')
+        ) as send_messages:
+            apply_messages([self.message(value)], None, self.router)
+        self.assertEqual(send_messages.call_count, 3)
+        [(headers, _)] = self.routed('order-events.retry.30s')
+        self.assertEqual(headers['x-stage'], 'notify')
+        self.assertEqual(self.user.notifications.count(), 1)
+
+        retried = self.message(value, topic='order-events.retry.30s', headers=[('x-stage', b'notify')])
+        apply_messages([retried], None, self.router)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(self.user.notifications.count(), 1)
+
+
+class ConsumerBatchTests(ConsumerTestCase):
+    def setUp(self):
+        super().setUp()
+        category = Category.objects.create(category_name='Books')
+        self.products = Product.objects.bulk_create([
+            Product(product_name=f'Product {index}', description='...', price=10,
+                    category=category, stock_quantity=5, image='sample.jpg')
+            for index in range(2)
+        ])
+
+    def canceled(self, *items):
+        return {
+            'event_id': str(uuid.uuid4()), 'event_type': 'ORDER_CANCELED', 'order_id': 1,
+            'user_id': self.user.pk, 'email': self.user.email,
+            'items': [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in items],
+        }
+
+    def stock(self):
+        return dict(Product.objects.values_list('pk', 'stock_quantity'))
+
+    def test_batch_updates_stock_with_one_statement(self):
+        first, second = (product.pk for product in self.products)
+        events = [self.canceled((first, 1), (second, 2)), self.canceled((first, 3)), self.canceled((second, 1))]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(process_events(events), [])
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "products_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.stock(), {first: 9, second: 8})
+        self.assertEqual(ProcessedEvent.objects.count(), 3)
+
+    def test_rejected_stock_delta_fails_only_its_event(self):
+        from events.retry import STAGE_APPLY
+
+        product = self.products[0].pk
+        valid = self.canceled((product, 2))
+        missing = self.canceled((product, 1), (0, 1))
+        oversold = dict(self.canceled((product, 100)), event_type='ORDER_CREATED', stock_reserved=False)
+
+        with self.assertLogs('events.consumers.processing', 'ERROR'):
+            failures = process_events([valid, missing, oversold])
+
+        self.assertEqual([(f.data['event_id'], f.stage) for f in failures],
+                         [(missing['event_id'], STAGE_APPLY), (oversold['event_id'], STAGE_APPLY)])
+        self.assertIn('not_found', str(failures[0].error))
+        self.assertEqual(self.stock()[product], 7)
+        self.assertEqual(list(ProcessedEvent.objects.values_list('event_id', flat=True)), [valid['event_id']])
+
+    def run_consumer(self, process, concurrency=1):
+        from events.consumers.order_consumer import build_consumer_config, run_consumer
+        from events.transport.memory import InMemoryConsumer
+
+        self.producer.produce('order-events', self.canceled((self.products[0].pk, 1)))
+        self.producer.flush()
+        consumer = InMemoryConsumer(build_consumer_config(**{'group.id': 'test'}), broker=self.broker)
+        stop_event = threading.Event()
+        seen = []
+
+        def wrapped(events):
+            seen.append(self.broker.committed('test', 'order-events', 0))
+            stop_event.set()
+            return process(events)
+
+        with mock.patch('events.consumers.order_consumer.process_events', wrapped):
+            run_consumer(batch_size=10, timeout=0.1, concurrency=concurrency, metrics_port=0,
+                         consumer=consumer, producer=self.producer, stop_event=stop_event)
+        return seen
+
+    def test_offsets_are_committed_after_the_batch_is_applied(self):
+        from events.transport.memory import OFFSET_INVALID
+
+        self.assertEqual(self.run_consumer(process_events), [OFFSET_INVALID])
+        self.assertEqual(self.broker.committed('test', 'order-events', 0), 1)
+        self.assertEqual(self.stock()[self.products[0].pk], 6)
+
+    def test_offsets_are_not_committed_when_the_batch_fails(self):
+        from events.transport.memory import OFFSET_INVALID
+
+        def fail(events):
+            raise RuntimeError('database unavailable')
+
+        with self.assertRaises(RuntimeError):
+            self.run_consumer(fail)
+        self.assertEqual(self.broker.committed('test', 'order-events', 0), OFFSET_INVALID)
+
+    @override_settings(ORDER_RETRY_ROUTING_BACKOFF=0)
+    def test_routing_failure_rereads_the_batch_instead_of_committing(self):
+        from events.consumers.order_consumer import build_consumer_config, run_consumer
+        from events.retry import RoutingError
+        from events.transport.memory import OFFSET_INVALID, InMemoryConsumer
+
+        self.producer.produce('order-events', self.canceled((self.products[0].pk, 1)))
+        self.producer.flush()
+        consumer = InMemoryConsumer(build_consumer_config(**{'group.id': 'test'}), broker=self.broker)
+        stop_event = threading.Event()
+        committed = []
+
+        def flush():
+            committed.append(self.broker.committed('test', 'order-events', 0))
+            if len(committed) == 1:
+                raise RoutingError('broker unavailable')
+            stop_event.set()
+
+        with mock.patch('events.retry.FailureRouter.flush', side_effect=flush), \
+                self.assertLogs('events.consumers.order_consumer', 'ERROR'):
+            run_consumer(batch_size=10, timeout=0.1, concurrency=1, metrics_port=0,
+                         consumer=consumer, producer=self.producer, stop_event=stop_event)
+
+        # Lô được đọc lại từ đầu; tồn kho chỉ được cộng một lần nhờ sổ ProcessedEvent
+        self.assertEqual(committed, [OFFSET_INVALID, OFFSET_INVALID])
+        self.assertEqual(self.broker.committed('test', 'order-events', 0), 1)
+        self.assertEqual(self.stock()[self.products[0].pk], 6)
+
+    def test_stop_drains_the_in_flight_batch_before_committing(self):
+        from events.transport.memory import OFFSET_INVALID
+
+        finished = []
+
+        def slow(events):
+            # Chạy trên lane của KeyedExecutor, sau khi đã có yêu cầu dừng
+            time.sleep(0.2)
+            finished.append(self.broker.committed('test', 'order-events', 0))
+            return []
+
+        self.run_consumer(slow, concurrency=2)
+        self.assertEqual(finished, [OFFSET_INVALID])
+        self.assertEqual(self.broker.committed('test', 'order-events', 0), 1)
+
+
+class KeyedExecutorTests(TestCase):
+    def setUp(self):
+        from events.consumers.workers import KeyedExecutor
+        self.executor = KeyedExecutor(4)
+        self.addCleanup(self.executor.shutdown)
+
+    def keys_on_different_lanes(self):
+        lanes = {}
+        for key in range(100):
+            lanes.setdefault(self.executor.lane_for(key), key)
+        return list(lanes.values())
+
+    def test_same_key_runs_in_order_on_one_lane(self):
+        seen = []
+
+        def record(items):
+            for item in items:
+                time.sleep(0.001)
+                seen.append((threading.current_thread().name, item))
+            return len(items)
+
+        items = [(key, sequence) for sequence in range(5) for key in range(8)]
+        self.assertEqual(sum(self.executor.run_grouped(record, items, key=lambda item: item[0])), 40)
+
+        for key in range(8):
+            runs = [(thread, sequence) for thread, (item_key, sequence) in seen if item_key == key]
+            self.assertEqual([sequence for _, sequence in runs], list(range(5)))
+            self.assertEqual(len({thread for thread, _ in runs}), 1)
+
+    def test_different_keys_run_in_parallel(self):
+        keys = self.keys_on_different_lanes()[:2]
+        # Chỉ qua được barrier khi hai nhóm chạy cùng lúc trên hai thread
+        barrier = threading.Barrier(2, timeout=5)
+        results = self.executor.run_grouped(lambda items: barrier.wait() is not None, keys, key=lambda key: key)
+        self.assertEqual(results, [True, True])
+
+    def test_errors_are_raised_after_every_group_finished(self):
+        keys = self.keys_on_different_lanes()[:2]
+        finished = []
+
+        def work(items):
+            if items == [keys[0]]:
+                raise ValueError('broken event')
+            time.sleep(0.05)
+            finished.append(items)
+
+        with self.assertRaises(ValueError):
+            self.executor.run_grouped(work, keys, key=lambda key: key)
+        self.assertEqual(finished, [[keys[1]]])
+
+    def test_shutdown_waits_for_submitted_work(self):
+        done = []
+        self.executor.submit(1, lambda: (time.sleep(0.1), done.append(1)))
+        self.executor.shutdown(wait=True)
+        self.assertEqual(done, [1])
+
+
+class FakeWorkerProcess:
+    """
+    Tiến trình worker giả cho run_worker_pool; `crash` làm tiến trình thoát ngay khi khởi động.
+    """
+
+    def __init__(self, name, crash=False):
+        self.name = name
+        self.crash = crash
+        self.alive = False
+        self.exitcode = None
+        self.terminated = False
+
+    def start(self):
+        self.alive = not self.crash
+        self.exitcode = 1 if self.crash else None
+
+    def is_alive(self):
+        return self.alive
+
+    def terminate(self):
+        self.terminated = True
+        self.alive = False
+        self.exitcode = 0
+
+    def join(self, timeout=None):
+        pass
+
+
+class WorkerPoolTests(TestCase):
+    def test_crashed_workers_are_restarted_and_all_are_stopped_on_signal(self):
+        import signal
+
+        from events.consumers.workers import run_worker_pool
+
+        processes = []
+
+        def process(target, args, name):
+            processes.append(FakeWorkerProcess(name, crash=not processes))
+            return processes[-1]
+
+        def tick(seconds):
+            # Một vòng giám sát đã chạy: giả lập SIGTERM gửi tới pool
+            signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+
+        context = mock.Mock(Process=mock.Mock(side_effect=process))
+        previous = signal.getsignal(signal.SIGTERM)
+        with mock.patch('multiprocessing.get_context', return_value=context), \
+                mock.patch('events.consumers.workers.time.sleep', side_effect=tick), \
+                self.assertLogs('events.consumers.workers', 'ERROR') as logs:
+            run_worker_pool(2, batch_size=10)
+
+        self.assertEqual([p.name for p in processes], ['order-consumer-0', 'order-consumer-1', 'order-consumer-0'])
+        self.assertIn('Consumer worker 0 exited with code 1, restarting', logs.output[0])
+        self.assertEqual([p.terminated for p in processes], [False, True, True])
+        self.assertEqual(context.Process.call_args.kwargs['args'], (0, {'batch_size': 10}))
+        self.assertIs(signal.getsignal(signal.SIGTERM), previous)
+
+
+class ConsumerMetricsTests(ConsumerTestCase):
+    def test_events_are_counted_by_outcome(self):
+        from events.consumers.order_consumer import (
+            BATCH_SIZE, EVENT_END_TO_END, EVENT_PROCESSING, EVENTS_TOTAL, apply_messages,
+        )
+
+        before = {
+            outcome: EVENTS_TOTAL.value(event_type='ORDER_CANCELED', outcome=outcome) for outcome in ('ok', 'retry')
+        }
+        dlq_before = EVENTS_TOTAL.value(event_type='unknown', outcome='dlq')
+        latency_before = EVENT_END_TO_END.count(event_type='ORDER_DELIVERED')
+        processing_before = {
+            event_type: EVENT_PROCESSING.count(event_type=event_type, stage='apply')
+            for event_type in ('ORDER_CANCELED', 'ORDER_DELIVERED')
+        }
+        batches_before = BATCH_SIZE.count()
+
+        broken = json.dumps({'event_id': 'e1', 'event_type': 'ORDER_CANCELED', 'order_id': 1}).encode()
+        apply_messages(
+            [self.message(broken), self.message(b'not json', offset=1), self.message(self.delivered_event(), offset=2)],
+            None, self.router,
+        )
+
+        self.assertEqual(EVENTS_TOTAL.value(event_type='ORDER_CANCELED', outcome='retry'), before['retry'] + 1)
+        self.assertEqual(EVENTS_TOTAL.value(event_type='ORDER_CANCELED', outcome='ok'), before['ok'])
+        self.assertEqual(EVENTS_TOTAL.value(event_type='unknown', outcome='dlq'), dlq_before + 1)
+        self.assertEqual(EVENT_END_TO_END.count(event_type='ORDER_DELIVERED'), latency_before + 1)
+        # Thời gian xử lý được đo cả cho sự kiện lỗi, theo từng event_type
+        for event_type, count in processing_before.items():
+            self.assertEqual(EVENT_PROCESSING.count(event_type=event_type, stage='apply'), count + 1)
+        self.assertEqual(BATCH_SIZE.count(), batches_before + 1)
+
+    def test_latency_of_retried_events_is_measured_from_the_original_message(self):
+        from events.consumers.order_consumer import EVENT_END_TO_END, apply_messages
+        from events.retry import HEADER_ORIGINAL_TIMESTAMP, message_headers
+        from events.transport.memory import InMemoryMessage
+
+        sent_at = int(time.time() * 1000) - 60_000
+        broken = json.dumps({'event_id': 'e1', 'event_type': 'ORDER_CANCELED', 'order_id': 1}).encode()
+        apply_messages([InMemoryMessage('order-events', 0, 0, b'1', broken, timestamp=sent_at)], None, self.router)
+        [retried] = self.broker.messages('order-events.retry.30s')
+        self.assertEqual(message_headers(retried)[HEADER_ORIGINAL_TIMESTAMP], str(sent_at))
+
+        with mock.patch.object(EVENT_END_TO_END, 'observe') as observe:
+            apply_messages([retried], None, self.router)
+        self.assertGreaterEqual(observe.call_args.args[0], 60)
+        # Lần chuyển tiếp theo giữ timestamp gốc thay vì lấy của message retry
+        [again] = self.broker.messages('order-events.retry.300s')
+        self.assertEqual(message_headers(again)[HEADER_ORIGINAL_TIMESTAMP], str(sent_at))
+
+    def test_lag_is_served_on_metrics_endpoint(self):
+        from urllib.request import urlopen
+
+        from confluent_kafka import TopicPartition
+
+        from events.consumers.order_consumer import update_lag
+        from events.metrics import start_metrics_server
+
+        assigned = [TopicPartition('order-events', 0), TopicPartition('order-events', 1)]
+        consumer = mock.Mock()
+        consumer.assignment.return_value = assigned
+        consumer.position.return_value = [TopicPartition('order-events', 0, 40), TopicPartition('order-events', 1, -1001)]
+        consumer.committed.return_value = [TopicPartition('order-events', 1, 7)]
+        consumer.get_watermark_offsets.side_effect = lambda tp, timeout: (0, 100 if tp.partition == 0 else 10)
+        update_lag(consumer)
+
+        server = start_metrics_server(0, addr='127.0.0.1')
+        try:
+            with urlopen(f'http://127.0.0.1:{server.server_port}/metrics') as response:
+                body = response.read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertIn('order_consumer_lag{topic="order-events",partition="0"} 60', body)
+        self.assertIn('order_consumer_lag{topic="order-events",partition="1"} 3', body)
+        self.assertIn('# TYPE order_consumer_events_total counter', body)
+
+
+class FakeEmailConnection:
+    """
+    Kết nối email giả; `dead` làm lần gửi tiếp theo lỗi như khi server đã đóng kết nối.
+    """
+
+    def __init__(self, dead=False):
+        self.dead = dead
+        self.sent = []
+        self.closed = False
+
+    def open(self):
+        return True
+
+    def close(self):
+        self.closed = True
+
+    def send_messages(self, messages):
+        if self.dead:
+            from smtplib import SMTPServerDisconnected
+            raise SMTPServerDisconnected('Connection unexpectedly closed')
+        self.sent.extend(messages)
+        return len(messages)
+
+
+class EmailDispatcherTests(TestCase):
+    def dispatch(self, *connections):
+        from events.consumers.email_dispatch import EmailDispatcher, build_message
+
+        dispatcher = EmailDispatcher(workers=1)
+        self.addCleanup(dispatcher.close)
+        patcher = mock.patch('events.consumers.email_dispatch.get_connection', side_effect=connections)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return dispatcher, lambda tag: dispatcher.send([(tag, build_message('Subject', 'Body', ['a@example.com']))])
+
+    @override_settings(EMAIL_DISPATCH_IDLE_TIMEOUT=60)
+    def test_connection_is_reused_while_active(self):
+        first = FakeEmailConnection()
+        _, send = self.dispatch(first)
+        self.assertEqual(send(1) + send(2), [])
+        self.assertEqual((len(first.sent), first.closed), (2, False))
+
+    @override_settings(EMAIL_DISPATCH_IDLE_TIMEOUT=0.05)
+    def test_idle_connection_is_reopened_before_sending(self):
+        first, second = FakeEmailConnection(), FakeEmailConnection()
+        _, send = self.dispatch(first, second)
+        send(1)
+        time.sleep(0.1)
+        self.assertEqual(send(2), [])
+        self.assertTrue(first.closed)
+        self.assertEqual((len(first.sent), len(second.sent)), (1, 1))
+
+    @override_settings(EMAIL_DISPATCH_MAX_ATTEMPTS=1)
+    def test_dead_connection_is_replaced_without_using_an_attempt(self):
+        dead, fresh = FakeEmailConnection(dead=True), FakeEmailConnection()
+        _, send = self.dispatch(dead, fresh)
+
+        with mock.patch('events.consumers.email_dispatch.time.sleep') as sleep:
+            self.assertEqual(send(1), [])
+        sleep.assert_not_called()
+        self.assertTrue(dead.closed)
+        self.assertEqual(len(fresh.sent), 1)
+
+    @override_settings(EMAIL_DISPATCH_MAX_ATTEMPTS=1)
+    def test_other_errors_still_fail_the_attempt(self):
+        broken = FakeEmailConnection()
+        broken.send_messages = mock.Mock(side_effect=OSError('mailbox unavailable'))
+        _, send = self.dispatch(broken)
+
+        [(tag, error)] = send(1)
+        self.assertEqual(tag, 1)
+        self.assertIsInstance(error, OSError)
+
+
+class EventSchemaTests(TestCase):
+    def event(self):
+        return {
+            'event_id': str(uuid.uuid4()), 'event_type': 'ORDER_CREATED', 'order_id': 7, 'user_id': -3,
+            'email': 'người.mua@example.com', 'stock_reserved': True, 'note': None, 'ratio': 0.5,
+            'total_price': Decimal('1999.90'), 'big': 2 ** 70,
+            'items': [{'product_id': index, 'quantity': index + 1} for index in range(300)],
+            'mixed': [{'a': 1}, {'b': 2}, 'x'],
+        }
+
+    def test_binary_round_trips_like_json(self):
+        from events.schema import ENCODING_BINARY, FLAG_ZLIB, decode_event, encode_event
+
+        event = self.event()
+        legacy = decode_event(encode_event(event, encoding='json'))
+        for threshold in (0, 64):
+            payload = encode_event(event, encoding=ENCODING_BINARY, compression_threshold=threshold)
+            self.assertEqual(bool(payload[2] & FLAG_ZLIB), bool(threshold))
+            self.assertEqual(decode_event(payload), legacy)
+            self.assertLess(len(payload), len(encode_event(event, encoding='json')) / 3)
+
+    def test_consumer_reads_both_formats_and_rejects_corrupt_payloads(self):
+        from events.consumers.order_consumer import decode_message
+        from events.schema import EventDecodeError, decode_event, encode_event
+        from events.transport.memory import InMemoryMessage
+
+        event = {'event_type': 'ORDER_CANCELED', 'order_id': 1, 'items': []}
+        for encoding in ('json', 'binary'):
+            msg = InMemoryMessage('order-events', 0, 5, b'1', encode_event(event, encoding=encoding))
+            self.assertEqual(decode_message(msg), dict(event, event_id='order-events:0:5'))
+
+        payload = encode_event(event, encoding='binary')
+        for corrupt in (payload[:-1], payload + b'\x00', payload[:1] + b'\x63' + payload[2:]):
+            with self.assertRaises(EventDecodeError):
+                decode_event(corrupt)
+        self.assertIsNone(decode_message(InMemoryMessage('order-events', 0, 6, b'1', payload[:-2])))
+
+    def test_corrupt_counts_and_oversized_bodies_are_rejected(self):
+        import zlib
+
+        from events.schema import FLAG_ZLIB, MAGIC, MAX_DECOMPRESSED_SIZE, SCHEMA_VERSION, EventDecodeError, decode_event
+
+        header = bytes((MAGIC, SCHEMA_VERSION, 0))
+        corrupt = (
+            # Bảng 2.097.152 dòng không có key: trước đây giải mã thành từng ấy dict rỗng
+            header + b'\x0a\x80\x80\x80\x01\x00',
+            header + b'\x0a\xff\xff\xff\xff\xff\xff\xff\xff\x7f\x00',
+            header + b'\x0a\x80\x80\x80\x01\x01\x06\x00\x00',
+            header + b'\x08\xff\xff\xff\xff\x0f\x00',
+            header + b'\x09\xff\xff\xff\xff\x0f\x00\x00',
+            header + b'\x08\x01' * 100_000 + b'\x00',
+            bytes((MAGIC, SCHEMA_VERSION, FLAG_ZLIB)) + zlib.compress(b'\x00' * (MAX_DECOMPRESSED_SIZE + 1)),
+        )
+        for payload in corrupt:
+            with self.assertRaises(EventDecodeError):
+                decode_event(payload)
+
+
+class EventReplayTests(ProcessedEventTestCase):
+    def delivered_event(self, event_id, order_id=1):
+        return {
+            'event_id': event_id, 'event_type': 'ORDER_DELIVERED', 'order_id': order_id,
+            'user_id': self.user.pk, 'email': self.user.email,
+        }
+
+    def test_stock_replay_skips_processed_events_unless_ledger_is_ignored(self):
+        from events.replay import EFFECTS_STOCK, apply_replay_batch
+
+        processed, missed = self.canceled_event('e-processed'), self.canceled_event('e-missed')
+        handle_batch([processed])
+
+        stats = apply_replay_batch([dict(processed), dict(missed)], EFFECTS_STOCK)
+        self.assertEqual((stats['stock'], stats['skipped']), (1, 1))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 16)
+        self.assertTrue(ProcessedEvent.objects.filter(event_id='e-missed').exists())
+
+        apply_replay_batch([dict(missed)], EFFECTS_STOCK, ignore_ledger=True)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 19)
+
+    def test_notification_rebuild_is_idempotent_and_adopts_legacy_rows(self):
+        from apps.notifications.models import Notification
+        from events.consumers.processing import build_notification
+        from events.replay import EFFECTS_NOTIFICATIONS, apply_replay_batch
+
+        legacy = build_notification(self.delivered_event('e1'))
+        legacy.event_id, legacy.is_read = None, True
+        legacy.save()
+        events = [self.delivered_event('e1'), self.delivered_event('e2', order_id=2), self.canceled_event('e3')]
+
+        for _ in range(2):
+            stats = apply_replay_batch([dict(event) for event in events], EFFECTS_NOTIFICATIONS)
+        self.assertEqual(stats['notifications'], 2)
+        self.assertEqual(
+            sorted(Notification.objects.values_list('event_id', 'is_read')), [('e1', True), ('e2', False)]
+        )
+        self.assertFalse(ProcessedEvent.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 10)
+
+    def test_consumer_upserts_notifications_already_rebuilt_by_a_replay(self):
+        from apps.notifications.models import Notification
+        from events.replay import EFFECTS_NOTIFICATIONS, apply_replay_batch
+
+        batched, single = self.delivered_event('e1'), self.delivered_event('e2', order_id=2)
+        apply_replay_batch([dict(batched), dict(single)], EFFECTS_NOTIFICATIONS)
+        Notification.objects.filter(event_id='e1').update(is_read=True)
+
+        with mock.patch('events.consumers.processing.notify_events', return_value=[]):
+            self.assertEqual(process_events([dict(batched)]), [])
+            self.assertEqual(handle_event(dict(single)), [])
+
+        self.assertEqual(
+            sorted(Notification.objects.values_list('event_id', 'is_read')), [('e1', True), ('e2', False)]
+        )
+        self.assertEqual(ProcessedEvent.objects.count(), 2)
+
+    def test_checkpoint_moves_with_each_batch(self):
+        from apps.orders.models import ReplayCheckpoint
+        from events.replay import load_checkpoints, save_progress, start_checkpoints
+
+        start_checkpoints('fix-1', 'order-events', [(0, 5, 20), (1, 0, 0)])
+        save_progress('fix-1', {('order-events', 0): 12}, {('order-events', 0): 7})
+        save_progress('fix-1', {('order-events', 0): 20}, {('order-events', 0): 8})
+
+        first, second = load_checkpoints('fix-1')
+        self.assertEqual((first.offset, first.events, first.done), (20, 15, True))
+        self.assertTrue(second.done)
+        start_checkpoints('fix-1', 'order-events', [(0, 0, 3)])
+        self.assertEqual(ReplayCheckpoint.objects.get(name='fix-1').offset, 0)
+
+
+class InMemoryTransportTests(TestCase):
+    def setUp(self):
+        from events.producers.order_producer import OrderEventProducer
+        from events.transport.memory import InMemoryBroker, InMemoryProducer
+
+        self.broker = InMemoryBroker(num_partitions=4)
+        self.producer = OrderEventProducer(client=InMemoryProducer(broker=self.broker))
+        for order_id in range(1, 41):
+            self.producer.produce('order-events', {'event_type': 'ORDER_CREATED', 'order_id': order_id})
+        self.producer.flush()
+
+    def tearDown(self):
+        self.producer.close()
+
+    def consumer(self, **config):
+        from events.transport.memory import InMemoryConsumer
+        return InMemoryConsumer(dict({'group.id': 'g', 'auto.offset.reset': 'earliest',
+                                      'enable.auto.commit': False}, **config), broker=self.broker)
+
+    def test_group_members_split_partitions_and_resume_from_commits(self):
+        first, second = self.consumer(), self.consumer()
+        assigned = {}
+        first.subscribe(['order-events'], on_assign=lambda c, parts: assigned.update(first=parts))
+        second.subscribe(['order-events'], on_assign=lambda c, parts: assigned.update(second=parts))
+
+        batch = first.consume(num_messages=100, timeout=0)
+        second_batch = second.consume(num_messages=100, timeout=0)
+        self.assertEqual({tp.partition for tp in assigned['first']}, {0, 2})
+        self.assertEqual({tp.partition for tp in assigned['second']}, {1, 3})
+        self.assertEqual(len(batch) + len(second_batch), 40)
+        # Cùng order_id (key) luôn nằm trên cùng partition
+        keys = {msg.key(): msg.partition() for msg in batch + second_batch}
+        self.assertEqual(len(keys), 40)
+
+        first.commit(message=batch[0], asynchronous=False)
+        second.close()
+        first.close()
+
+        restarted = self.consumer()
+        restarted.subscribe(['order-events'])
+        replayed = restarted.consume(num_messages=100, timeout=0)
+        # Chỉ message đầu tiên đã được commit; mọi message còn lại được giao lại
+        self.assertEqual(len(replayed), 39)
+        self.assertNotIn((batch[0].partition(), batch[0].offset()), {(m.partition(), m.offset()) for m in replayed})
+        restarted.close()
+
+    def test_pause_seek_and_watermarks(self):
+        from confluent_kafka import TopicPartition
+
+        consumer = self.consumer()
+        partition = TopicPartition('order-events', 0)
+        low, high = consumer.get_watermark_offsets(partition)
+        consumer.assign([TopicPartition('order-events', 0, 0)])
+        consumer.pause([partition])
+        self.assertEqual(consumer.consume(num_messages=100, timeout=0), [])
+        consumer.resume([partition])
+        consumer.seek(TopicPartition('order-events', 0, high - 2))
+        self.assertEqual([msg.offset() for msg in consumer.consume(num_messages=100, timeout=0)], [high - 2, high - 1])
+        self.assertEqual(consumer.position([partition])[0].offset, high)
+        self.assertEqual(low, 0)
+
+
+class StalledProducerClient:
+    """
+    Client producer giả mà broker không bao giờ xác nhận: hàng đợi chỉ đầy lên.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.queue = []
+        self.polls = 0
+
+    def __len__(self):
+        return len(self.queue)
+
+    def produce(self, topic, key=None, value=None, headers=None, on_delivery=None):
+        if len(self.queue) >= self.capacity:
+            raise BufferError('Local: Queue full')
+        self.queue.append(value)
+
+    def poll(self, timeout=None):
+        self.polls += 1
+        time.sleep(min(timeout or 0, 0.01))
+        return 0
+
+    def flush(self, timeout=None):
+        return len(self.queue)
+
+
+class OrderEventProducerTests(TestCase):
+    def producer(self, client, block_timeout=1.0):
+        from events.producers.order_producer import OrderEventProducer
+        producer = OrderEventProducer(client=client, block_timeout=block_timeout)
+        self.addCleanup(self.stop, producer)
+        return producer
+
+    def stop(self, producer):
+        if producer._poll_thread.is_alive():
+            producer.close(0)
+
+    def test_full_queue_waits_for_the_poll_thread_to_free_space(self):
+        from events.transport.memory import InMemoryBroker, InMemoryProducer
+
+        broker = InMemoryBroker(num_partitions=1)
+        client = InMemoryProducer({'queue.buffering.max.messages': 1, 'linger.ms': 20}, broker=broker)
+        producer = self.producer(client)
+        delivered = []
+
+        for order_id in (1, 2, 3):
+            # Lần 2, 3: hàng đợi đầy, produce() chờ thay vì ném BufferError
+            producer.produce('order-events', {'order_id': order_id},
+                             on_delivery=lambda err, msg: delivered.append(msg.key()))
+
+        deadline = time.monotonic() + 5
+        while len(delivered) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # Không gọi flush(): thread poll nền tự gửi message cuối
+        self.assertEqual(delivered, [b'1', b'2', b'3'])
+        self.assertEqual(len(broker.messages('order-events')), 3)
+
+    def test_full_queue_raises_after_block_timeout(self):
+        client = StalledProducerClient(capacity=1)
+        producer = self.producer(client, block_timeout=0.2)
+        producer.produce('order-events', {'order_id': 1})
+
+        started = time.monotonic()
+        with self.assertLogs('events.producers.order_producer', 'ERROR'):
+            with self.assertRaises(BufferError):
+                producer.produce('order-events', {'order_id': 2})
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(len(producer), 1)
+        client.queue.clear()
+
+    def test_flush_and_close_report_undelivered_messages(self):
+        client = StalledProducerClient(capacity=10)
+        producer = self.producer(client)
+        producer.produce('order-events', {'order_id': 1})
+        producer.produce('order-events', {'order_id': 2})
+
+        self.assertEqual(producer.flush(0), 2)
+        with self.assertLogs('events.producers.order_producer', 'ERROR') as logs:
+            self.assertEqual(producer.close(0), 2)
+        self.assertIn('2 undelivered messages', logs.output[0])
+        self.assertFalse(producer._poll_thread.is_alive())
+        self.assertGreater(client.polls, 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EVENT_TRANSPORT='memory')
+class ReplayCommandTests(ProcessedEventTestCase):
+    def test_replay_rebuilds_notifications_and_resumes_from_checkpoint(self):
+        from django.core.management import call_command
+
+        from apps.notifications.models import Notification
+        from apps.orders.models import ReplayCheckpoint
+        from events.producers.order_producer import OrderEventProducer
+        from events.transport.memory import InMemoryBroker, InMemoryProducer
+
+        broker = InMemoryBroker(num_partitions=2)
+        producer = OrderEventProducer(client=InMemoryProducer(broker=broker))
+        for order_id in range(1, 7):
+            producer.produce('order-events', {
+                'event_id': f'e{order_id}', 'event_type': 'ORDER_DELIVERED', 'order_id': order_id,
+                'user_id': self.user.pk, 'email': self.user.email,
+            })
+        producer.close()
+
+        with mock.patch('events.transport.memory.get_default_broker', return_value=broker):
+            call_command('replay_order_events', name='fix', effects='notifications', batch_size=2,
+                         timeout=0.1, stdout=io.StringIO())
+            self.assertEqual(Notification.objects.count(), 6)
+            self.assertTrue(all(checkpoint.done for checkpoint in ReplayCheckpoint.objects.filter(name='fix')))
+
+            out = io.StringIO()
+            call_command('replay_order_events', name='fix', effects='notifications', timeout=0.1, stdout=out)
+            self.assertIn('Nothing to replay', out.getvalue())
+
+            call_command('replay_order_events', name='fix', effects='notifications', restart=True,
+                         timeout=0.1, stdout=io.StringIO())
+        self.assertEqual(Notification.objects.count(), 6)
+        self.assertEqual(ReplayCheckpoint.objects.get(name='fix', partition=0).events
+                         + ReplayCheckpoint.objects.get(name='fix', partition=1).events, 6)
+
+    def test_stock_replay_stops_at_the_consumer_group_commit(self):
+        from django.conf import settings
+        from django.core.management import call_command
+
+        from apps.notifications.models import Notification
+        from events.producers.order_producer import OrderEventProducer
+        from events.transport.memory import InMemoryBroker, InMemoryProducer
+
+        broker = InMemoryBroker(num_partitions=1)
+        producer = OrderEventProducer(client=InMemoryProducer(broker=broker))
+        events = [
+            {
+                'event_id': f'e{order_id}', 'event_type': 'ORDER_DELIVERED', 'order_id': order_id,
+                'user_id': self.user.pk, 'email': self.user.email,
+            }
+            for order_id in range(1, 4)
+        ]
+        for event in events:
+            producer.produce('order-events', event)
+        producer.close()
+        # Consumer mới xử lý xong sự kiện đầu tiên
+        broker.commit(settings.KAFKA_ORDER_CONSUMER_GROUP, [('order-events', 0, 1)])
+
+        out = io.StringIO()
+        with mock.patch('events.transport.memory.get_default_broker', return_value=broker):
+            call_command('replay_order_events', name='ahead', effects='stock', timeout=0.1, stdout=out)
+        self.assertIn('stopping at offset 1', out.getvalue())
+        self.assertEqual(list(ProcessedEvent.objects.values_list('event_id', flat=True)), ['e1'])
+
+        self.assertEqual(process_events([dict(event) for event in events[1:]]), [])
+        self.assertEqual(sorted(Notification.objects.values_list('event_id', flat=True)), ['e2', 'e3'])
+        self.assertEqual(len(mail.outbox), 2)
@@ -1,24 +1,39 @@
 from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
-from drf_spectacular.utils import extend_schema, OpenApiExample
+from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiParameter
 
-from apps.orders.models import Order, OrderStatus
+from apps.orders.models import Order, OrderItem, OrderStatus
 from apps.orders.permissions import IsOwner
 from apps.orders.serializers import OrderCreateSerializer, OrderUpdateStatusSerializer
+from config.idempotency import IdempotentCreateMixin
+from config.pagination import KeysetPagination
 from config.renderers import CustomResponseRenderer
 from events.handlers.handle_order_canceled import publish_order_canceled_event
 from events.handlers.handle_order_created import publish_order_created_event
 from events.handlers.handle_order_delivered import publish_order_delivered_event
 
 
+def order_items_prefetch():
+    """
+    Prefetch các OrderItem kèm sản phẩm, chỉ lấy các cột OrderItemSerializer dùng.
+    """
+    return Prefetch(
+        'order_items',
+        queryset=OrderItem.objects.select_related('product').only(
+            'id', 'order_id', 'quantity', 'unit_price', 'created_at',
+            'product__id', 'product__product_name', 'product__image',
+        )
+    )
+
+
 @extend_schema(tags=["Orders"])
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderCreateSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = KeysetPagination
     renderer_classes = [CustomResponseRenderer]
 
     def get_permissions(self):
@@ -28,13 +43,32 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        if user.is_staff or getattr(user, 'role', None) == 'admin':
-            return self.queryset.all()
-        return self.queryset.filter(user=user)
+        queryset = self.queryset.all()
+        if not (user.is_staff or getattr(user, 'role', None) == 'admin'):
+            queryset = queryset.filter(user=user)
+        if self.action in ('list', 'retrieve'):
+            # Chỉ đọc các cột ứng với field client yêu cầu (?fields= / ?omit=)
+            queryset = OrderCreateSerializer.sparse_queryset(
+                queryset, self.request, always=('id', 'created_at', 'user')
+            )
+            fields = OrderCreateSerializer.get_sparse_field_names(self.request, ['order_items'])
+            if fields is None or 'order_items' in fields:
+                # Một truy vấn cho toàn bộ item + sản phẩm của cả trang, tránh N+1
+                queryset = queryset.prefetch_related(order_items_prefetch())
+        return queryset
 
     @extend_schema(
         summary="Tạo đơn hàng mới",
-        description="Tạo một đơn hàng mới kèm danh sách sản phẩm. Đồng thời trừ kho.",
+        description=(
+            "Tạo một đơn hàng mới kèm danh sách sản phẩm. Tồn kho được trừ ngay trong request. "
+            "Gửi lại cùng Idempotency-Key sẽ nhận lại response cũ thay vì tạo đơn mới."
+        ),
+        parameters=[
+            OpenApiParameter(
+                name='Idempotency-Key', location=OpenApiParameter.HEADER, required=False, type=str,
+                description="Khóa do client sinh (vd. UUID) để retry an toàn",
+            ),
+        ],
         responses={201: OrderCreateSerializer},
         examples=[
             OpenApiExample(
@@ -52,8 +86,13 @@ class OrderViewSet(viewsets.ModelViewSet):
     def create(self, request, *args, **kwargs):
         serializer = OrderCreateSerializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
-        order = serializer.save()
-        publish_order_created_event(order)
+        with transaction.atomic():
+            order = serializer.save()
+            order = Order.objects.select_related('user').prefetch_related(
+                order_items_prefetch()
+            ).get(pk=order.pk)
+            # Sự kiện được ghi vào outbox cùng transaction, relay gửi lên Kafka sau
+            publish_order_created_event(order)
         return Response({
             "message": "Created order successfully",
             "data": OrderCreateSerializer(order).data
@@ -61,7 +100,14 @@ class OrderViewSet(viewsets.ModelViewSet):
 
     @extend_schema(
         summary="Danh sách đơn hàng",
-        responses={200: OrderCreateSerializer(many=True)}
+        description="Gửi ?cursor= (để trống ở trang đầu) để dùng phân trang theo cursor. "
+                    "Dùng ?fields= / ?omit= (phân tách bằng dấu phẩy) để chọn field trả về.",
+        responses={200: OrderCreateSerializer(many=True)},
+        parameters=[
+            OpenApiParameter(name="cursor", type=str, location=OpenApiParameter.QUERY),
+            OpenApiParameter(name="fields", type=str, location=OpenApiParameter.QUERY),
+            OpenApiParameter(name="omit", type=str, location=OpenApiParameter.QUERY),
+        ]
     )
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
@@ -103,12 +149,13 @@ class OrderViewSet(viewsets.ModelViewSet):
         if not is_admin and status_value not in allowed_user_statuses:
             return Response({'message': "You don't have permission to change the order status"}, status=403)
 
-        if order.status != 'DELIVERED' and status_value == 'delivered':
-            publish_order_delivered_event(order)
-
+        previous_status = order.status
         serializer = OrderUpdateStatusSerializer(order, data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            if previous_status != OrderStatus.DELIVERED and order.status == OrderStatus.DELIVERED:
+                publish_order_delivered_event(order)
 
         return Response({
             'message': 'Update status successfully',
@@ -131,10 +178,9 @@ class OrderViewSet(viewsets.ModelViewSet):
                     'message': "Can't cancel order",
                 }, status=400)
 
-            publish_order_canceled_event(order)
-
             order.status = OrderStatus.CANCELED
             order.save(update_fields=['status'])
+            publish_order_canceled_event(order)
 
             return Response({
                 'message': 'Cancel order successfully.',
@@ -2,5 +2,12 @@ from django.contrib import admin
 from apps.products.models import Product, Category
 
 # Register your models here.
-admin.site.register(Category)
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('category_name', 'product_count')
+    readonly_fields = ('product_count',)
+
+
 admin.site.register(Product)
@@ -0,0 +1,117 @@
+"""
+Cache read-through cho danh mục sản phẩm trên Redis (CACHES['default']).
+
+Mọi key đều gắn với một "catalog version". Khi sản phẩm, danh mục hoặc tồn kho
+thay đổi, chỉ cần tăng version: các key cũ tự hết hạn theo TTL, không phải
+xóa từng key.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_LAST_MODIFIED_KEY = 'catalog:last_modified'
+
+
+def _initial_version() -> int:
+    """
+    Version khởi tạo khi key chưa có. Redis vẫn có thể evict key version (dù
+    timeout=None) khi chạm maxmemory; lấy từ đồng hồ thay vì 1 để version mới
+    luôn lớn hơn các version cũ mà entry của chúng còn trong TTL.
+    """
+    return time.time_ns()
+
+
+def get_catalog_version() -> int:
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        initial = _initial_version()
+        cache.add(CATALOG_VERSION_KEY, initial, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, initial)
+    return version
+
+
+def get_catalog_state():
+    """
+    Trả về (version, thời điểm thay đổi gần nhất dạng epoch) trong một lượt gọi Redis.
+    """
+    state = cache.get_many([CATALOG_VERSION_KEY, CATALOG_LAST_MODIFIED_KEY])
+    version = state.get(CATALOG_VERSION_KEY)
+    last_modified = state.get(CATALOG_LAST_MODIFIED_KEY)
+    if version is None or last_modified is None:
+        # Chưa có trạng thái (Redis mới hoặc bị flush): coi như vừa thay đổi
+        initial = _initial_version()
+        cache.add(CATALOG_VERSION_KEY, initial, timeout=None)
+        cache.add(CATALOG_LAST_MODIFIED_KEY, int(time.time()), timeout=None)
+        state = cache.get_many([CATALOG_VERSION_KEY, CATALOG_LAST_MODIFIED_KEY])
+        version = state.get(CATALOG_VERSION_KEY, initial)
+        last_modified = state.get(CATALOG_LAST_MODIFIED_KEY, int(time.time()))
+    return version, last_modified
+
+
+def _bump_catalog_version() -> None:
+    try:
+        try:
+            cache.incr(CATALOG_VERSION_KEY)
+        except ValueError:
+            # Key chưa tồn tại (Redis bị flush/evict): khởi tạo lại
+            cache.add(CATALOG_VERSION_KEY, _initial_version(), timeout=None)
+            cache.incr(CATALOG_VERSION_KEY)
+        cache.set(CATALOG_LAST_MODIFIED_KEY, int(time.time()), timeout=None)
+    except Exception:
+        logger.exception("Failed to bump catalog cache version")
+
+
+def bump_catalog_version() -> None:
+    """
+    Vô hiệu hóa toàn bộ cache danh mục sản phẩm.
+    Chạy sau khi transaction commit để không cache lại dữ liệu cũ.
+    """
+    transaction.on_commit(_bump_catalog_version)
+
+
+def catalog_cache_key(kind: str, identifier: str) -> str:
+    digest = hashlib.md5(identifier.encode('utf-8')).hexdigest()
+    return f"catalog:v{get_catalog_version()}:{kind}:{digest}"
+
+
+def get_or_build(kind: str, identifier: str, builder):
+    """
+    Trả về payload trong cache, hoặc gọi builder() rồi lưu lại.
+    Redis lỗi thì vẫn phục vụ trực tiếp từ DB.
+    """
+    try:
+        key = catalog_cache_key(kind, identifier)
+        payload = cache.get(key)
+    except Exception:
+        logger.exception("Catalog cache unavailable")
+        return builder()
+
+    if payload is None:
+        payload = builder()
+        try:
+            cache.set(key, payload, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        except Exception:
+            logger.exception("Failed to store catalog cache entry")
+    return payload
+
+
+def catalog_validators(request):
+    """
+    Tính (ETag, Last-Modified) cho một request đọc danh mục từ catalog version,
+    không cần truy vấn DB. Trả về (None, None) nếu Redis không dùng được.
+    """
+    try:
+        version, last_modified = get_catalog_state()
+    except Exception:
+        logger.exception("Catalog cache unavailable")
+        return None, None
+    identifier = f"{version}|{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+    etag = f'W/"{hashlib.md5(identifier.encode("utf-8")).hexdigest()}"'
+    return etag, last_modified
@@ -0,0 +1,87 @@
+"""
+Tính facet (số lượng sản phẩm theo danh mục, khoảng giá, tình trạng tồn kho)
+cho danh sách sản phẩm đã lọc.
+"""
+from django.conf import settings
+from django.db.models import Count, Q
+
+
+def price_buckets():
+    """
+    Chia khoảng giá theo các mốc trong settings.PRODUCT_PRICE_BUCKETS.
+    Trả về danh sách (key, giá thấp nhất, giá cao nhất); None là không giới hạn trên.
+    """
+    bounds = [0, *settings.PRODUCT_PRICE_BUCKETS, None]
+    return [
+        (f"{low}-{high}" if high is not None else f"{low}+", low, high)
+        for low, high in zip(bounds, bounds[1:])
+    ]
+
+
+def _price_filter(low, high):
+    condition = Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
+
+
+def _count(condition):
+    return Count('id', filter=condition) if condition else Count('id')
+
+
+def compute_facets(queryset, category_id=None, price_filter=None, availability_filter=None) -> dict:
+    """
+    Tính toàn bộ facet bằng một câu GROUP BY category_id duy nhất:
+    mỗi nhóm đếm kèm số sản phẩm theo từng khoảng giá và còn/hết hàng,
+    sau đó cộng dồn trong Python.
+
+    Facet là disjunctive: `queryset` chưa áp dụng bộ lọc danh mục, giá và tồn
+    kho; mỗi nhóm facet được đếm với bộ lọc của các nhóm còn lại nhưng không
+    có bộ lọc của chính nó, nên client vẫn thấy số lượng của các lựa chọn khác
+    trong nhóm. Danh mục đang chọn (`category_id`) thu hẹp facet giá và tồn
+    kho; `price_filter` / `availability_filter` là Q của khoảng giá và tình
+    trạng tồn kho đang chọn.
+    """
+    price_filter = price_filter or Q()
+    availability_filter = availability_filter or Q()
+    buckets = price_buckets()
+    aggregates = {
+        'total': _count(price_filter & availability_filter),
+        'in_stock': _count(price_filter & Q(stock_quantity__gt=0)),
+        'out_of_stock': _count(price_filter & Q(stock_quantity=0)),
+    }
+    for index, (_, low, high) in enumerate(buckets):
+        aggregates[f'price_{index}'] = _count(availability_filter & _price_filter(low, high))
+
+    rows = (
+        queryset.order_by()
+        .values('category_id', 'category__category_name')
+        .annotate(**aggregates)
+        .order_by('category_id')
+    )
+
+    categories = []
+    price_counts = [0] * len(buckets)
+    in_stock = out_of_stock = 0
+    for row in rows:
+        if row['total']:
+            categories.append({
+                'id': row['category_id'],
+                'category_name': row['category__category_name'],
+                'count': row['total'],
+            })
+        if category_id is not None and row['category_id'] != category_id:
+            continue
+        in_stock += row['in_stock']
+        out_of_stock += row['out_of_stock']
+        for index in range(len(buckets)):
+            price_counts[index] += row[f'price_{index}']
+
+    return {
+        'categories': categories,
+        'price_ranges': [
+            {'key': key, 'min_price': low, 'max_price': high, 'count': count}
+            for (key, low, high), count in zip(buckets, price_counts)
+        ],
+        'availability': {'in_stock': in_stock, 'out_of_stock': out_of_stock},
+    }
@@ -0,0 +1,225 @@
+"""
+Import/upsert sản phẩm hàng loạt từ luồng CSV hoặc NDJSON.
+
+Dữ liệu được đọc theo từng dòng, validate và ghi theo lô nên bộ nhớ chỉ phụ
+thuộc vào kích thước lô, không phụ thuộc vào kích thước file. Ảnh được upload
+qua hàng đợi upload (apps.uploads) và được worker xử lý nền.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.db import transaction
+
+from apps.products.cache import bump_catalog_version
+from apps.products.models import Category, Product
+from apps.products.serializers import ProductImportRowSerializer
+from apps.uploads.services import enqueue_uploads
+
+CSV_MEDIA_TYPE = 'text/csv'
+NDJSON_MEDIA_TYPES = ('application/x-ndjson', 'application/jsonl', 'application/json-lines')
+
+# Các cột được ghi đè khi SKU đã tồn tại; ảnh do worker upload cập nhật
+UPSERT_FIELDS = ['product_name', 'description', 'price', 'category', 'stock_quantity', 'updated_at']
+
+
+class ImportFormatError(ValueError):
+    """
+    Cả file không đọc được (vd. header CSV sai mã hóa hoặc thiếu cột bắt buộc).
+    """
+
+
+def read_csv_header(lines) -> list:
+    """
+    Đọc và kiểm tra dòng header CSV; ném ImportFormatError nếu header không
+    phải UTF-8, rỗng hoặc thiếu cột bắt buộc của ProductImportRowSerializer.
+    """
+    line = next(lines, b'')
+    try:
+        text = line.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ImportFormatError('CSV header is not valid UTF-8')
+    try:
+        fieldnames = [name.strip() for name in next(csv.reader([text]), [])]
+    except csv.Error as exc:
+        raise ImportFormatError(f'Invalid CSV header: {exc}')
+    if not any(fieldnames):
+        raise ImportFormatError('CSV header is missing')
+    required = [name for name, field in ProductImportRowSerializer().fields.items() if field.required]
+    missing = [name for name in required if name not in fieldnames]
+    if missing:
+        raise ImportFormatError(f"CSV header is missing required columns: {', '.join(missing)}")
+    return fieldnames
+
+
+def iter_csv_rows(lines):
+    """
+    Đọc từng bản ghi CSV (có header) từ một iterable các dòng bytes.
+    Header được kiểm tra ngay khi gọi (ImportFormatError); dòng dữ liệu không
+    phải UTF-8 hoặc sai cú pháp CSV được trả về dạng lỗi của dòng đó (như
+    iter_ndjson_rows) thay vì làm hỏng cả request.
+    """
+    lines = iter(lines)
+    fieldnames = read_csv_header(lines)
+    return _iter_csv_records(lines, fieldnames)
+
+
+def _iter_csv_records(lines, fieldnames):
+    decode_errors = []
+
+    def decoded():
+        for line in lines:
+            try:
+                yield line.decode('utf-8-sig')
+            except UnicodeDecodeError as exc:
+                decode_errors.append(exc)
+                # Dòng rỗng bị DictReader bỏ qua; lỗi được báo ở vòng lặp dưới
+                yield ''
+
+    reader = csv.DictReader(decoded(), fieldnames=fieldnames)
+    row_number = 0
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            row = None
+        except csv.Error as exc:
+            row = exc
+        # Lỗi giải mã của các dòng đứng trước bản ghi vừa đọc
+        while decode_errors:
+            row_number += 1
+            yield row_number, decode_errors.pop(0)
+        if row is None:
+            return
+        row_number += 1
+        yield row_number, row
+
+
+def iter_ndjson_rows(lines):
+    """
+    Đọc từng object JSON, mỗi dòng một object; bỏ qua dòng trống.
+    """
+    row_number = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield row_number, exc
+            continue
+        yield row_number, row
+
+
+class ImportReport:
+    """
+    Tổng hợp kết quả import và lỗi của từng dòng.
+    """
+
+    def __init__(self, max_errors):
+        self.max_errors = max_errors
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row_number, errors, sku=None):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row_number, 'sku': sku, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def import_products(rows, batch_size=None, max_errors=None):
+    """
+    Upsert sản phẩm theo SKU từ iterable (row_number, row).
+    Trả về ImportReport.
+    """
+    batch_size = batch_size or settings.PRODUCT_IMPORT_BATCH_SIZE
+    report = ImportReport(max_errors or settings.PRODUCT_IMPORT_MAX_ERRORS)
+
+    batch = []
+    for row_number, row in rows:
+        batch.append((row_number, row))
+        if len(batch) >= batch_size:
+            _import_batch(batch, report)
+            batch = []
+    if batch:
+        _import_batch(batch, report)
+
+    bump_catalog_version()
+    return report
+
+
+def _import_batch(batch, report):
+    valid = {}
+    for row_number, row in batch:
+        if not isinstance(row, dict):
+            report.add_error(row_number, {'non_field_errors': [str(row) if isinstance(row, Exception) else 'Invalid row']})
+            continue
+        serializer = ProductImportRowSerializer(data=row)
+        if not serializer.is_valid():
+            report.add_error(row_number, serializer.errors, sku=row.get('sku'))
+            continue
+        # SKU lặp lại trong cùng lô: giữ dòng sau cùng
+        valid[serializer.validated_data['sku']] = (row_number, serializer.validated_data)
+
+    if not valid:
+        return
+
+    category_ids = {data['category_id'] for _, data in valid.values()}
+    existing_categories = set(
+        Category.objects.filter(pk__in=category_ids).values_list('pk', flat=True)
+    )
+
+    products = []
+    image_urls = {}
+    for sku, (row_number, data) in valid.items():
+        if data['category_id'] not in existing_categories:
+            report.add_error(row_number, {'category_id': ['Danh mục không tồn tại.']}, sku=sku)
+            continue
+        products.append(Product(
+            sku=sku,
+            product_name=data['product_name'],
+            description=data['description'],
+            price=data['price'],
+            category_id=data['category_id'],
+            stock_quantity=data['stock_quantity'],
+            image='',
+        ))
+        if data['image_url']:
+            image_urls[sku] = data['image_url']
+
+    if not products:
+        return
+
+    with transaction.atomic():
+        previous_categories = dict(
+            Product.objects.filter(sku__in=[p.sku for p in products]).values_list('sku', 'category_id')
+        )
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=UPSERT_FIELDS,
+        )
+        # bulk_create không gọi Product.save nên phải tính lại bộ đếm danh mục
+        affected_categories = set(previous_categories.values()) | {p.category_id for p in products}
+        Category.refresh_product_counts(affected_categories)
+
+        enqueue_uploads(
+            Product, 'image', [(p.pk, image_urls[p.sku]) for p in products if p.sku in image_urls]
+        )
+
+    report.updated += len(previous_categories)
+    report.created += len(products) - len(previous_categories)
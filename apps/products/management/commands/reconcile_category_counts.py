@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Recompute Category.product_count from the products table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--category', type=int, action='append', dest='category_ids',
+            help='Only reconcile the given category id (repeatable)',
+        )
+
+    def handle(self, *args, **options):
+        updated = Category.refresh_product_counts(options['category_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Reconciled product_count for {updated} categories'))
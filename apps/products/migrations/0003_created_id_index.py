@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "products",
+            "0002_alter_product_options_alter_category_category_name_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="product_created_id_idx"
+            ),
+        ),
+    ]
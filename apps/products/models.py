@@ -3,24 +3,58 @@ Models for product and category management.
 """
 
 from cloudinary.models import CloudinaryField
-from django.db import models
-from django.db.models import F
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.html import format_html
 from rest_framework.exceptions import ValidationError
 
+from apps.products.cache import bump_catalog_version
+from apps.uploads.models import UploadStatus
+
+# Cấu hình full-text search; 'simple' không stem nên dùng được cho tiếng Việt
+SEARCH_CONFIG = 'simple'
+
 
 class Category(models.Model):
     """
     Danh mục sản phẩm.
     """
     category_name = models.CharField(max_length=100)
+    # Bộ đếm phi chuẩn hóa, được Product cập nhật trong cùng transaction
+    product_count = models.PositiveIntegerField(default=0, editable=False)
 
-    @property
-    def product_count(self):
+    @classmethod
+    def refresh_product_counts(cls, category_ids=None) -> int:
+        """
+        Tính lại product_count từ bảng Product bằng một câu UPDATE duy nhất.
+        Trả về số danh mục đã cập nhật.
+        """
+        counts = (
+            Product.objects.filter(category=OuterRef('pk'))
+            .order_by()
+            .values('category')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        categories = cls.objects.all()
+        if category_ids is not None:
+            categories = categories.filter(pk__in=category_ids)
+        updated = categories.update(product_count=Coalesce(Subquery(counts), 0))
+        bump_catalog_version()
+        return updated
+
+    @staticmethod
+    def adjust_product_count(category_id, delta: int) -> None:
         """
-        Đếm tổng số sản phẩm thuộc về danh mục này.
+        Cộng/trừ product_count bằng một câu UPDATE nguyên tử, không để âm.
         """
-        return self.products.count()
+        categories = Category.objects.filter(pk=category_id)
+        if delta < 0:
+            categories = categories.filter(product_count__gte=-delta)
+        categories.update(product_count=F('product_count') + delta)
 
     def __str__(self) -> str:
         return str(self.category_name)
@@ -30,6 +64,8 @@ class Product(models.Model):
     """
     Sản phẩm được bán trong hệ thống.
     """
+    # Mã sản phẩm của nhà cung cấp, dùng làm khóa upsert khi import hàng loạt
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     product_name = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -38,11 +74,61 @@ class Product(models.Model):
     )
     stock_quantity = models.PositiveIntegerField()
     image = CloudinaryField('image')
+    image_status = models.CharField(
+        max_length=20, choices=UploadStatus.choices, default=UploadStatus.READY
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Cột tsvector do Postgres tự tính lại mỗi khi tên/mô tả thay đổi
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('product_name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Phục vụ phân trang keyset theo (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+            # Phục vụ lọc theo danh mục kết hợp giá / sắp xếp theo ngày tạo
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            models.Index(fields=['category', '-created_at'], name='product_category_created_idx'),
+        ]
+
+    # category_id lúc load từ DB, dùng để biết sản phẩm có đổi danh mục không
+    _loaded_category_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Lưu sản phẩm và cập nhật product_count của danh mục trong cùng transaction.
+        """
+        adding = self._state.adding
+        previous_category_id = self._loaded_category_id
+        update_fields = kwargs.get('update_fields')
+        category_saved = update_fields is None or {'category', 'category_id'} & set(update_fields)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Category.adjust_product_count(self.category_id, 1)
+            elif (category_saved and previous_category_id is not None
+                  and previous_category_id != self.category_id):
+                Category.adjust_product_count(previous_category_id, -1)
+                Category.adjust_product_count(self.category_id, 1)
+
+        if category_saved:
+            self._loaded_category_id = self.category_id
 
     @property
     def is_available(self):
@@ -77,6 +163,9 @@ class Product(models.Model):
                 f"Không đủ hàng tồn kho. Chỉ còn lại {self.stock_quantity} sản phẩm."
             )
 
+        # update() không phát signal nên phải tự vô hiệu hóa cache
+        bump_catalog_version()
+
         # Cập nhật lại instance hiện tại với giá trị mới từ DB
         self.refresh_from_db(fields=['stock_quantity'])
 
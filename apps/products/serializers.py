@@ -6,6 +6,9 @@ Serializers cho ứng dụng products.
 from rest_framework import serializers
 
 from apps.products.models import Category, Product
+from apps.products.stock import MAX_STOCK_QUANTITY
+from apps.uploads.serializers import DeferredUploadMixin
+from config.serializers import SparseFieldsetsMixin
 
 class CategorySerializer(serializers.ModelSerializer):
     """
@@ -15,15 +18,20 @@ class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         """Meta-options cho CategorySerializer."""
         model = Category
-        fields = ('id', 'category_name')
+        fields = ('id', 'category_name', 'product_count')
+        read_only_fields = ('product_count',)
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetsMixin, DeferredUploadMixin, serializers.ModelSerializer):
     """
     Serializer cho model Product.
     - Khi đọc (GET): Hiển thị chi tiết category (dạng nested object).
     - Khi ghi (POST/PUT): Chấp nhận 'category_id' để tạo hoặc cập nhật quan hệ.
+    - Ảnh được upload nền; 'image_status' cho biết ảnh đã sẵn sàng chưa.
+    - Hỗ trợ ?fields= / ?omit= để chỉ trả về các field cần thiết.
     """
+    deferred_upload_fields = ('image',)
+
     image = serializers.ImageField(required=False)
     category = CategorySerializer(read_only=True)
 
@@ -38,11 +46,67 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = (
             'id',
+            'sku',
             'product_name',
             'description',
             'image',
+            'image_status',
             'price',
             'stock_quantity',
             'category',
             'category_id'
-        )
\ No newline at end of file
+        )
+        read_only_fields = ('image_status',)
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    """
+    Validate các tham số lọc sản phẩm trên query string.
+    """
+    category_id = serializers.IntegerField(required=False, min_value=1)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, min_value=0)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, min_value=0)
+    in_stock = serializers.BooleanField(required=False, allow_null=True, default=None)
+
+    def validate(self, attrs):
+        min_price = attrs.get('min_price')
+        max_price = attrs.get('max_price')
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise serializers.ValidationError({'min_price': 'min_price phải nhỏ hơn hoặc bằng max_price.'})
+        return attrs
+
+
+class ProductSearchSerializer(ProductFilterSerializer):
+    """
+    Tham số cho API tìm kiếm full-text sản phẩm.
+    """
+    q = serializers.CharField(max_length=200, trim_whitespace=True)
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    """
+    Validate một dòng trong file import sản phẩm (CSV/NDJSON).
+    category_id chỉ kiểm tra kiểu ở đây; việc tồn tại được kiểm tra theo lô.
+    """
+    sku = serializers.CharField(max_length=64)
+    product_name = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    category_id = serializers.IntegerField(min_value=1)
+    stock_quantity = serializers.IntegerField(min_value=0)
+    image_url = serializers.URLField(required=False, allow_blank=True, default='')
+
+
+class StockAdjustmentItemSerializer(serializers.Serializer):
+    """
+    Một thay đổi tồn kho: delta dương là nhập thêm, âm là xuất kho.
+    """
+    product_id = serializers.IntegerField(min_value=1)
+    delta = serializers.IntegerField(min_value=-MAX_STOCK_QUANTITY, max_value=MAX_STOCK_QUANTITY)
+
+
+class StockAdjustmentSerializer(serializers.Serializer):
+    """
+    Danh sách thay đổi tồn kho gửi từ hệ thống kho.
+    """
+    items = StockAdjustmentItemSerializer(many=True, allow_empty=False)
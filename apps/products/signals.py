@@ -0,0 +1,28 @@
+"""
+Signal handlers cho ứng dụng products.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.products.cache import bump_catalog_version
+from apps.products.models import Category, Product
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    """
+    Sản phẩm hoặc danh mục thay đổi thì cache danh mục không còn đúng.
+    """
+    bump_catalog_version()
+
+
+@receiver(post_delete, sender=Product)
+def decrease_category_product_count(sender, instance, **kwargs):
+    """
+    post_delete chạy bên trong transaction của thao tác xóa
+    (kể cả QuerySet.delete), nên bộ đếm luôn khớp với dữ liệu.
+    """
+    Category.adjust_product_count(instance.category_id, -1)
@@ -0,0 +1,92 @@
+"""
+Điều chỉnh tồn kho hàng loạt bằng câu lệnh set-based.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.products.cache import bump_catalog_version
+from apps.products.models import Product
+
+# Mỗi cặp (id, delta) dùng 2 tham số; giữ mỗi câu lệnh dưới giới hạn tham số của Postgres
+STOCK_ADJUST_CHUNK_SIZE = 10000
+# Giới hạn của cột integer trong Postgres (stock_quantity)
+MAX_STOCK_QUANTITY = 2 ** 31 - 1
+
+
+def aggregate_deltas(deltas) -> dict:
+    """
+    Gộp các cặp (product_id, delta) trùng sản phẩm thành một delta duy nhất.
+    """
+    totals = defaultdict(int)
+    for product_id, delta in deltas:
+        totals[int(product_id)] += int(delta)
+    return dict(totals)
+
+
+def _adjust_chunk(chunk, lock_rows):
+    if lock_rows:
+        # Khóa các dòng theo thứ tự id trước: UPDATE ... FROM (VALUES) không khóa theo
+        # thứ tự cố định, nên hai lô chạy song song có chung sản phẩm có thể deadlock
+        list(
+            Product.objects.filter(pk__in=[product_id for product_id, _ in chunk])
+            .order_by('pk').select_for_update().values_list('pk', flat=True)
+        )
+    table = connection.ops.quote_name(Product._meta.db_table)
+    # delta gộp có thể vượt integer: cộng trên bigint và chỉ ghi khi kết quả nằm trong cột
+    values = ', '.join(['(%s::bigint, %s::bigint)'] * len(chunk))
+    sql = (
+        f"UPDATE {table} AS p "
+        f"SET stock_quantity = p.stock_quantity + v.delta, updated_at = %s "
+        f"FROM (VALUES {values}) AS v(id, delta) "
+        f"WHERE p.id = v.id AND p.stock_quantity + v.delta BETWEEN 0 AND {MAX_STOCK_QUANTITY} "
+        f"RETURNING p.id, p.stock_quantity"
+    )
+    params = [timezone.now()]
+    for product_id, delta in chunk:
+        params.extend((product_id, delta))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return dict(cursor.fetchall())
+
+
+def bulk_adjust_stock(deltas, lock_rows=True) -> dict:
+    """
+    Cộng delta vào tồn kho của nhiều sản phẩm bằng một câu
+    UPDATE ... FROM (VALUES ...) cho mỗi lô, giữ điều kiện tồn kho không âm.
+
+    Các sản phẩm không đủ hàng, vượt giới hạn tồn kho hoặc không tồn tại bị
+    bỏ qua và được trả về trong 'rejected'; các sản phẩm còn lại vẫn được cập
+    nhật. `lock_rows=False` khi transaction của người gọi đã khóa các dòng này
+    theo thứ tự id.
+    """
+    totals = aggregate_deltas(deltas)
+    items = sorted(totals.items())
+    updated = {}
+
+    with transaction.atomic():
+        for start in range(0, len(items), STOCK_ADJUST_CHUNK_SIZE):
+            updated.update(_adjust_chunk(items[start:start + STOCK_ADJUST_CHUNK_SIZE], lock_rows))
+
+        rejected_ids = [product_id for product_id, _ in items if product_id not in updated]
+        current_stock = dict(
+            Product.objects.filter(pk__in=rejected_ids).values_list('pk', 'stock_quantity')
+        ) if rejected_ids else {}
+
+        if updated:
+            bump_catalog_version()
+
+    rejected = [
+        {
+            'product_id': product_id,
+            'delta': totals[product_id],
+            'reason': (
+                'not_found' if product_id not in current_stock
+                else 'insufficient_stock' if totals[product_id] < 0 else 'stock_overflow'
+            ),
+            'stock_quantity': current_stock.get(product_id),
+        }
+        for product_id in rejected_ids
+    ]
+    return {'updated': updated, 'rejected': rejected}
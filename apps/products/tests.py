@@ -1,3 +1,515 @@
-from django.test import TestCase
+import io
+import json
+from base64 import b64encode
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.products.models import Category, Product
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.category = Category.objects.create(category_name='Books')
+        self.client = APIClient()
+
+    def create_products(self, count, category=None, **fields):
+        return Product.objects.bulk_create([
+            Product(**dict({
+                'product_name': f'Product {index}', 'description': '...', 'price': 10,
+                'category': category or self.category, 'stock_quantity': 5, 'image': 'sample.jpg',
+            }, **fields))
+            for index in range(count)
+        ])
+
+    def get_json(self, url, status_code=200, **extra):
+        response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, status_code, response.content)
+        return response.json()
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        products = self.create_products(25)
+        # Cùng created_at: thứ tự và biên trang chỉ còn dựa vào id
+        Product.objects.filter(pk__in=[p.pk for p in products]).update(created_at=timezone.now())
+        self.expected = sorted((p.pk for p in products), reverse=True)
+
+    def walk(self, url):
+        pages = []
+        while url:
+            body = self.get_json(url)
+            pages.append([product['id'] for product in body['data']])
+            url = body['meta']['next']
+        return pages, body
+
+    def test_cursor_pages_cover_ties_without_gaps_or_duplicates(self):
+        pages, last = self.walk('/api/v1/products/?cursor=')
+
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertNotIn('count', last['meta'])
+
+    def test_previous_link_returns_the_preceding_page(self):
+        first = self.get_json('/api/v1/products/?cursor=')
+        self.assertIsNone(first['meta']['previous'])
+        second = self.get_json(first['meta']['next'])
+        third = self.get_json(second['meta']['next'])
+        self.assertIsNone(third['meta']['next'])
+
+        back = self.get_json(third['meta']['previous'])
+        self.assertEqual([p['id'] for p in back['data']], [p['id'] for p in second['data']])
+        self.assertIsNotNone(back['meta']['next'])
+        front = self.get_json(back['meta']['previous'])
+        self.assertEqual([p['id'] for p in front['data']], self.expected[:10])
+        self.assertIsNone(front['meta']['previous'])
+
+    def test_tampered_cursor_is_not_found(self):
+        forged = b64encode(b'[0, "not a date", 1]').decode('ascii')
+        for cursor in ('%%%', 'bm90IGpzb24=', forged):
+            self.get_json(f'/api/v1/products/?cursor={cursor}', status_code=404)
+
+    def test_page_number_pagination_is_unchanged_without_cursor(self):
+        body = self.get_json('/api/v1/products/?page=3')
+        self.assertEqual(body['meta']['count'], 25)
+        self.assertEqual(len(body['data']), 5)
+
+
+class CatalogCacheTests(CatalogTestCase):
+    def test_writes_invalidate_cached_list_and_detail(self):
+        product = self.create_products(1)[0]
+        self.assertEqual(self.get_json(f'/api/v1/products/{product.pk}/')['data']['product_name'], 'Product 0')
+        self.get_json('/api/v1/products/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.product_name = 'Renamed'
+            product.save()
+
+        self.assertEqual(self.get_json(f'/api/v1/products/{product.pk}/')['data']['product_name'], 'Renamed')
+        self.assertEqual(self.get_json('/api/v1/products/')['data'][0]['product_name'], 'Renamed')
+
+    def test_cached_payload_is_served_until_the_version_changes(self):
+        from apps.products.cache import _bump_catalog_version, get_or_build
+
+        self.assertEqual(get_or_build('detail', '/p/1/', lambda: 'v1'), 'v1')
+        self.assertEqual(get_or_build('detail', '/p/1/', lambda: 'unused'), 'v1')
+        _bump_catalog_version()
+        self.assertEqual(get_or_build('detail', '/p/1/', lambda: 'v2'), 'v2')
+
+    def test_evicted_version_does_not_revive_stale_entries(self):
+        from django.core.cache import cache
+
+        from apps.products.cache import (
+            CATALOG_VERSION_KEY, _bump_catalog_version, get_catalog_version, get_or_build,
+        )
+
+        get_or_build('detail', '/p/1/', lambda: 'stale')
+        first = get_catalog_version()
+        _bump_catalog_version()
+        get_or_build('detail', '/p/1/', lambda: 'fresh')
+
+        # Redis evict key version dưới áp lực bộ nhớ; các entry cũ vẫn còn trong TTL
+        cache.delete(CATALOG_VERSION_KEY)
+        self.assertEqual(get_or_build('detail', '/p/1/', lambda: 'rebuilt'), 'rebuilt')
+        self.assertGreater(get_catalog_version(), first + 1)
+
+        cache.delete(CATALOG_VERSION_KEY)
+        _bump_catalog_version()
+        self.assertGreater(get_catalog_version(), first + 1)
+
+
+class ConditionalGetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.create_products(1)[0]
+
+    def test_matching_etag_returns_304_without_queries(self):
+        response = self.client.get('/api/v1/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/v1/products/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_catalog_write_changes_the_etag(self):
+        etag = self.client.get(f'/api/v1/products/{self.product.pk}/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.product_name = 'Renamed'
+            self.product.save()
+
+        response = self.client.get(f'/api/v1/products/{self.product.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['data']['product_name'], 'Renamed')
+
+    def test_if_modified_since_alone_never_returns_a_stale_304(self):
+        last_modified = self.client.get('/api/v1/products/')['Last-Modified']
+
+        # Ghi trong cùng giây: Last-Modified không đổi nhưng danh mục đã khác
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.product_name = 'Renamed'
+            self.product.save()
+
+        response = self.client.get('/api/v1/products/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'][0]['product_name'], 'Renamed')
+
+
+class SparseFieldsetsTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_products(2)
+
+    def test_fields_selects_only_the_requested_fields(self):
+        items = self.get_json('/api/v1/products/?fields=id,product_name')['data']
+        self.assertEqual([set(item) for item in items], [{'id', 'product_name'}] * 2)
+
+    def test_omit_drops_fields(self):
+        item = self.get_json('/api/v1/products/?omit=description,category')['data'][0]
+        self.assertNotIn('description', item)
+        self.assertNotIn('category', item)
+        self.assertIn('product_name', item)
+
+    def test_unknown_fields_are_ignored(self):
+        items = self.get_json('/api/v1/products/?fields=id,bogus')['data']
+        self.assertEqual([set(item) for item in items], [{'id'}] * 2)
+        self.assertEqual(self.get_json('/api/v1/products/?fields=bogus')['data'], [{}, {}])
+
+    def test_queryset_reads_only_the_selected_columns(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            self.get_json('/api/v1/products/?fields=id,product_name,category')
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT "products_product"."id"')]
+        self.assertEqual(len(selects), 1, selects)
+        self.assertIn('"products_product"."product_name"', selects[0])
+        self.assertIn('JOIN "products_category"', selects[0])
+        self.assertNotIn('"products_product"."description"', selects[0])
+
+
+class ProductSearchTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        other = Category.objects.create(category_name='Toys')
+        self.in_description = Product.objects.create(
+            product_name='Notebook', description='A dragon on the cover', price=5,
+            category=self.category, stock_quantity=3, image='sample.jpg',
+        )
+        self.in_name = Product.objects.create(
+            product_name='Dragon figure', description='Painted resin', price=30,
+            category=other, stock_quantity=0, image='sample.jpg',
+        )
+        Product.objects.create(
+            product_name='Pencil', description='Graphite', price=1,
+            category=self.category, stock_quantity=10, image='sample.jpg',
+        )
+
+    def search(self, query, status_code=200):
+        return self.get_json(f'/api/v1/products/search/?{query}', status_code=status_code)
+
+    def test_matches_in_name_rank_above_matches_in_description(self):
+        body = self.search('q=dragon')
+        self.assertEqual([p['id'] for p in body['data']], [self.in_name.pk, self.in_description.pk])
+        self.assertEqual(body['meta']['count'], 2)
+
+    def test_websearch_syntax_and_filters(self):
+        self.assertEqual([p['id'] for p in self.search('q=dragon -resin')['data']], [self.in_description.pk])
+        self.assertEqual(
+            [p['id'] for p in self.search(f'q=dragon&category_id={self.category.pk}')['data']],
+            [self.in_description.pk],
+        )
+        self.assertEqual([p['id'] for p in self.search('q=dragon&min_price=10')['data']], [self.in_name.pk])
+        self.assertEqual([p['id'] for p in self.search('q=dragon&in_stock=true')['data']], [self.in_description.pk])
+        self.assertEqual(self.search('q=unicorn')['meta']['count'], 0)
+
+    def test_query_is_required(self):
+        self.search('category_id=1', status_code=400)
+        self.search('q=dragon&min_price=20&max_price=10', status_code=400)
+
+
+class ProductFacetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.toys = Category.objects.create(category_name='Toys')
+        self.create_products(3, price=5)
+        self.create_products(1, price=500, stock_quantity=0)
+        self.create_products(2, category=self.toys, price=50)
+
+    def facets(self, query=''):
+        return self.get_json(f'/api/v1/products/?{query}')['meta']['facets']
+
+    def category_counts(self, facets):
+        return {category['id']: category['count'] for category in facets['categories']}
+
+    def test_category_facet_ignores_the_selected_category(self):
+        facets = self.facets(f'category_id={self.toys.pk}')
+
+        self.assertEqual(self.category_counts(facets), {self.category.pk: 4, self.toys.pk: 2})
+        # Giá và tồn kho vẫn tính trên danh mục đang chọn
+        self.assertEqual(facets['availability'], {'in_stock': 2, 'out_of_stock': 0})
+        self.assertEqual(sum(bucket['count'] for bucket in facets['price_ranges']), 2)
+
+    def price_counts(self, facets):
+        return {bucket['key']: bucket['count'] for bucket in facets['price_ranges'] if bucket['count']}
+
+    def test_availability_facet_ignores_the_selected_availability(self):
+        facets = self.facets(f'category_id={self.category.pk}&in_stock=true')
+
+        self.assertEqual(self.category_counts(facets), {self.category.pk: 3, self.toys.pk: 2})
+        self.assertEqual(facets['availability'], {'in_stock': 3, 'out_of_stock': 1})
+
+        facets = self.facets(f'category_id={self.category.pk}&in_stock=false')
+        self.assertEqual(self.category_counts(facets), {self.category.pk: 1})
+        self.assertEqual(facets['availability'], {'in_stock': 3, 'out_of_stock': 1})
+        # Khoảng giá vẫn bị thu hẹp bởi bộ lọc tồn kho
+        self.assertEqual(self.price_counts(facets), {'0-100000': 1})
+
+    def test_price_facet_ignores_the_selected_price_range(self):
+        self.create_products(2, price=200000)
+        self.create_products(1, price=300000, stock_quantity=0)
+
+        body = self.get_json(f'/api/v1/products/?category_id={self.category.pk}&min_price=100000&max_price=499999')
+        facets = body['meta']['facets']
+        self.assertEqual(len(body['data']), 3)
+        self.assertEqual(self.price_counts(facets), {'0-100000': 4, '100000-500000': 3})
+        # Danh mục và tồn kho bị thu hẹp bởi khoảng giá đang chọn
+        self.assertEqual(self.category_counts(facets), {self.category.pk: 3})
+        self.assertEqual(facets['availability'], {'in_stock': 2, 'out_of_stock': 1})
+
+        facets = self.facets(f'category_id={self.category.pk}&min_price=100000&in_stock=true')
+        self.assertEqual(self.price_counts(facets), {'0-100000': 3, '100000-500000': 2})
+        self.assertEqual(facets['availability'], {'in_stock': 2, 'out_of_stock': 1})
+
+    def test_facets_use_one_aggregated_query(self):
+        from apps.products.facets import compute_facets
+
+        with self.assertNumQueries(1):
+            facets = compute_facets(Product.objects.all(), self.category.pk)
+        self.assertEqual(facets['availability'], {'in_stock': 3, 'out_of_stock': 1})
+
+    def test_facets_are_kept_without_pagination(self):
+        from unittest import mock
+
+        from config.pagination import KeysetPagination
+
+        with mock.patch.object(KeysetPagination, 'page_size', None):
+            body = self.get_json(f'/api/v1/products/?category_id={self.toys.pk}')
+        self.assertEqual(len(body['data']), 2)
+        self.assertEqual(self.category_counts(body['meta']['facets']), {self.category.pk: 4, self.toys.pk: 2})
+
+
+class CategoryProductCountTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.toys = Category.objects.create(category_name='Toys')
+
+    def create_product(self, category):
+        return Product.objects.create(
+            product_name='Product', description='...', price=10,
+            category=category, stock_quantity=1, image='sample.jpg',
+        )
+
+    def counts(self):
+        return dict(Category.objects.values_list('pk', 'product_count'))
+
+    def test_create_move_and_delete_keep_counts_in_sync(self):
+        first = self.create_product(self.category)
+        second = self.create_product(self.category)
+        self.assertEqual(self.counts(), {self.category.pk: 2, self.toys.pk: 0})
+
+        moved = Product.objects.get(pk=first.pk)
+        moved.category = self.toys
+        moved.save()
+        # Lưu lại mà không đổi danh mục thì không đếm thêm
+        moved.save()
+        Product.objects.get(pk=second.pk).save(update_fields=['price'])
+        self.assertEqual(self.counts(), {self.category.pk: 1, self.toys.pk: 1})
+
+        moved.delete()
+        Product.objects.filter(pk=second.pk).delete()
+        self.assertEqual(self.counts(), {self.category.pk: 0, self.toys.pk: 0})
+
+    def test_reconcile_command_recomputes_counts(self):
+        self.create_products(3)
+        self.create_product(self.toys)
+        Category.objects.update(product_count=7)
+
+        call_command('reconcile_category_counts', category_ids=[self.category.pk], stdout=io.StringIO())
+        self.assertEqual(self.counts(), {self.category.pk: 3, self.toys.pk: 7})
+
+        out = io.StringIO()
+        call_command('reconcile_category_counts', stdout=out)
+        self.assertEqual(self.counts(), {self.category.pk: 3, self.toys.pk: 1})
+        self.assertIn('for 2 categories', out.getvalue())
+
+
+class ProductImportTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        from apps.users.models import User
+
+        admin = User.objects.create_user('admin', 'admin@example.com', 'password', role='admin')
+        self.client.force_authenticate(admin)
+        Product.objects.create(
+            sku='SKU-1', product_name='Old name', description='...', price=1,
+            category=self.category, stock_quantity=1, image='sample.jpg',
+        )
+
+    def post(self, body, content_type, status_code=200):
+        response = self.client.post('/api/v1/products/bulk-import/', body, content_type=content_type)
+        self.assertEqual(response.status_code, status_code, response.content)
+        return response.json().get('data', {}).get('data')
+
+    def test_csv_rows_are_upserted_by_sku(self):
+        body = (
+            '﻿sku,product_name,price,category_id,stock_quantity\n'
+            f'SKU-1,New name,12.50,{self.category.pk},4\n'
+            f'SKU-2,Second,3,{self.category.pk},0\n'
+        ).encode('utf-8')
+
+        report = self.post(body, 'text/csv')
+
+        self.assertEqual((report['created'], report['updated'], report['failed']), (1, 1, 0))
+        updated = Product.objects.get(sku='SKU-1')
+        self.assertEqual((updated.product_name, updated.price, updated.stock_quantity), ('New name', 12.5, 4))
+        self.assertTrue(Product.objects.filter(sku='SKU-2', stock_quantity=0).exists())
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.product_count, 2)
+
+    def test_ndjson_reports_errors_per_row(self):
+        lines = [
+            {'sku': 'SKU-3', 'product_name': 'Ok', 'price': '2', 'category_id': self.category.pk, 'stock_quantity': 1},
+            {'sku': 'SKU-4', 'product_name': 'No price', 'category_id': self.category.pk, 'stock_quantity': 1},
+            {'sku': 'SKU-5', 'product_name': 'Bad category', 'price': '2', 'category_id': 999999, 'stock_quantity': 1},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines[:2]) + '\n{not json\n\n' + json.dumps(lines[2]) + '\n'
+
+        report = self.post(body.encode('utf-8'), 'application/x-ndjson')
+
+        self.assertEqual((report['created'], report['updated'], report['failed']), (1, 0, 3))
+        errors = {error['row']: error for error in report['errors']}
+        self.assertEqual(set(errors), {2, 3, 4})
+        self.assertIn('price', errors[2]['errors'])
+        self.assertEqual(errors[4]['sku'], 'SKU-5')
+        self.assertIn('category_id', errors[4]['errors'])
+        self.assertEqual(list(Product.objects.filter(sku__startswith='SKU-').values_list('sku', flat=True)
+                              .order_by('sku')), ['SKU-1', 'SKU-3'])
+
+    def test_malformed_csv_is_reported_per_row(self):
+        body = (
+            b'sku,product_name,price,category_id,stock_quantity\n'
+            b'SKU-6,Caf\xe9,1,' + str(self.category.pk).encode() + b',1\n'
+            b'SKU-7,Nul\x00byte,1,' + str(self.category.pk).encode() + b',1\n'
+            b'SKU-8,Fine,1,' + str(self.category.pk).encode() + b',1\n'
+        )
+
+        report = self.post(body, 'text/csv')
+
+        self.assertEqual((report['created'], report['failed']), (1, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [1, 2])
+        self.assertIn('utf-8', report['errors'][0]['errors']['non_field_errors'][0])
+        self.assertTrue(Product.objects.filter(sku='SKU-8').exists())
+
+    def test_unsupported_media_type(self):
+        self.post(b'{}', 'application/json', status_code=415)
+
+    def test_invalid_csv_header_rejects_the_whole_request(self):
+        row = f'SKU-9,Name,1,{self.category.pk},1\n'.encode()
+        cases = [
+            (b'sk\xffu,product_name,price,category_id,stock_quantity\n' + row, 'not valid UTF-8'),
+            (b'', 'header is missing'),
+            (b'sku,product_name,category_id\n' + row, 'missing required columns: price, stock_quantity'),
+        ]
+        for body, message in cases:
+            with self.subTest(message=message):
+                response = self.client.post('/api/v1/products/bulk-import/', body, content_type='text/csv')
+                self.assertEqual(response.status_code, 400, response.content)
+                self.assertIn(message, response.json()['message'])
+        self.assertFalse(Product.objects.filter(sku='SKU-9').exists())
+
+
+class BulkStockAdjustTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first, self.second = self.create_products(2, stock_quantity=5)
+
+    def stock(self):
+        return dict(Product.objects.values_list('pk', 'stock_quantity'))
+
+    def test_applies_merged_deltas_and_rejects_the_rest(self):
+        from apps.products.stock import bulk_adjust_stock
+
+        result = bulk_adjust_stock([
+            (self.first.pk, -3), (self.first.pk, 1), (self.second.pk, -6), (999999, 2),
+        ])
+
+        self.assertEqual(result['updated'], {self.first.pk: 3})
+        self.assertEqual(sorted(result['rejected'], key=lambda row: row['product_id']), [
+            {'product_id': self.second.pk, 'delta': -6, 'reason': 'insufficient_stock', 'stock_quantity': 5},
+            {'product_id': 999999, 'delta': 2, 'reason': 'not_found', 'stock_quantity': None},
+        ])
+        self.assertEqual(self.stock(), {self.first.pk: 3, self.second.pk: 5})
+
+    def test_rows_are_locked_in_id_order_before_the_update(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from apps.products.stock import bulk_adjust_stock
+
+        with CaptureQueriesContext(connection) as queries:
+            bulk_adjust_stock([(self.second.pk, 1), (self.first.pk, 1)])
+        statements = [query['sql'] for query in queries.captured_queries if 'products_product' in query['sql']]
+        self.assertIn('FOR UPDATE', statements[0])
+        self.assertIn('ORDER BY 1 ASC FOR UPDATE', statements[0])
+        self.assertTrue(statements[1].startswith('UPDATE'))
+
+        with CaptureQueriesContext(connection) as queries:
+            bulk_adjust_stock([(self.first.pk, 1)], lock_rows=False)
+        self.assertFalse([query for query in queries.captured_queries if 'FOR UPDATE' in query['sql']])
+
+    def test_endpoint_is_admin_only_and_reports_rejections(self):
+        from apps.users.models import User
+
+        payload = {'items': [{'product_id': self.first.pk, 'delta': 4}, {'product_id': self.second.pk, 'delta': -9}]}
+        response = self.client.post('/api/v1/products/stock-adjust/', payload, format='json')
+        self.assertIn(response.status_code, (401, 403))
+
+        self.client.force_authenticate(User.objects.create_user('admin', 'admin@example.com', 'password', role='admin'))
+        response = self.client.post('/api/v1/products/stock-adjust/', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()['data']['data']
+        self.assertEqual(data['updated'], [{'product_id': self.first.pk, 'stock_quantity': 9}])
+        self.assertEqual([row['reason'] for row in data['rejected']], ['insufficient_stock'])
+        self.assertEqual(self.stock(), {self.first.pk: 9, self.second.pk: 5})
+
+        response = self.client.post('/api/v1/products/stock-adjust/', {'items': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_deltas_outside_the_integer_range_are_rejected(self):
+        from apps.products.stock import MAX_STOCK_QUANTITY, bulk_adjust_stock
+        from apps.users.models import User
+
+        self.client.force_authenticate(User.objects.create_user('admin', 'admin@example.com', 'password', role='admin'))
+        for delta in (MAX_STOCK_QUANTITY + 1, -MAX_STOCK_QUANTITY - 1, 10 ** 20):
+            with self.subTest(delta=delta):
+                payload = {'items': [{'product_id': self.first.pk, 'delta': delta}]}
+                response = self.client.post('/api/v1/products/stock-adjust/', payload, format='json')
+                self.assertEqual(response.status_code, 400, response.content)
+
+        # Delta hợp lệ nhưng tổng vượt giới hạn cột: bị từ chối thay vì lỗi DataError
+        result = bulk_adjust_stock([(self.first.pk, MAX_STOCK_QUANTITY), (self.first.pk, MAX_STOCK_QUANTITY)])
+        self.assertEqual([row['reason'] for row in result['rejected']], ['stock_overflow'])
+        result = bulk_adjust_stock([(self.second.pk, MAX_STOCK_QUANTITY - 5)])
+        self.assertEqual(result['updated'], {self.second.pk: MAX_STOCK_QUANTITY})
+        self.assertEqual(self.stock(), {self.first.pk: 5, self.second.pk: MAX_STOCK_QUANTITY})
@@ -1,18 +1,64 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, Q
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
 
-from apps.products.models import Product, Category
+from apps.products.cache import catalog_validators, get_or_build
+from apps.products.facets import compute_facets
+from apps.products.importers import (
+    CSV_MEDIA_TYPE, NDJSON_MEDIA_TYPES, ImportFormatError, import_products, iter_csv_rows, iter_ndjson_rows,
+)
+from apps.products.models import Product, Category, SEARCH_CONFIG
 from apps.products.permissions import IsAdminOrReadOnly
+from config.idempotency import IdempotentCreateMixin
+from config.pagination import KeysetPagination
 from config.renderers import CustomResponseRenderer
-from apps.products.serializers import ProductSerializer, CategorySerializer
+from apps.products.serializers import (
+    ProductSerializer, CategorySerializer, ProductSearchSerializer, ProductFilterSerializer,
+    StockAdjustmentSerializer,
+)
+from apps.products.stock import bulk_adjust_stock
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiParameter
 
 
+class CatalogConditionalGetMixin:
+    """
+    Hỗ trợ conditional GET (ETag / Last-Modified) dựa trên catalog version.
+    Nếu client đã có bản mới nhất thì trả 304 ngay, không truy vấn DB,
+    không serialize và không render qua CustomResponseRenderer.
+
+    Chỉ ETag quyết định 304: Last-Modified chỉ chính xác đến giây nên hai lần
+    ghi trong cùng một giây sẽ làm If-Modified-Since trả về bản cũ.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+
+        etag, last_modified = catalog_validators(request)
+        if etag is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
 @extend_schema(tags=["Products"])
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CatalogConditionalGetMixin, IdempotentCreateMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     pagination_class = PageNumberPagination
@@ -71,28 +117,90 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 @extend_schema(tags=["Products"])
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogConditionalGetMixin, IdempotentCreateMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = KeysetPagination
     renderer_classes = [CustomResponseRenderer]
     permission_classes = [IsAdminOrReadOnly]
     parser_classes = [MultiPartParser, FormParser]
+    idempotent_actions = ('create', 'stock_adjust')
 
     def get_queryset(self):
+        queryset = super().get_queryset()
         category_pk = self.kwargs.get('category_pk')
         if category_pk:
             category = get_object_or_404(Category, pk=category_pk)
-            return Product.objects.filter(category=category)
-        return super().get_queryset()
+            queryset = Product.objects.filter(category=category)
+        if self.request.method in ('GET', 'HEAD'):
+            # Chỉ đọc các cột ứng với field client yêu cầu (?fields= / ?omit=)
+            queryset = ProductSerializer.sparse_queryset(
+                queryset, self.request, always=('id', 'created_at')
+            )
+        return queryset
+
+    def filter_conditions(self, params) -> dict:
+        """
+        Điều kiện lọc đã validate theo từng nhóm facet: 'category', 'price', 'availability'.
+        """
+        conditions = {'category': Q(), 'price': Q(), 'availability': Q()}
+        if params.get('category_id') is not None:
+            conditions['category'] = Q(category_id=params['category_id'])
+        if params.get('min_price') is not None:
+            conditions['price'] &= Q(price__gte=params['min_price'])
+        if params.get('max_price') is not None:
+            conditions['price'] &= Q(price__lte=params['max_price'])
+        if params.get('in_stock') is not None:
+            conditions['availability'] = Q(stock_quantity__gt=0) if params['in_stock'] else Q(stock_quantity=0)
+        return conditions
+
+    def filter_products(self, queryset, params):
+        """
+        Áp dụng các bộ lọc đã validate (danh mục, khoảng giá, còn hàng) lên queryset.
+        """
+        conditions = [condition for condition in self.filter_conditions(params).values() if condition]
+        return queryset.filter(*conditions) if conditions else queryset
+
+    def build_list_payload(self, request):
+        """
+        Lọc, phân trang và đính kèm facet cho danh sách sản phẩm.
+        """
+        params_serializer = ProductFilterSerializer(data=request.query_params)
+        params_serializer.is_valid(raise_exception=True)
+        params = params_serializer.validated_data
+        conditions = self.filter_conditions(params)
+        # Mỗi nhóm facet không bị thu hẹp bởi chính bộ lọc của nhóm đó (disjunctive)
+        facet_queryset = self.filter_queryset(self.get_queryset())
+        queryset = self.filter_products(facet_queryset, params)
+
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            payload = {'results': self.get_serializer(queryset, many=True).data}
+        else:
+            payload = self.get_paginated_response(self.get_serializer(page, many=True).data).data
+        payload['facets'] = compute_facets(
+            facet_queryset, params.get('category_id'),
+            price_filter=conditions['price'], availability_filter=conditions['availability'],
+        )
+        return payload
 
     @extend_schema(
         summary="Danh sách sản phẩm",
-        description="Lấy danh sách toàn bộ sản phẩm, có phân trang",
+        description="Lấy danh sách toàn bộ sản phẩm, có phân trang, lọc theo danh mục, "
+                    "khoảng giá, còn hàng; kèm facet trong meta. "
+                    "Gửi ?cursor= (để trống ở trang đầu) để dùng phân trang theo cursor. "
+                    "Dùng ?fields= / ?omit= (phân tách bằng dấu phẩy) để chọn field trả về.",
         responses={200: ProductSerializer(many=True)},
+        parameters=[
+            ProductFilterSerializer,
+            OpenApiParameter(name="cursor", type=str, location=OpenApiParameter.QUERY),
+            OpenApiParameter(name="fields", type=str, location=OpenApiParameter.QUERY),
+            OpenApiParameter(name="omit", type=str, location=OpenApiParameter.QUERY),
+        ]
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        data = get_or_build('list', request.get_full_path(), lambda: self.build_list_payload(request))
+        return Response(data)
 
     @extend_schema(
         summary="Chi tiết sản phẩm",
@@ -100,7 +208,11 @@ class ProductViewSet(viewsets.ModelViewSet):
         responses={200: ProductSerializer}
     )
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+        data = get_or_build(
+            'detail', request.get_full_path(),
+            lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs).data
+        )
+        return Response(data)
 
     @extend_schema(
         summary="Tạo sản phẩm mới",
@@ -143,3 +255,82 @@ class ProductViewSet(viewsets.ModelViewSet):
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
 
+    @extend_schema(
+        summary="Tìm kiếm sản phẩm",
+        description="Tìm kiếm full-text theo tên và mô tả sản phẩm, sắp xếp theo độ liên quan. "
+                    "Có thể kết hợp lọc theo danh mục và khoảng giá.",
+        parameters=[ProductSearchSerializer],
+        responses={200: ProductSerializer(many=True)}
+    )
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request, *args, **kwargs):
+        params_serializer = ProductSearchSerializer(data=request.query_params)
+        params_serializer.is_valid(raise_exception=True)
+        params = params_serializer.validated_data
+
+        query = SearchQuery(params['q'], search_type='websearch', config=SEARCH_CONFIG)
+        queryset = self.filter_products(self.get_queryset(), params)
+        queryset = queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-id')
+
+        # Kết quả xếp theo độ liên quan nên luôn phân trang theo số trang
+        paginator = PageNumberPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @extend_schema(
+        summary="Import sản phẩm hàng loạt",
+        description="Admin gửi body CSV (text/csv, có header) hoặc NDJSON (application/x-ndjson). "
+                    "Các dòng được upsert theo sku theo từng lô; ảnh (image_url) được upload nền. "
+                    "Trả về số dòng tạo mới/cập nhật và lỗi của từng dòng.",
+        request={CSV_MEDIA_TYPE: OpenApiTypes.STR, NDJSON_MEDIA_TYPES[0]: OpenApiTypes.STR},
+        responses={200: OpenApiResponse(description="Import report")}
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-import')
+    def bulk_import(self, request, *args, **kwargs):
+        # Đọc trực tiếp luồng body theo dòng thay vì qua parser để không nạp cả file vào bộ nhớ
+        media_type = request.content_type.split(';')[0].strip().lower()
+        if media_type == CSV_MEDIA_TYPE:
+            try:
+                rows = iter_csv_rows(request._request)
+            except ImportFormatError as exc:
+                return Response({'message': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        elif media_type in NDJSON_MEDIA_TYPES:
+            rows = iter_ndjson_rows(request._request)
+        else:
+            return Response({
+                'message': f"Unsupported media type '{media_type}'. Use text/csv or application/x-ndjson."
+            }, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        report = import_products(rows)
+        return Response({
+            'message': 'Products imported',
+            'data': report.as_dict()
+        }, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        summary="Điều chỉnh tồn kho hàng loạt",
+        description="Admin gửi danh sách (product_id, delta). Tất cả được áp dụng bằng một câu UPDATE; "
+                    "các dòng làm tồn kho âm hoặc sản phẩm không tồn tại bị từ chối và trả về trong 'rejected'.",
+        request=StockAdjustmentSerializer,
+        responses={200: OpenApiResponse(description="Updated stock and rejected rows")}
+    )
+    @action(detail=False, methods=['post'], url_path='stock-adjust', parser_classes=[JSONParser])
+    def stock_adjust(self, request, *args, **kwargs):
+        serializer = StockAdjustmentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = bulk_adjust_stock(
+            (item['product_id'], item['delta']) for item in serializer.validated_data['items']
+        )
+        return Response({
+            'message': 'Stock adjusted',
+            'data': {
+                'updated': [
+                    {'product_id': product_id, 'stock_quantity': stock}
+                    for product_id, stock in result['updated'].items()
+                ],
+                'rejected': result['rejected'],
+            }
+        }, status=status.HTTP_200_OK)
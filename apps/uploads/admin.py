@@ -0,0 +1,6 @@
+from django.contrib import admin
+
+from apps.uploads.models import UploadTask
+
+# Register your models here.
+admin.site.register(UploadTask)
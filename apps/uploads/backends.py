@@ -0,0 +1,61 @@
+"""
+Backend lưu trữ cho worker upload. Chọn backend qua settings.UPLOAD_BACKEND.
+"""
+import shutil
+import urllib.parse
+import urllib.request
+import uuid
+from pathlib import Path
+
+from cloudinary import uploader
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BaseUploadBackend:
+    """
+    Đẩy `source` (đường dẫn file cục bộ hoặc URL) lên storage và trả về
+    giá trị sẽ lưu vào field của model.
+    """
+
+    def upload(self, source: str, field) -> str:
+        raise NotImplementedError
+
+
+class CloudinaryUploadBackend(BaseUploadBackend):
+    """
+    Upload lên Cloudinary; Cloudinary nhận được cả file cục bộ lẫn URL.
+    """
+
+    def upload(self, source, field):
+        options = {'type': field.type, 'resource_type': field.resource_type}
+        options.update(field.options)
+        return uploader.upload_resource(source, **options).get_prep_value()
+
+
+class LocalFileSystemUploadBackend(BaseUploadBackend):
+    """
+    Lưu file vào thư mục settings.UPLOAD_LOCAL_ROOT.
+    Dùng cho môi trường dev/test không có kết nối tới Cloudinary.
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or settings.UPLOAD_LOCAL_ROOT)
+
+    def upload(self, source, field):
+        scheme = urllib.parse.urlsplit(source).scheme
+        if scheme and scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported upload source scheme: {scheme}")
+        name = f"{field.name}/{uuid.uuid4().hex}{Path(source.split('?')[0]).suffix}"
+        destination = self.root / name
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        if scheme:
+            with urllib.request.urlopen(source, timeout=30) as response, open(destination, 'wb') as out:
+                shutil.copyfileobj(response, out)
+        else:
+            shutil.copyfile(source, destination)
+        return name
+
+
+def get_upload_backend() -> BaseUploadBackend:
+    return import_string(settings.UPLOAD_BACKEND)()
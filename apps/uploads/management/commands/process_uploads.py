@@ -0,0 +1,28 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.uploads.services import process_pending_uploads
+
+
+class Command(BaseCommand):
+    help = 'Run the background worker that pushes pending uploads to the storage backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process one batch and exit')
+        parser.add_argument('--batch-size', type=int, default=settings.UPLOAD_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Upload worker started')
+        try:
+            while True:
+                processed = process_pending_uploads(options['batch_size'])
+                if options['once']:
+                    self.stdout.write(f'Processed {processed} upload tasks')
+                    return
+                if not processed:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Upload worker stopped')
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 21:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("uploads", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="uploadtask",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("processing", "Processing"),
+                    ("done", "Done"),
+                    ("failed", "Failed"),
+                    ("superseded", "Superseded"),
+                ],
+                default="pending",
+                max_length=20,
+            ),
+        ),
+    ]
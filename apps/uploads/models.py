@@ -0,0 +1,60 @@
+"""
+Models cho việc upload file bất đồng bộ (ảnh sản phẩm, avatar).
+"""
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.utils import timezone
+
+
+class UploadStatus(models.TextChoices):
+    """
+    Trạng thái file của một bản ghi (vd. Product.image_status).
+    """
+    PENDING = 'pending', 'Pending'
+    READY = 'ready', 'Ready'
+    FAILED = 'failed', 'Failed'
+
+
+class UploadTaskStatus(models.TextChoices):
+    """
+    Trạng thái của một tác vụ upload trong hàng đợi.
+    """
+    PENDING = 'pending', 'Pending'
+    PROCESSING = 'processing', 'Processing'
+    DONE = 'done', 'Done'
+    FAILED = 'failed', 'Failed'
+    # Đã có tác vụ mới hơn cho cùng field của cùng bản ghi
+    SUPERSEDED = 'superseded', 'Superseded'
+
+
+class UploadTask(models.Model):
+    """
+    Một file chờ được đẩy lên storage cho field `field_name` của một bản ghi.
+    `source` là đường dẫn file tạm trên máy hoặc URL ảnh từ xa.
+    id tăng dần đóng vai trò số thứ tự: tác vụ có id lớn hơn là bản mới hơn.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    target = GenericForeignKey('content_type', 'object_id')
+    field_name = models.CharField(max_length=100)
+    source = models.TextField()
+    status = models.CharField(
+        max_length=20,
+        choices=UploadTaskStatus.choices,
+        default=UploadTaskStatus.PENDING,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='upload_task_due_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"Upload {self.content_type.model}#{self.object_id}.{self.field_name} ({self.status})"
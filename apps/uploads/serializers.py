@@ -0,0 +1,35 @@
+from apps.uploads.services import enqueue_upload, stage_file
+
+
+class DeferredUploadMixin:
+    """
+    Mixin cho ModelSerializer: các field file trong `deferred_upload_fields`
+    không được upload trong request mà được lưu tạm và đưa vào hàng đợi,
+    bản ghi được lưu ngay với trạng thái pending.
+    """
+    deferred_upload_fields = ()
+
+    def _pop_deferred_files(self, validated_data):
+        return {
+            field_name: validated_data.pop(field_name)
+            for field_name in self.deferred_upload_fields
+            if validated_data.get(field_name)
+        }
+
+    def _enqueue_deferred_files(self, instance, files):
+        for field_name, uploaded_file in files.items():
+            enqueue_upload(instance, field_name, stage_file(uploaded_file))
+
+    def create(self, validated_data):
+        files = self._pop_deferred_files(validated_data)
+        for field_name in self.deferred_upload_fields:
+            validated_data.setdefault(field_name, '')
+        instance = super().create(validated_data)
+        self._enqueue_deferred_files(instance, files)
+        return instance
+
+    def update(self, instance, validated_data):
+        files = self._pop_deferred_files(validated_data)
+        instance = super().update(instance, validated_data)
+        self._enqueue_deferred_files(instance, files)
+        return instance
@@ -0,0 +1,205 @@
+"""
+Hàng đợi upload: nhận file vào thư mục tạm, ghi tác vụ vào DB và để worker
+(`manage.py process_uploads`) đẩy lên storage, có retry với backoff.
+"""
+import logging
+import os
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from apps.uploads.backends import get_upload_backend
+from apps.uploads.models import UploadStatus, UploadTask, UploadTaskStatus
+
+logger = logging.getLogger(__name__)
+
+
+def status_field_name(field_name: str) -> str:
+    """
+    Field trạng thái đi kèm field file, vd. image -> image_status.
+    """
+    return f"{field_name}_status"
+
+
+def stage_file(uploaded_file) -> str:
+    """
+    Ghi file client gửi lên vào thư mục tạm và trả về đường dẫn.
+    """
+    temp_dir = Path(settings.UPLOAD_TEMP_DIR)
+    temp_dir.mkdir(parents=True, exist_ok=True)
+    path = temp_dir / f"{uuid.uuid4().hex}{Path(uploaded_file.name).suffix}"
+    with open(path, 'wb') as out:
+        for chunk in uploaded_file.chunks():
+            out.write(chunk)
+    return str(path)
+
+
+def enqueue_uploads(model, field_name: str, sources) -> int:
+    """
+    Tạo tác vụ upload cho nhiều bản ghi cùng model từ các cặp (pk, source)
+    và đánh dấu các bản ghi đó đang chờ upload.
+    """
+    sources = list(sources)
+    if not sources:
+        return 0
+    content_type = ContentType.objects.get_for_model(model)
+    with transaction.atomic():
+        # Tác vụ cũ chưa chạy của cùng field bị thay thế; tác vụ đang chạy được
+        # bỏ qua lúc hoàn tất (xem _is_superseded)
+        superseded = UploadTask.objects.filter(
+            content_type=content_type, field_name=field_name,
+            object_id__in=[pk for pk, _ in sources], status=UploadTaskStatus.PENDING,
+        )
+        stale_sources = list(superseded.values_list('source', flat=True))
+        superseded.update(status=UploadTaskStatus.SUPERSEDED, updated_at=timezone.now())
+        transaction.on_commit(lambda: [_discard_staged_file(source) for source in stale_sources])
+        UploadTask.objects.bulk_create([
+            UploadTask(content_type=content_type, object_id=pk, field_name=field_name, source=source)
+            for pk, source in sources
+        ])
+        model.objects.filter(pk__in=[pk for pk, _ in sources]).update(
+            **{status_field_name(field_name): UploadStatus.PENDING}
+        )
+    return len(sources)
+
+
+def enqueue_upload(instance, field_name: str, source: str) -> None:
+    enqueue_uploads(type(instance), field_name, [(instance.pk, source)])
+    setattr(instance, status_field_name(field_name), UploadStatus.PENDING)
+
+
+def claim_tasks(batch_size: int):
+    """
+    Lấy một lô tác vụ đến hạn và chuyển sang PROCESSING.
+    SKIP LOCKED cho phép chạy nhiều worker song song; tác vụ PROCESSING quá
+    lâu (worker chết giữa chừng) được lấy lại.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.UPLOAD_PROCESSING_TIMEOUT)
+    with transaction.atomic():
+        tasks = list(
+            UploadTask.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=UploadTaskStatus.PENDING, next_attempt_at__lte=now)
+                | Q(status=UploadTaskStatus.PROCESSING, updated_at__lt=stale_before)
+            )
+            .select_related('content_type')
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        UploadTask.objects.filter(pk__in=[task.pk for task in tasks]).update(
+            status=UploadTaskStatus.PROCESSING, updated_at=now
+        )
+    return tasks
+
+
+class _Superseded(Exception):
+    pass
+
+
+def _is_superseded(task) -> bool:
+    return UploadTask.objects.filter(
+        content_type_id=task.content_type_id, object_id=task.object_id,
+        field_name=task.field_name, pk__gt=task.pk,
+    ).exists()
+
+
+def _set_target_field(task, value, status):
+    """
+    Ghi kết quả vào bản ghi đích; trả về False nếu bản ghi không còn, ném
+    _Superseded nếu đã có tác vụ mới hơn cho cùng field.
+    """
+    model = task.content_type.model_class()
+    with transaction.atomic():
+        # enqueue_uploads cũng cập nhật dòng này trong transaction của nó, nên
+        # khóa dòng trước khi kiểm tra thì tác vụ mới hơn không thể chen vào giữa
+        instance = model.objects.select_for_update().filter(pk=task.object_id).first()
+        if instance is None:
+            return False
+        if _is_superseded(task):
+            raise _Superseded
+        update_fields = [status_field_name(task.field_name)]
+        if value is not None:
+            setattr(instance, task.field_name, value)
+            update_fields.append(task.field_name)
+        setattr(instance, status_field_name(task.field_name), status)
+        # Dùng save() để các signal (vd. vô hiệu hóa cache danh mục) vẫn chạy
+        instance.save(update_fields=update_fields)
+    return True
+
+
+def _discard_staged_file(source):
+    temp_dir = os.path.abspath(settings.UPLOAD_TEMP_DIR)
+    path = os.path.abspath(source)
+    if os.path.commonpath([temp_dir, path]) == temp_dir and os.path.exists(path):
+        os.remove(path)
+
+
+def _supersede(task):
+    logger.info(f"Upload task {task.pk} superseded by a newer upload, discarding its result")
+    task.status = UploadTaskStatus.SUPERSEDED
+    task.save(update_fields=['status', 'updated_at'])
+    _discard_staged_file(task.source)
+
+
+def process_task(task, backend) -> bool:
+    """
+    Upload một tác vụ. Lỗi thì hẹn giờ thử lại theo exponential backoff,
+    quá số lần cho phép thì đánh dấu FAILED. Tác vụ xong sau một tác vụ mới
+    hơn của cùng field không ghi đè kết quả của tác vụ mới.
+    """
+    model = task.content_type.model_class()
+    field = model._meta.get_field(task.field_name)
+    try:
+        value = backend.upload(task.source, field)
+    except Exception as exc:
+        if _is_superseded(task):
+            _supersede(task)
+            return False
+        task.attempts += 1
+        task.last_error = str(exc)
+        if task.attempts >= settings.UPLOAD_MAX_ATTEMPTS:
+            try:
+                _set_target_field(task, None, UploadStatus.FAILED)
+            except _Superseded:
+                # Lỗi của bản cũ không được đánh dấu FAILED lên bản mới hơn
+                _supersede(task)
+                return False
+            logger.exception(f"Upload task {task.pk} failed permanently")
+            task.status = UploadTaskStatus.FAILED
+            _discard_staged_file(task.source)
+        else:
+            delay = settings.UPLOAD_RETRY_BACKOFF * (2 ** (task.attempts - 1))
+            logger.warning(f"Upload task {task.pk} failed (attempt {task.attempts}), retrying in {delay}s: {exc}")
+            task.status = UploadTaskStatus.PENDING
+            task.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        task.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'updated_at'])
+        return False
+
+    try:
+        applied = _set_target_field(task, value, UploadStatus.READY)
+    except _Superseded:
+        _supersede(task)
+        return False
+    if not applied:
+        logger.warning(f"Upload task {task.pk}: target {model.__name__}#{task.object_id} no longer exists")
+    task.status = UploadTaskStatus.DONE
+    task.save(update_fields=['status', 'updated_at'])
+    _discard_staged_file(task.source)
+    return True
+
+
+def process_pending_uploads(batch_size=None, backend=None) -> int:
+    """
+    Xử lý một lô tác vụ đến hạn; trả về số tác vụ đã lấy ra.
+    """
+    backend = backend or get_upload_backend()
+    tasks = claim_tasks(batch_size or settings.UPLOAD_BATCH_SIZE)
+    for task in tasks:
+        process_task(task, backend)
+    return len(tasks)
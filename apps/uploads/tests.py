@@ -0,0 +1,202 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from apps.products.models import Category, Product
+from apps.uploads.backends import LocalFileSystemUploadBackend
+from apps.uploads.models import UploadStatus, UploadTask, UploadTaskStatus
+from apps.uploads.services import claim_tasks, enqueue_upload, process_pending_uploads, process_task
+from apps.users.models import User
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def png_file(name='photo.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (2, 2), 'red').save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class FailingBackend:
+    def __init__(self):
+        self.calls = 0
+
+    def upload(self, source, field):
+        self.calls += 1
+        raise OSError('storage unavailable')
+
+
+class UploadTestMixin:
+    def setUp(self):
+        self.temp_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_root, ignore_errors=True)
+        overrides = override_settings(
+            CACHES=LOCMEM_CACHES,
+            UPLOAD_TEMP_DIR=os.path.join(self.temp_root, 'staged'),
+            UPLOAD_LOCAL_ROOT=os.path.join(self.temp_root, 'media'),
+            UPLOAD_BACKEND='apps.uploads.backends.LocalFileSystemUploadBackend',
+            UPLOAD_MAX_ATTEMPTS=2,
+            UPLOAD_RETRY_BACKOFF=10,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.category = Category.objects.create(category_name='Books')
+
+    def create_product(self):
+        return Product.objects.create(
+            product_name='Product', description='...', price=10,
+            category=self.category, stock_quantity=1, image='',
+        )
+
+    def staged_source(self, name='staged.png'):
+        path = Path(self.temp_root, 'staged', name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(png_file().read())
+        return str(path)
+
+
+class DeferredUploadTests(UploadTestMixin, TestCase):
+    def test_create_stages_the_file_and_returns_before_uploading(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('admin', 'admin@example.com', 'password', role='admin'))
+
+        response = client.post('/api/v1/products/', {
+            'product_name': 'Product', 'description': '...', 'price': '10.00', 'stock_quantity': 1,
+            'category_id': self.category.pk, 'image': png_file(),
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['data']['data']['image_status'], UploadStatus.PENDING)
+        task = UploadTask.objects.get()
+        self.assertEqual((task.field_name, task.status), ('image', UploadTaskStatus.PENDING))
+        self.assertTrue(Path(task.source).is_file())
+        self.assertEqual(Product.objects.get(pk=task.object_id).image_status, UploadStatus.PENDING)
+
+        self.assertEqual(process_pending_uploads(), 1)
+        product = Product.objects.get(pk=task.object_id)
+        self.assertEqual(product.image_status, UploadStatus.READY)
+        self.assertTrue(Path(self.temp_root, 'media', f'{product.image.public_id}.{product.image.format}').is_file())
+        self.assertFalse(Path(task.source).exists())
+        task.refresh_from_db()
+        self.assertEqual(task.status, UploadTaskStatus.DONE)
+
+
+class UploadRetryTests(UploadTestMixin, TestCase):
+    def test_failures_back_off_then_mark_the_target_failed(self):
+        product = self.create_product()
+        source = self.staged_source()
+        enqueue_upload(product, 'image', source)
+        backend = FailingBackend()
+
+        with self.assertLogs('apps.uploads.services', 'WARNING'):
+            self.assertEqual(process_pending_uploads(backend=backend), 1)
+        task = UploadTask.objects.get()
+        self.assertEqual((task.status, task.attempts), (UploadTaskStatus.PENDING, 1))
+        self.assertIn('storage unavailable', task.last_error)
+        self.assertGreater(task.next_attempt_at, timezone.now() + timedelta(seconds=5))
+        # Chưa đến hạn thử lại thì không được lấy ra
+        self.assertEqual(process_pending_uploads(backend=backend), 0)
+
+        UploadTask.objects.update(next_attempt_at=timezone.now())
+        with self.assertLogs('apps.uploads.services', 'ERROR'):
+            process_pending_uploads(backend=backend)
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, backend.calls), (UploadTaskStatus.FAILED, 2, 2))
+        product.refresh_from_db()
+        self.assertEqual(product.image_status, UploadStatus.FAILED)
+        self.assertFalse(Path(source).exists())
+
+    def test_stale_processing_tasks_are_claimed_again(self):
+        enqueue_upload(self.create_product(), 'image', self.staged_source())
+        self.assertEqual(len(claim_tasks(10)), 1)
+        self.assertEqual(claim_tasks(10), [])
+
+        with override_settings(UPLOAD_PROCESSING_TIMEOUT=0):
+            UploadTask.objects.update(updated_at=timezone.now() - timedelta(seconds=1))
+            self.assertEqual(len(claim_tasks(10)), 1)
+
+    def test_local_backend_copies_files_and_urls_keep_their_suffix(self):
+        backend = LocalFileSystemUploadBackend(root=os.path.join(self.temp_root, 'media'))
+        name = backend.upload(self.staged_source(), Product._meta.get_field('image'))
+        self.assertTrue(name.startswith('image/') and name.endswith('.png'))
+        self.assertTrue(Path(self.temp_root, 'media', name).is_file())
+
+    def test_local_backend_rejects_unsupported_schemes(self):
+        backend = LocalFileSystemUploadBackend(root=os.path.join(self.temp_root, 'media'))
+        with self.assertRaisesMessage(ValueError, 'ftp'):
+            backend.upload('ftp://example.com/photo.png', Product._meta.get_field('image'))
+        self.assertFalse(Path(self.temp_root, 'media').exists())
+
+
+class UploadOrderingTests(UploadTestMixin, TestCase):
+    def test_new_upload_supersedes_the_pending_one(self):
+        product = self.create_product()
+        old_source = self.staged_source('old.png')
+        enqueue_upload(product, 'image', old_source)
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue_upload(product, 'image', self.staged_source('new.png'))
+
+        old, new = UploadTask.objects.order_by('pk')
+        self.assertEqual((old.status, new.status), (UploadTaskStatus.SUPERSEDED, UploadTaskStatus.PENDING))
+        self.assertFalse(Path(old_source).exists())
+        self.assertEqual(process_pending_uploads(), 1)
+
+    def test_older_task_finishing_late_does_not_overwrite_the_newer_upload(self):
+        product = self.create_product()
+        enqueue_upload(product, 'image', self.staged_source('old.png'))
+        [old] = claim_tasks(10)
+        enqueue_upload(product, 'image', self.staged_source('new.png'))
+        self.assertEqual(process_pending_uploads(), 1)
+        product.refresh_from_db()
+        image = str(product.image)
+
+        with self.assertLogs('apps.uploads.services', 'INFO'):
+            self.assertFalse(process_task(old, LocalFileSystemUploadBackend()))
+        old.refresh_from_db()
+        self.assertEqual(old.status, UploadTaskStatus.SUPERSEDED)
+        product.refresh_from_db()
+        self.assertEqual((str(product.image), product.image_status), (image, UploadStatus.READY))
+
+
+class UploadClaimConcurrencyTests(UploadTestMixin, TransactionTestCase):
+    def test_rows_locked_by_another_worker_are_skipped(self):
+        first = self.create_product()
+        second = self.create_product()
+        enqueue_upload(first, 'image', self.staged_source())
+        enqueue_upload(second, 'image', self.staged_source())
+        locked_task = UploadTask.objects.get(object_id=first.pk)
+
+        locked, release = threading.Event(), threading.Event()
+
+        def other_worker():
+            try:
+                with transaction.atomic():
+                    list(UploadTask.objects.select_for_update().filter(pk=locked_task.pk))
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            claimed = claim_tasks(10)
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual([task.object_id for task in claimed], [second.pk])
+        self.assertEqual(UploadTask.objects.get(pk=locked_task.pk).status, UploadTaskStatus.PENDING)
+        self.assertEqual([task.object_id for task in claim_tasks(10)], [first.pk])
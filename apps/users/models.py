@@ -6,6 +6,8 @@ from cloudinary.models import CloudinaryField
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from apps.uploads.models import UploadStatus
+
 
 class User(AbstractUser):
     """
@@ -36,6 +38,9 @@ class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     phone = models.CharField(max_length=11, unique=True)
     avatar = CloudinaryField('avatar')
+    avatar_status = models.CharField(
+        max_length=20, choices=UploadStatus.choices, default=UploadStatus.READY
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -3,6 +3,7 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model, authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from apps.users.models import Profile, Address
+from apps.uploads.serializers import DeferredUploadMixin
 from django.contrib.auth.models import update_last_login
 
 User = get_user_model()
@@ -16,21 +17,22 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 'role')
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(DeferredUploadMixin, serializers.ModelSerializer):
     """
-    Serializer cho model Profile.
+    Serializer cho model Profile. Avatar được upload nền.
     """
+    deferred_upload_fields = ('avatar',)
     avatar = serializers.ImageField(required=False)
     user = UserSerializer(read_only=True)
 
     class Meta:
         model = Profile
-        fields = ('id', 'user', 'phone', 'avatar', 'created_at', 'updated_at')
-        read_only_fields = ('created_at', 'updated_at')
+        fields = ('id', 'user', 'phone', 'avatar', 'avatar_status', 'created_at', 'updated_at')
+        read_only_fields = ('avatar_status', 'created_at', 'updated_at')
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
-        return Profile.objects.create(**validated_data)
+        return super().create(validated_data)
 
 
 class AddressSerializer(serializers.ModelSerializer):
@@ -14,6 +14,7 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from config import settings
+from config.idempotency import IdempotentCreateMixin
 from config.renderers import CustomResponseRenderer
 from .models import Address, Profile
 from .permissions import IsOwnerOrReadOnly, IsAdminOrReadOnly
@@ -176,7 +177,7 @@ class UserViewSet(viewsets.ModelViewSet):
     renderer_classes = [CustomResponseRenderer]
 
 @extend_schema(tags=["Users"])
-class ProfileViewSet(viewsets.ModelViewSet):
+class ProfileViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     """ViewSet for Profile"""
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
@@ -195,7 +196,7 @@ class ProfileViewSet(viewsets.ModelViewSet):
         return self.queryset.filter(user=user)
 
 @extend_schema(tags=["Users"])
-class AddressViewSet(viewsets.ModelViewSet):
+class AddressViewSet(IdempotentCreateMixin, viewsets.ModelViewSet):
     """ViewSet for Address"""
     queryset = Address.objects.all()
     serializer_class = AddressSerializer
@@ -0,0 +1,173 @@
+"""
+Hỗ trợ header `Idempotency-Key` cho các action tạo mới (POST).
+
+Lần gọi đầu tiên với một key sẽ giữ một lock ngắn trên Redis, xử lý request
+rồi lưu fingerprint của request cùng response đã render (chỉ khi 2xx) với TTL.
+Client gửi lại cùng key và cùng nội dung sẽ nhận lại đúng response đã lưu mà
+không tạo thêm bản ghi hay sự kiện Kafka. Request trùng đến đồng thời sẽ chờ
+request đầu tiên xong thay vì xử lý song song.
+"""
+import hashlib
+import json
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import UploadedFile
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Một request với Idempotency-Key này vẫn đang được xử lý, vui lòng thử lại sau.'
+    default_code = 'idempotency_conflict'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'Idempotency-Key đã được dùng cho một request có nội dung khác.'
+    default_code = 'idempotency_key_reused'
+
+
+class _Replay(Exception):
+    def __init__(self, record):
+        super().__init__()
+        self.record = record
+
+
+def _encode_value(value):
+    if isinstance(value, UploadedFile):
+        digest = hashlib.sha256()
+        for chunk in value.chunks():
+            digest.update(chunk)
+        value.seek(0)
+        return f"file:{value.name}:{digest.hexdigest()}"
+    return str(value)
+
+
+def request_fingerprint(request) -> str:
+    """
+    Băm method, đường dẫn và dữ liệu đã parse (kể cả nội dung file upload).
+    """
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps(
+        [request.method, request.get_full_path(), data], sort_keys=True, default=_encode_value
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _replay_response(record):
+    response = HttpResponse(
+        record['content'], status=record['status'], content_type=record['content_type']
+    )
+    for name, value in record['headers'].items():
+        response[name] = value
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+class IdempotentCreateMixin:
+    """
+    Mixin cho ViewSet: các action trong `idempotent_actions` chấp nhận header
+    Idempotency-Key. Key được tách theo user và theo view nên hai user (hoặc
+    hai endpoint) dùng trùng key không ảnh hưởng nhau.
+    """
+    idempotent_actions = ('create',)
+    replayed_headers = ('Location',)
+
+    def initial(self, request, *args, **kwargs):
+        self._idempotency = None
+        super().initial(request, *args, **kwargs)
+        if getattr(self, 'action', None) not in self.idempotent_actions:
+            return
+        key = request.META.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            raise ValidationError({'Idempotency-Key': f'Tối đa {MAX_KEY_LENGTH} ký tự.'})
+        self._begin_idempotent_request(request, key)
+
+    def get_idempotency_cache_key(self, request, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        user_id = request.user.pk if request.user.is_authenticated else 'anon'
+        return f"idempotency:{self.__class__.__name__}:{self.action}:{user_id}:{digest}"
+
+    def _begin_idempotent_request(self, request, key):
+        cache_key = self.get_idempotency_cache_key(request, key)
+        lock_key = f"{cache_key}:lock"
+        fingerprint = request_fingerprint(request)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+
+        try:
+            while True:
+                record = cache.get(cache_key)
+                if record is not None:
+                    if record['fingerprint'] != fingerprint:
+                        raise IdempotencyKeyReused()
+                    raise _Replay(record)
+                if cache.add(lock_key, token, timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+                    # Request trước có thể vừa lưu xong ngay trước khi nhả lock
+                    record = cache.get(cache_key)
+                    if record is not None:
+                        cache.delete(lock_key)
+                        continue
+                    break
+                if time.monotonic() >= deadline:
+                    raise IdempotencyConflict()
+                time.sleep(settings.IDEMPOTENCY_POLL_INTERVAL)
+        except (_Replay, APIException):
+            raise
+        except Exception:
+            # Redis lỗi: vẫn xử lý request như bình thường
+            logger.exception("Idempotency store unavailable")
+            return
+
+        self._idempotency = {
+            'cache_key': cache_key,
+            'lock_key': lock_key,
+            'token': token,
+            'fingerprint': fingerprint,
+        }
+
+    def handle_exception(self, exc):
+        if isinstance(exc, _Replay):
+            return _replay_response(exc.record)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        state = getattr(self, '_idempotency', None)
+        if state is None:
+            return response
+        self._idempotency = None
+        try:
+            if status.is_success(response.status_code):
+                response.render()
+                cache.set(state['cache_key'], {
+                    'fingerprint': state['fingerprint'],
+                    'status': response.status_code,
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                    'headers': {
+                        name: response[name] for name in self.replayed_headers if response.has_header(name)
+                    },
+                }, timeout=settings.IDEMPOTENCY_TTL)
+            # Chỉ nhả lock của chính request này (lock có thể đã hết hạn và bị request khác giữ)
+            if cache.get(state['lock_key']) == state['token']:
+                cache.delete(state['lock_key'])
+        except Exception:
+            logger.exception("Failed to store idempotent response")
+        return response
@@ -0,0 +1,112 @@
+"""
+Phân trang dùng chung cho các API danh sách.
+
+Mặc định phân trang theo số trang (?page=). Khi client gửi tham số ?cursor=
+(có thể để trống cho trang đầu), chuyển sang phân trang keyset theo cặp
+(created_at, id) để trang sâu không phải OFFSET và không phải COUNT(*).
+"""
+import json
+from base64 import b64decode, b64encode
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    PageNumberPagination có thêm chế độ cursor (opt-in qua ?cursor=).
+
+    Cursor mã hóa (created_at, id) của bản ghi ở biên trang cùng chiều duyệt,
+    nên truy vấn luôn là một range scan trên index (created_at, id).
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        position = self.decode_cursor(request)
+        reverse = False
+        if position is not None:
+            reverse, created_at, pk = position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk),
+                    created_at__gte=created_at,
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk),
+                    created_at__lte=created_at,
+                )
+
+        ordering = ('created_at', 'id') if reverse else ('-created_at', '-id')
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Chiều đang duyệt có thêm dữ liệu hay không; chiều ngược lại luôn có
+        # khi client đến từ một cursor.
+        if reverse:
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page_rows = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next or not self.page_rows:
+            return None
+        return self.encode_cursor(self.page_rows[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.use_cursor:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page_rows:
+            return None
+        return self.encode_cursor(self.page_rows[0], reverse=True)
+
+    def encode_cursor(self, obj, reverse):
+        token = json.dumps([int(reverse), obj.created_at.isoformat(), obj.pk])
+        encoded = b64encode(token.encode('ascii')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        """
+        Giải mã cursor thành (reverse, created_at, id). Cursor rỗng nghĩa là trang đầu.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            reverse, created_at, pk = json.loads(b64decode(encoded.encode('ascii')).decode('ascii'))
+            return bool(reverse), datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
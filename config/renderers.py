@@ -18,9 +18,24 @@ class CustomResponseRenderer(JSONRenderer):
                     'next': data['next'],
                     'previous': data['previous']
                 }
+            # Phân trang dạng cursor: không có count
+            elif {'results', 'next', 'previous'}.issubset(data.keys()):
+                response_data = data['results']
+                meta = {
+                    'next': data['next'],
+                    'previous': data['previous']
+                }
+            # Không phân trang nhưng có facet
+            elif {'results', 'facets'}.issubset(data.keys()):
+                response_data = data['results']
+                meta = {}
             else:
                 response_data = data or None
 
+            # Facet đi kèm danh sách (nếu có)
+            if meta is not None and 'facets' in data:
+                meta['facets'] = data['facets']
+
         # Base response
         response = {
             'message': message or self._default_message(response_status),
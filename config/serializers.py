@@ -0,0 +1,87 @@
+"""
+Tiện ích serializer dùng chung.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+
+def _parse_field_list(value):
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsetsMixin:
+    """
+    Cho phép client chọn field trả về qua query string trên các request đọc:
+    - ?fields=id,product_name,price : chỉ trả về các field này
+    - ?omit=description             : bỏ các field này
+    Chỉ áp dụng cho serializer ở cấp ngoài cùng (không phải serializer lồng nhau).
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        names = self.get_sparse_field_names(self.context.get('request'), self.fields.keys())
+        if names is not None:
+            for name in set(self.fields) - names:
+                self.fields.pop(name)
+
+    @classmethod
+    def get_sparse_field_names(cls, request, available):
+        """
+        Trả về tập field được chọn, hoặc None nếu client không yêu cầu lọc.
+        """
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return None
+        params = getattr(request, 'query_params', request.GET)
+        requested = _parse_field_list(params.get(cls.fields_query_param))
+        omitted = _parse_field_list(params.get(cls.omit_query_param))
+        if requested is None and omitted is None:
+            return None
+        names = set(available) if requested is None else set(available) & requested
+        return names - (omitted or set())
+
+    @classmethod
+    def sparse_queryset(cls, queryset, request, always=('id',)):
+        """
+        Thu hẹp queryset bằng .only() theo các field được chọn, để các cột
+        không dùng (vd. description) không bị đọc từ DB. Quan hệ 1-1/n-1 được
+        hiển thị bằng serializer lồng nhau thì được select_related.
+        """
+        serializer = cls()
+        names = cls.get_sparse_field_names(request, serializer.fields.keys())
+        model = queryset.model
+        columns = set(always)
+        related = set()
+        for name, field in serializer.fields.items():
+            if names is not None and name not in names:
+                continue
+            if field.write_only or field.source == '*':
+                continue
+            path = field.source.split('.')
+            try:
+                model_field = model._meta.get_field(path[0])
+            except FieldDoesNotExist:
+                continue
+            if model_field.many_to_many or model_field.one_to_many:
+                continue  # quan hệ nhiều được xử lý bằng prefetch ở view
+            if model_field.is_relation and isinstance(field, serializers.BaseSerializer):
+                related.add(path[0])
+                columns.update(
+                    f"{path[0]}__{sub.source.replace('.', '__')}"
+                    for sub in field.fields.values()
+                    if not sub.write_only and sub.source != '*'
+                )
+            elif model_field.is_relation and len(path) > 1:
+                related.add(path[0])
+                columns.add('__'.join(path))
+            else:
+                columns.add(path[0])
+        if names is None:
+            # Không lọc field: chỉ cần select_related, giữ nguyên các cột
+            return queryset.select_related(*related) if related else queryset
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
@@ -31,10 +31,12 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "apps.users",
     "apps.products",
     "apps.orders",
     "apps.notifications",
+    "apps.uploads",
     "rest_framework",
     "cloudinary",
     "cloudinary_storage",
@@ -113,6 +115,16 @@ CACHES = {
     }
 }
 
+# Thời gian sống (giây) của cache danh sách/chi tiết sản phẩm
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", "300"))
+
+# Các mốc giá dùng để chia facet khoảng giá trên danh sách sản phẩm
+PRODUCT_PRICE_BUCKETS = [100000, 500000, 1000000, 5000000]
+
+# Import sản phẩm hàng loạt: số dòng mỗi lô upsert và số lỗi tối đa trả về
+PRODUCT_IMPORT_BATCH_SIZE = int(os.getenv("PRODUCT_IMPORT_BATCH_SIZE", "1000"))
+PRODUCT_IMPORT_MAX_ERRORS = int(os.getenv("PRODUCT_IMPORT_MAX_ERRORS", "1000"))
+
 cloudinary.config(
     cloud_name=config("CLOUD_NAME"),
     api_key=config("API_KEY"),
@@ -122,6 +134,23 @@ cloudinary.config(
 MEDIA_URL = '/media/'
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
+# Upload bất đồng bộ: file được lưu tạm rồi worker `process_uploads` đẩy lên backend.
+# UPLOAD_TEMP_DIR phải dùng chung giữa web và worker.
+UPLOAD_BACKEND = os.getenv("UPLOAD_BACKEND", "apps.uploads.backends.CloudinaryUploadBackend")
+UPLOAD_TEMP_DIR = os.getenv("UPLOAD_TEMP_DIR", str(BASE_DIR / "var" / "uploads"))
+UPLOAD_LOCAL_ROOT = os.getenv("UPLOAD_LOCAL_ROOT", str(BASE_DIR / "media"))
+UPLOAD_BATCH_SIZE = 20
+UPLOAD_MAX_ATTEMPTS = 5
+UPLOAD_RETRY_BACKOFF = 10  # giây, nhân đôi sau mỗi lần thất bại
+UPLOAD_PROCESSING_TIMEOUT = 600
+
+# Idempotency-Key cho các request tạo mới: thời gian lưu response (giây),
+# thời gian giữ lock khi đang xử lý và thời gian request trùng chờ lock
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 60 * 60)))
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+IDEMPOTENCY_WAIT_TIMEOUT = 10
+IDEMPOTENCY_POLL_INTERVAL = 0.1
+
 AUTH_USER_MODEL = 'users.User'
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -161,10 +190,79 @@ EMAIL_HOST_USER = config("EMAIL_USER")
 EMAIL_HOST_PASSWORD = config("EMAIL_PASSWORD")
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Email thông báo của consumer: số thread gửi, số email mỗi kết nối/lượt,
+# số lần thử và thời gian chờ ban đầu giữa các lần (giây, nhân đôi mỗi lần).
+# NOTIFICATION_EMAIL_BACKEND để trống thì dùng EMAIL_BACKEND; chạy local có thể
+# đặt django.core.mail.backends.filebased.EmailBackend (ghi vào EMAIL_FILE_PATH).
+NOTIFICATION_EMAIL_BACKEND = os.getenv("NOTIFICATION_EMAIL_BACKEND") or None
+EMAIL_FILE_PATH = os.getenv("EMAIL_FILE_PATH", str(BASE_DIR / "var" / "emails"))
+EMAIL_DISPATCH_WORKERS = int(os.getenv("EMAIL_DISPATCH_WORKERS", "4"))
+EMAIL_DISPATCH_CHUNK_SIZE = 50
+EMAIL_DISPATCH_MAX_ATTEMPTS = 3
+EMAIL_DISPATCH_RETRY_BACKOFF = 1.0
+# Kết nối SMTP nhàn rỗi lâu hơn số giây này được mở lại trước khi gửi (server
+# thường tự đóng kết nối nhàn rỗi)
+EMAIL_DISPATCH_IDLE_TIMEOUT = 30
+
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
+# "kafka" hoặc "memory" (broker giả lập trong tiến trình, cho test/benchmark)
+EVENT_TRANSPORT = os.getenv("EVENT_TRANSPORT", "kafka")
 ORDER_TOPIC = 'order-events'
 NOTIFY_TOPIC = 'notification-events'
 
+# Kafka producer: gom lô trong tối đa KAFKA_PRODUCER_LINGER_MS, nén và giới hạn
+# hàng đợi cục bộ; produce() chờ tối đa KAFKA_PRODUCER_BLOCK_TIMEOUT giây khi đầy
+KAFKA_PRODUCER_LINGER_MS = int(os.getenv("KAFKA_PRODUCER_LINGER_MS", "20"))
+KAFKA_PRODUCER_BATCH_NUM_MESSAGES = int(os.getenv("KAFKA_PRODUCER_BATCH_NUM_MESSAGES", "10000"))
+KAFKA_PRODUCER_BATCH_BYTES = int(os.getenv("KAFKA_PRODUCER_BATCH_BYTES", str(256 * 1024)))
+KAFKA_PRODUCER_COMPRESSION = os.getenv("KAFKA_PRODUCER_COMPRESSION", "lz4")
+KAFKA_PRODUCER_QUEUE_MAX_MESSAGES = int(os.getenv("KAFKA_PRODUCER_QUEUE_MAX_MESSAGES", "100000"))
+KAFKA_PRODUCER_BLOCK_TIMEOUT = 5
+KAFKA_PRODUCER_FLUSH_TIMEOUT = 10
+
+# Consumer đọc theo lô: tối đa KAFKA_CONSUMER_BATCH_SIZE message hoặc chờ
+# tối đa KAFKA_CONSUMER_BATCH_TIMEOUT giây cho mỗi lô
+KAFKA_ORDER_CONSUMER_GROUP = os.getenv("KAFKA_ORDER_CONSUMER_GROUP", "order-consumer-group")
+KAFKA_CONSUMER_BATCH_SIZE = int(os.getenv("KAFKA_CONSUMER_BATCH_SIZE", "500"))
+KAFKA_CONSUMER_BATCH_TIMEOUT = 1.0
+# Số tiến trình worker, số thread xử lý song song các order_id khác nhau trong
+# mỗi worker, và thời gian chờ worker xử lý xong khi dừng (giây)
+KAFKA_CONSUMER_WORKERS = int(os.getenv("KAFKA_CONSUMER_WORKERS", "1"))
+KAFKA_CONSUMER_CONCURRENCY = int(os.getenv("KAFKA_CONSUMER_CONCURRENCY", "4"))
+KAFKA_CONSUMER_SHUTDOWN_TIMEOUT = 30
+
+# Endpoint Prometheus /metrics của consumer (0 = tắt; worker N dùng cổng + N)
+# và chu kỳ (giây) đọc watermark để tính lag theo partition
+KAFKA_CONSUMER_METRICS_PORT = int(os.getenv("KAFKA_CONSUMER_METRICS_PORT", "9108"))
+KAFKA_CONSUMER_LAG_INTERVAL = 15
+
+# Định dạng sự kiện producer ghi ra: "json" hoặc "binary" (events.schema).
+# Consumer đọc được cả hai; chỉ chuyển sang "binary" khi mọi consumer đã được
+# cập nhật. Payload nhị phân từ EVENT_COMPRESSION_THRESHOLD byte được nén zlib (0 = không nén).
+EVENT_ENCODING = os.getenv("EVENT_ENCODING", "json")
+EVENT_COMPRESSION_THRESHOLD = int(os.getenv("EVENT_COMPRESSION_THRESHOLD", "1024"))
+
+# Sự kiện xử lý lỗi được thử lại qua các topic retry với độ trễ (giây) tăng
+# dần, hết số lần thử thì chuyển vào DLQ; xem `manage.py order_dlq`
+ORDER_RETRY_DELAYS = [
+    int(delay) for delay in os.getenv("ORDER_RETRY_DELAYS", "30,300,1800").split(",") if delay.strip()
+]
+ORDER_DLQ_TOPIC = f"{ORDER_TOPIC}.dlq"
+ORDER_DLQ_REDRIVE_GROUP = "order-dlq-redrive"
+# Không chuyển được sự kiện lỗi sang topic retry/DLQ: chờ (giây) rồi đọc lại cả lô
+ORDER_RETRY_ROUTING_BACKOFF = 5
+
+# Sổ sự kiện đã xử lý: event_id được giữ trên Redis trong
+# EVENT_LEDGER_CACHE_TIMEOUT giây (0 để tắt) và trong DB EVENT_LEDGER_RETENTION_DAYS ngày
+EVENT_LEDGER_CACHE_TIMEOUT = int(os.getenv("EVENT_LEDGER_CACHE_TIMEOUT", str(24 * 60 * 60)))
+EVENT_LEDGER_RETENTION_DAYS = int(os.getenv("EVENT_LEDGER_RETENTION_DAYS", "30"))
+
+# Relay outbox: số sự kiện mỗi lô, thời gian chờ broker xác nhận (giây)
+# và số ngày giữ sự kiện đã gửi để có thể phát lại
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_FLUSH_TIMEOUT = 10
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
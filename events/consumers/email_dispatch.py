@@ -0,0 +1,152 @@
+"""
+Gửi email thông báo của consumer theo lô.
+
+Email của một lô được chia thành từng nhóm và gửi trên một pool thread có giới
+hạn; mỗi thread giữ một kết nối (get_connection()) và dùng lại cho mọi email
+nó gửi, nên không phải bắt tay TCP + TLS cho từng email. Email lỗi được thử lại
+riêng lẻ với backoff trên một kết nối mới.
+
+Kết nối nhàn rỗi quá EMAIL_DISPATCH_IDLE_TIMEOUT giây được mở lại trước khi
+dùng; kết nối bị server đóng (SMTPServerDisconnected...) được mở lại và gửi lại
+ngay, không tính là một lần thử.
+
+Backend lấy từ NOTIFICATION_EMAIL_BACKEND (mặc định theo EMAIL_BACKEND); dùng
+django.core.mail.backends.filebased/console.EmailBackend khi chạy local.
+"""
+import atexit
+import logging
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+logger = logging.getLogger(__name__)
+
+# Lỗi cho biết kết nối đã chết chứ không phải email bị từ chối
+DEAD_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class EmailDispatcher:
+    def __init__(self, workers=None, chunk_size=None, backend=None):
+        self.workers = workers or settings.EMAIL_DISPATCH_WORKERS
+        self.chunk_size = chunk_size or settings.EMAIL_DISPATCH_CHUNK_SIZE
+        self.backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='email-dispatch')
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        idle = time.monotonic() - getattr(self._local, 'last_used', 0)
+        if connection is not None and idle > settings.EMAIL_DISPATCH_IDLE_TIMEOUT:
+            # Server có thể đã đóng kết nối nhàn rỗi: mở lại thay vì để lần gửi đầu tiên lỗi
+            self._reset_connection()
+            connection = None
+        if connection is None:
+            connection = get_connection(
+                backend=self.backend or settings.NOTIFICATION_EMAIL_BACKEND or settings.EMAIL_BACKEND
+            )
+            connection.open()
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _reset_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is None:
+            return
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _send_message(self, message):
+        try:
+            self._connection().send_messages([message])
+        except DEAD_CONNECTION_ERRORS:
+            self._reset_connection()
+            self._connection().send_messages([message])
+        finally:
+            self._local.last_used = time.monotonic()
+
+    def _send_chunk(self, items):
+        """
+        Gửi một nhóm (tag, EmailMessage) trên kết nối của thread hiện tại;
+        trả về các cặp (tag, lỗi) còn lỗi sau khi đã thử lại.
+        """
+        max_attempts = settings.EMAIL_DISPATCH_MAX_ATTEMPTS
+        pending = [(tag, message, None) for tag, message in items]
+        for attempt in range(1, max_attempts + 1):
+            failed = []
+            for tag, message, _ in pending:
+                try:
+                    self._send_message(message)
+                except Exception as exc:
+                    failed.append((tag, message, exc))
+                    # Kết nối có thể đã hỏng (server đóng, timeout): lần sau mở kết nối mới
+                    self._reset_connection()
+            if not failed:
+                return []
+            pending = failed
+            if attempt < max_attempts:
+                delay = settings.EMAIL_DISPATCH_RETRY_BACKOFF * (2 ** (attempt - 1))
+                logger.warning(f"{len(failed)} emails failed (attempt {attempt}), retrying in {delay}s")
+                time.sleep(delay)
+        return [(tag, exc) for tag, _, exc in pending]
+
+    def send(self, items):
+        """
+        Gửi các cặp (tag, EmailMessage); trả về danh sách (tag, lỗi) của các email
+        vẫn lỗi sau khi hết số lần thử.
+        """
+        items = list(items)
+        if not items:
+            return []
+        chunks = [items[start:start + self.chunk_size] for start in range(0, len(items), self.chunk_size)]
+        failures = []
+        for result in self._executor.map(self._send_chunk, chunks):
+            failures.extend(result)
+        logger.info(f"Sent {len(items) - len(failures)} emails, {len(failures)} failed")
+        return failures
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                logger.exception("Failed to close email connection")
+
+
+def build_message(subject, message, recipient_list, from_email=None):
+    return EmailMessage(
+        subject=subject, body=message, from_email=from_email or settings.DEFAULT_FROM_EMAIL, to=recipient_list
+    )
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_email_dispatcher() -> EmailDispatcher:
+    """
+    Dispatcher dùng chung của tiến trình; kết nối được đóng khi tiến trình thoát.
+    """
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = EmailDispatcher()
+                atexit.register(_dispatcher.close)
+    return _dispatcher
@@ -1,14 +1,16 @@
 import os
 import django
 import logging
-import json
-from confluent_kafka import Consumer
-from django.core.mail import send_mail
-from django.conf import settings
+import signal
+import threading
+import time
+from confluent_kafka import TopicPartition
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 django.setup()
 
+from django.conf import settings
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
@@ -16,95 +18,314 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logger.info("Kafka consumer started")
 
-from apps.notifications.models import Notification
-from apps.products.models import Product
+from events.consumers.processing import notify_events, process_events
+from events.consumers.workers import KeyedExecutor
+from events.ledger import fallback_event_id
+from events.metrics import REGISTRY, start_metrics_server
+from events.producers.order_producer import get_producer
+from events.retry import (
+    STAGE_APPLY, STAGE_DECODE, STAGE_NOTIFY, FailureRouter, RoutingError, message_stage, not_before, original_timestamp,
+    retry_topics,
+)
+from events.schema import decode_event
+from events.transport import create_consumer
 
+EVENTS_TOTAL = REGISTRY.counter(
+    'order_consumer_events_total', 'Events handled by the consumer, by outcome (ok, retry, dlq)',
+    ['event_type', 'outcome'],
+)
+EVENT_END_TO_END = REGISTRY.histogram(
+    'order_consumer_event_end_to_end_seconds',
+    'Time from the original message timestamp until the event was handled, including retry delays',
+    ['event_type'], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800),
+)
+EVENT_PROCESSING = REGISTRY.histogram(
+    'order_consumer_event_processing_seconds',
+    'Time spent applying or notifying an event; a batch call is split evenly between its events',
+    ['event_type', 'stage'],
+)
+BATCH_SIZE = REGISTRY.histogram(
+    'order_consumer_batch_size', 'Messages handled per batch', buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+BATCH_DURATION = REGISTRY.histogram(
+    'order_consumer_batch_duration_seconds', 'Time to apply a batch and route its failures',
+)
+COMMIT_DURATION = REGISTRY.histogram(
+    'order_consumer_commit_duration_seconds', 'Time to commit offsets of a batch',
+)
+CONSUMER_LAG = REGISTRY.gauge(
+    'order_consumer_lag', 'Messages behind the high watermark per assigned partition', ['topic', 'partition'],
+)
 
-def run_consumer():
-    logger.info("🟢 Kafka consumer is starting...")
 
-    consumer = Consumer({
-        'bootstrap.servers': 'kafka:9092',
-        'group.id': 'order-consumer-group',
-        'auto.offset.reset': 'earliest'
-    })
+def build_consumer_config(**overrides):
+    """
+    Offset được commit thủ công sau khi transaction của lô thành công.
+    """
+    config = {
+        'bootstrap.servers': settings.KAFKA_BOOTSTRAP_SERVERS,
+        'group.id': settings.KAFKA_ORDER_CONSUMER_GROUP,
+        'auto.offset.reset': 'earliest',
+        'enable.auto.commit': False,
+    }
+    config.update(overrides)
+    return config
 
-    consumer.subscribe(['order-events'])
-    logger.info("Subscribed to topic: order-events")
 
+def decode_message(msg):
+    """
+    Trả về payload của message, hoặc None nếu không đọc được.
+    """
     try:
-        while True:
-            msg = consumer.poll(1.0)
-            if msg is None:
-                continue
-            if msg.error():
-                logger.warning(f"Consumer error: {msg.error()}")
+        data = decode_event(msg.value())
+    except (ValueError, TypeError):
+        logger.exception(f"Undecodable message at {msg.topic()}[{msg.partition()}]@{msg.offset()}")
+        return None
+    if isinstance(data, dict):
+        data.setdefault("event_id", fallback_event_id(msg))
+    return data
+
+
+def batch_offsets(messages):
+    """
+    Offset cần commit cho mỗi partition: offset lớn nhất trong lô + 1.
+    """
+    offsets = {}
+    for msg in messages:
+        if msg.error() or msg.offset() is None or msg.offset() < 0:
+            continue
+        key = (msg.topic(), msg.partition())
+        offsets[key] = max(offsets.get(key, -1), msg.offset() + 1)
+    return [TopicPartition(topic, partition, offset) for (topic, partition), offset in offsets.items()]
+
+
+def install_shutdown_handlers(stop_event):
+    """
+    SIGTERM/SIGINT chỉ đặt cờ dừng: lô đang xử lý vẫn chạy xong và được commit.
+    """
+    def _stop(signum, frame):
+        logger.info(f"Received signal {signum}, draining in-flight events before exit...")
+        stop_event.set()
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+
+def event_key(data):
+    return data.get("order_id")
+
+
+def split_due(messages, now):
+    """
+    Tách các message đã đến hạn xử lý. Với message retry chưa đến hạn, trả về
+    {(topic, partition): (offset, thời điểm đến hạn)} của message đầu tiên;
+    các message sau nó trong cùng partition cũng bị hoãn.
+    """
+    ready, deferred = [], {}
+    for msg in messages:
+        partition = (msg.topic(), msg.partition())
+        if partition in deferred:
+            continue
+        due = not_before(msg)
+        if due > now:
+            deferred[partition] = (msg.offset(), due)
+            continue
+        ready.append(msg)
+    return ready, deferred
+
+
+def _timed(fn, stage):
+    def run(events):
+        started = time.monotonic()
+        try:
+            return fn(events)
+        finally:
+            # process_events xử lý cả lô một lần: chia đều thời gian cho từng sự kiện
+            share = (time.monotonic() - started) / len(events)
+            for data in events:
+                EVENT_PROCESSING.observe(share, event_type=data.get('event_type') or 'unknown', stage=stage)
+    return run
+
+
+def _run(executor, fn, events):
+    if not events:
+        return []
+    if executor is None:
+        return fn(events)
+    return [failure for failures in executor.run_grouped(fn, events, key=event_key) for failure in failures]
+
+
+def apply_messages(messages, executor, router):
+    """
+    Xử lý các message đã đến hạn; sự kiện lỗi được chuyển sang topic retry
+    hoặc DLQ và phải được broker xác nhận trước khi commit offset.
+    """
+    started = time.monotonic()
+    source = {}
+    to_apply, to_notify = [], []
+    for msg in messages:
+        data = decode_message(msg)
+        if not isinstance(data, dict):
+            # Không đọc được thì thử lại cũng vô ích: chuyển thẳng vào DLQ
+            router.route(msg, STAGE_DECODE, "Undecodable event payload", dead_letter=True)
+            EVENTS_TOTAL.inc(event_type='unknown', outcome='dlq')
+            continue
+        source[id(data)] = msg
+        (to_notify if message_stage(msg) == STAGE_NOTIFY else to_apply).append(data)
+    logger.info(f"Received {len(messages)} messages, {len(to_apply)} to apply, {len(to_notify)} to notify")
+
+    failures = (
+        _run(executor, _timed(process_events, STAGE_APPLY), to_apply)
+        + _run(executor, _timed(notify_events, STAGE_NOTIFY), to_notify)
+    )
+    outcomes = {}
+    for failure in failures:
+        topic = router.route(source[id(failure.data)], failure.stage, failure.error)
+        outcomes[id(failure.data)] = 'dlq' if topic == settings.ORDER_DLQ_TOPIC else 'retry'
+    router.flush()
+
+    now = time.time()
+    for data in to_apply + to_notify:
+        event_type = data.get('event_type') or 'unknown'
+        EVENTS_TOTAL.inc(event_type=event_type, outcome=outcomes.get(id(data), 'ok'))
+        # Message retry mang timestamp của message gốc: độ trễ tính cả thời gian chờ retry
+        timestamp = original_timestamp(source[id(data)])
+        if timestamp is not None:
+            EVENT_END_TO_END.observe(max(0.0, now - timestamp / 1000), event_type=event_type)
+    BATCH_SIZE.observe(len(messages))
+    BATCH_DURATION.observe(time.monotonic() - started)
+
+
+def update_lag(consumer, timeout=1.0):
+    """
+    Lag của từng partition đang được gán = high watermark - vị trí đọc hiện tại.
+    Partition chưa có vị trí (chưa đọc gì) tính theo offset đã commit.
+    """
+    assignment = consumer.assignment()
+    assigned = {(tp.topic, tp.partition) for tp in assignment}
+    for topic, partition in CONSUMER_LAG.label_values():
+        if (topic, int(partition)) not in assigned:
+            CONSUMER_LAG.remove(topic=topic, partition=partition)
+    if not assignment:
+        return
+    positions = {(tp.topic, tp.partition): tp.offset for tp in consumer.position(assignment)}
+    missing = [tp for tp in assignment if positions[(tp.topic, tp.partition)] < 0]
+    if missing:
+        for tp in consumer.committed(missing, timeout=timeout):
+            positions[(tp.topic, tp.partition)] = tp.offset
+    for tp in assignment:
+        low, high = consumer.get_watermark_offsets(tp, timeout=timeout)
+        position = positions[(tp.topic, tp.partition)]
+        lag = high - position if position >= 0 else high - low
+        CONSUMER_LAG.set(max(0, lag), topic=tp.topic, partition=tp.partition)
+
+
+def run_consumer(batch_size=None, timeout=None, concurrency=None, metrics_port=None,
+                 consumer=None, producer=None, stop_event=None):
+    """
+    Vòng lặp consumer. `consumer`/`producer`/`stop_event` cho phép benchmark
+    chạy vòng lặp này trên transport và điều kiện dừng của riêng nó.
+    """
+    batch_size = batch_size or settings.KAFKA_CONSUMER_BATCH_SIZE
+    timeout = settings.KAFKA_CONSUMER_BATCH_TIMEOUT if timeout is None else timeout
+    concurrency = concurrency or settings.KAFKA_CONSUMER_CONCURRENCY
+    metrics_port = settings.KAFKA_CONSUMER_METRICS_PORT if metrics_port is None else metrics_port
+    logger.info(f"🟢 Kafka consumer is starting (batch size {batch_size}, concurrency {concurrency})...")
+
+    metrics_server = start_metrics_server(metrics_port) if metrics_port else None
+    lag_updated = 0
+
+    if stop_event is None:
+        stop_event = threading.Event()
+        install_shutdown_handlers(stop_event)
+    # Các order_id khác nhau được xử lý song song, cùng order_id thì tuần tự
+    executor = KeyedExecutor(concurrency) if concurrency > 1 else None
+
+    router = FailureRouter(producer if producer is not None else get_producer())
+    # Partition retry đang tạm dừng chờ đến hạn: (topic, partition) -> thời điểm tiếp tục
+    paused = {}
+
+    def on_assign(consumer, partitions):
+        consumer.resume(partitions)
+
+    def on_revoke(consumer, partitions):
+        for tp in partitions:
+            paused.pop((tp.topic, tp.partition), None)
+
+    if consumer is None:
+        consumer = create_consumer(build_consumer_config())
+
+    topics = [settings.ORDER_TOPIC] + retry_topics()
+    consumer.subscribe(topics, on_assign=on_assign, on_revoke=on_revoke)
+    logger.info(f"Subscribed to topics: {', '.join(topics)}")
+
+    try:
+        while not stop_event.is_set():
+            now = time.time()
+            if metrics_server is not None and now - lag_updated >= settings.KAFKA_CONSUMER_LAG_INTERVAL:
+                lag_updated = now
+                try:
+                    update_lag(consumer)
+                except Exception:
+                    logger.exception("Failed to update consumer lag")
+            due = [TopicPartition(*partition) for partition, resume_at in paused.items() if resume_at <= now]
+            if due:
+                consumer.resume(due)
+                for tp in due:
+                    paused.pop((tp.topic, tp.partition), None)
+
+            messages = consumer.consume(num_messages=batch_size, timeout=timeout)
+            if not messages:
                 continue
 
+            for msg in messages:
+                if msg.error():
+                    logger.warning(f"Consumer error: {msg.error()}")
+            messages = [msg for msg in messages if not msg.error()]
+
+            ready, deferred = split_due(messages, time.time())
+            for (topic, partition), (offset, resume_at) in deferred.items():
+                # Quay lại message chưa đến hạn và dừng partition tới lúc đó
+                tp = TopicPartition(topic, partition, offset)
+                consumer.seek(tp)
+                consumer.pause([tp])
+                paused[(topic, partition)] = resume_at
+
+            if not ready:
+                continue
             try:
-                data = json.loads(msg.value().decode('utf-8'))
-                event_type = data.get("event_type")
-                logger.info(f"Received event: {event_type} | Payload: {data}")
-
-                if event_type == "ORDER_CREATED":
-                    for item in data["items"]:
-                        try:
-                            product = Product.objects.get(id=item["product_id"])
-                            product.stock_quantity -= item["quantity"]
-                            product.save()
-                            logger.info(f"Updated stock for product_id={product.id}")
-                        except Product.DoesNotExist:
-                            logger.warning(f"Product {item['product_id']} not found")
-
-                    Notification.objects.create(
-                        user_id=data["user_id"],
-                        title="Đơn hàng đã được tạo",
-                        message=f"Đơn hàng #{data['order_id']} của bạn đã được ghi nhận.",
-                        type="order"
-                    )
-                    logger.info(f"Notification sent for user_id={data['user_id']}")
-
-                    send_mail(
-                        subject="Xác nhận đơn hàng",
-                        message=f"Chúng tôi đã nhận đơn hàng #{data['order_id']}.",
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        recipient_list=[data["email"]],
-                    )
-                    logger.info(f"Email sent to {data['email']}")
-
-                elif event_type == "ORDER_DELIVERED":
-                    Notification.objects.create(
-                        user_id=data["user_id"],
-                        title="Đơn hàng đã được giao",
-                        message=f"Đơn hàng #{data['order_id']} đã được giao thành công.",
-                        type="order"
-                    )
-                    logger.info(f"Notification for delivery sent to user {data['user_id']}")
-
-                    send_mail(
-                        subject="Đơn hàng đã giao thành công",
-                        message=f"Đơn hàng #{data['order_id']} đã đến tay bạn.",
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        recipient_list=[data["email"]],
-                    )
-                    logger.info(f"Delivery email sent to {data['email']}")
-                elif event_type == "ORDER_CANCELED":
-                    for item in data["items"]:
-                        try:
-                            product = Product.objects.get(id=item["product_id"])
-                            product.stock_quantity += item["quantity"]
-                            product.save()
-                            logger.info(f" Restocked for product_id={product.id}")
-                        except Product.DoesNotExist:
-                            logger.warning(f"Product {item['product_id']} not found")
-
-            except Exception as e:
-                logger.exception("Error processing event")
+                apply_messages(ready, executor, router)
+            except RoutingError:
+                # Sự kiện lỗi chưa nằm ở topic retry/DLQ: không commit, quay lại đầu lô và
+                # chờ rồi đọc lại. Sự kiện đã ghi DB được sổ ProcessedEvent bỏ qua ở lần sau
+                logger.exception(f"Failed to route failed events, retrying the batch of {len(ready)} messages")
+                resume_at = time.time() + settings.ORDER_RETRY_ROUTING_BACKOFF
+                first_offsets = {}
+                for msg in ready:
+                    first_offsets.setdefault((msg.topic(), msg.partition()), msg.offset())
+                for (topic, partition), offset in first_offsets.items():
+                    tp = TopicPartition(topic, partition, offset)
+                    consumer.seek(tp)
+                    consumer.pause([tp])
+                    paused[(topic, partition)] = max(resume_at, paused.get((topic, partition), 0))
+                continue
+
+            # Chỉ commit sau khi lô đã được ghi vào DB và sự kiện lỗi đã nằm ở topic retry/DLQ
+            offsets = batch_offsets(ready)
+            if offsets:
+                started = time.monotonic()
+                consumer.commit(offsets=offsets, asynchronous=False)
+                COMMIT_DURATION.observe(time.monotonic() - started)
 
     except KeyboardInterrupt:
         logger.info("Kafka consumer stopped by user.")
     finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
         consumer.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
         logger.info("Kafka consumer closed.")
 
 if __name__ == "__main__":
@@ -0,0 +1,249 @@
+"""
+Áp dụng sự kiện đơn hàng vào DB: cập nhật tồn kho, tạo thông báo và gửi email.
+
+Có hai cách xử lý:
+- handle_event(): từng sự kiện một, tồn kho được cập nhật bằng biểu thức F();
+- handle_batch(): cả lô trong một transaction, tồn kho được gộp theo sản phẩm
+  và cập nhật bằng một câu lệnh.
+Thông báo luôn được upsert theo event_id (rebuild_notifications), nên sự kiện
+mà replay đã dựng lại thông báo không làm consumer lỗi IntegrityError.
+Cả hai đều ghi event_id vào sổ ProcessedEvent trong cùng transaction nên sự
+kiện bị giao lại không được áp dụng lần thứ hai.
+
+Lỗi không bị nuốt: các hàm trả về danh sách EventFailure để consumer chuyển
+sự kiện sang topic retry/DLQ (events.retry). Delta tồn kho không áp dụng được
+(sản phẩm không tồn tại hoặc không đủ hàng) làm lô bị rollback và xử lý lại
+từng sự kiện, để chính sự kiện gây lỗi thành EventFailure.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import F
+
+from apps.notifications.models import Notification, NotificationType
+from apps.products.cache import bump_catalog_version
+from apps.products.models import Product
+from apps.products.stock import aggregate_deltas, bulk_adjust_stock
+from events.consumers.email_dispatch import build_message, get_email_dispatcher
+from events.ledger import claim_events, recently_processed
+from events.retry import STAGE_APPLY, STAGE_NOTIFY, EventFailure
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = "ORDER_CREATED"
+ORDER_CANCELED = "ORDER_CANCELED"
+ORDER_DELIVERED = "ORDER_DELIVERED"
+
+
+class StockRejectedError(Exception):
+    """
+    Một hoặc nhiều delta tồn kho không áp dụng được; `rejected` theo định dạng
+    của bulk_adjust_stock().
+    """
+
+    def __init__(self, rejected):
+        self.rejected = rejected
+        super().__init__(", ".join(
+            f"product {item['product_id']} delta {item['delta']}: {item['reason']}" for item in rejected
+        ))
+
+
+def stock_deltas(data):
+    """
+    Các cặp (product_id, delta) tồn kho mà sự kiện gây ra.
+    """
+    event_type = data.get("event_type")
+    if event_type == ORDER_CREATED and not data.get("stock_reserved"):
+        # Sự kiện mới đã giữ tồn kho trong request; chỉ sự kiện cũ mới cần trừ kho ở đây
+        return [(item["product_id"], -item["quantity"]) for item in data["items"]]
+    if event_type == ORDER_CANCELED:
+        return [(item["product_id"], item["quantity"]) for item in data["items"]]
+    return []
+
+
+def build_notification(data):
+    event_type = data.get("event_type")
+    if event_type == ORDER_CREATED:
+        return Notification(
+            user_id=data["user_id"],
+            title="Đơn hàng đã được tạo",
+            message=f"Đơn hàng #{data['order_id']} của bạn đã được ghi nhận.",
+            type=NotificationType.ORDER,
+            event_id=data.get("event_id"),
+        )
+    if event_type == ORDER_DELIVERED:
+        return Notification(
+            user_id=data["user_id"],
+            title="Đơn hàng đã được giao",
+            message=f"Đơn hàng #{data['order_id']} đã được giao thành công.",
+            type=NotificationType.ORDER,
+            event_id=data.get("event_id"),
+        )
+    return None
+
+
+def apply_stock(events, strict=True) -> dict:
+    """
+    Cộng dồn tồn kho của các sự kiện theo sản phẩm và cập nhật bằng một câu lệnh.
+    Có delta bị từ chối thì ném StockRejectedError để transaction của người gọi
+    rollback; `strict=False` chỉ ghi log và bỏ qua các delta đó (dùng khi replay).
+    """
+    deltas = aggregate_deltas(delta for data in events for delta in stock_deltas(data))
+    if deltas:
+        result = bulk_adjust_stock(deltas.items())
+        if result["rejected"] and strict:
+            raise StockRejectedError(result["rejected"])
+        for rejected in result["rejected"]:
+            logger.warning(
+                f"Stock delta {rejected['delta']} for product {rejected['product_id']} "
+                f"not applied: {rejected['reason']}"
+            )
+    return deltas
+
+
+def rebuild_notifications(events) -> int:
+    """
+    Dựng lại thông báo của các sự kiện: upsert theo event_id, nên chạy lại
+    nhiều lần không tạo trùng và giữ nguyên is_read/created_at. Thông báo cũ
+    chưa có event_id nhưng cùng người nhận và nội dung được gắn event_id thay
+    vì tạo bản mới. Sự kiện không có event_id thì luôn tạo thông báo mới.
+    """
+    notifications, anonymous = {}, []
+    for notification in map(build_notification, events):
+        if notification is None:
+            continue
+        if notification.event_id:
+            notifications[notification.event_id] = notification
+        else:
+            anonymous.append(notification)
+    if anonymous:
+        Notification.objects.bulk_create(anonymous)
+    if not notifications:
+        return len(anonymous)
+
+    by_content = {(n.user_id, n.title, n.message): n for n in notifications.values()}
+    adopted = []
+    legacy = Notification.objects.filter(
+        event_id__isnull=True,
+        type=NotificationType.ORDER,
+        user_id__in={n.user_id for n in notifications.values()},
+        message__in={n.message for n in notifications.values()},
+    ).only("id", "user_id", "title", "message")
+    for row in legacy:
+        notification = by_content.pop((row.user_id, row.title, row.message), None)
+        if notification is not None:
+            row.event_id = notification.event_id
+            adopted.append(row)
+    if adopted:
+        Notification.objects.bulk_update(adopted, ["event_id"])
+
+    Notification.objects.bulk_create(
+        notifications.values(),
+        update_conflicts=True,
+        unique_fields=["event_id"],
+        update_fields=["user", "title", "message", "type"],
+    )
+    return len(notifications) + len(anonymous)
+
+
+def build_email(data):
+    event_type = data.get("event_type")
+    if event_type == ORDER_CREATED:
+        return {
+            "subject": "Xác nhận đơn hàng",
+            "message": f"Chúng tôi đã nhận đơn hàng #{data['order_id']}.",
+            "recipient_list": [data["email"]],
+        }
+    if event_type == ORDER_DELIVERED:
+        return {
+            "subject": "Đơn hàng đã giao thành công",
+            "message": f"Đơn hàng #{data['order_id']} đã đến tay bạn.",
+            "recipient_list": [data["email"]],
+        }
+    return None
+
+
+def notify_events(events):
+    """
+    Gửi email cho các sự kiện đã được ghi vào DB qua EmailDispatcher (dùng lại
+    kết nối SMTP, có thử lại); trả về các sự kiện vẫn gửi lỗi.
+    """
+    messages = []
+    failures = []
+    for data in events:
+        try:
+            email = build_email(data)
+        except Exception as exc:
+            failures.append(EventFailure(data, STAGE_NOTIFY, exc))
+            continue
+        if email is not None:
+            messages.append((data, build_message(**email)))
+
+    for data, exc in get_email_dispatcher().send(messages):
+        logger.error(f"Failed to send email for order_id={data.get('order_id')}: {exc}")
+        failures.append(EventFailure(data, STAGE_NOTIFY, exc))
+    return failures
+
+
+def handle_event(data):
+    """
+    Xử lý một sự kiện; lỗi ghi DB được ném ra, lỗi gửi email được trả về.
+    """
+    with transaction.atomic():
+        if not claim_events([data]):
+            logger.info(f"Event {data.get('event_id')} already processed, skipping")
+            return []
+        deltas = aggregate_deltas(stock_deltas(data))
+        for product_id, delta in sorted(deltas.items()):
+            # Cộng dồn ngay trong DB (UPDATE ... SET stock_quantity = stock_quantity + delta)
+            # để các consumer/API chạy song song không ghi đè lẫn nhau
+            if not Product.objects.filter(id=product_id).update(stock_quantity=F('stock_quantity') + delta):
+                raise StockRejectedError([{"product_id": product_id, "delta": delta, "reason": "not_found"}])
+            logger.info(f"Updated stock for product_id={product_id}")
+        if deltas:
+            bump_catalog_version()
+
+        if rebuild_notifications([data]):
+            logger.info(f"Notification sent for user_id={data['user_id']}")
+
+    return notify_events([data])
+
+
+def handle_batch(events):
+    """
+    Xử lý cả lô sự kiện trong một transaction. Email chỉ được gửi sau khi
+    transaction commit.
+    """
+    with transaction.atomic():
+        events = claim_events(events)
+        deltas = apply_stock(events)
+        notifications = rebuild_notifications(events)
+
+    logger.info(
+        f"Applied batch of {len(events)} events: {len(deltas)} products, {notifications} notifications"
+    )
+    return notify_events(events)
+
+
+def process_events(events):
+    """
+    Xử lý lô; nếu lô lỗi (vd. một sự kiện hỏng) thì xử lý lại từng sự kiện để
+    các sự kiện hợp lệ không bị kẹt theo. Trả về danh sách EventFailure.
+    """
+    known = recently_processed([data["event_id"] for data in events if data.get("event_id")])
+    events = [data for data in events if data.get("event_id") not in known]
+    if not events:
+        return []
+    try:
+        return handle_batch(events)
+    except Exception:
+        logger.exception(f"Batch of {len(events)} events failed, falling back to per-event processing")
+
+    failures = []
+    for data in events:
+        try:
+            failures.extend(handle_event(data))
+        except Exception as exc:
+            logger.exception(f"Error processing event: {data}")
+            failures.append(EventFailure(data, STAGE_APPLY, exc))
+    return failures
@@ -0,0 +1,124 @@
+"""
+Chạy consumer song song:
+- nhiều tiến trình worker trong cùng consumer group, Kafka chia partition cho từng worker;
+- trong một worker, KeyedExecutor xử lý các order_id khác nhau trên nhiều
+  thread nhưng giữ nguyên thứ tự các sự kiện của cùng một order_id.
+"""
+import logging
+import multiprocessing
+import signal
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+def _run_in_lane(fn, items):
+    # Thread của lane sống lâu: đóng kết nối DB hỏng/hết hạn trước và sau mỗi tác vụ
+    close_old_connections()
+    try:
+        return fn(items)
+    finally:
+        close_old_connections()
+
+
+class KeyedExecutor:
+    """
+    Mỗi key luôn được gán cho cùng một "lane" (một thread), nên các tác vụ
+    cùng key chạy tuần tự theo thứ tự gửi vào, còn các key khác nhau chạy song song.
+    """
+
+    def __init__(self, concurrency):
+        self._lanes = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'order-lane-{index}')
+            for index in range(concurrency)
+        ]
+
+    def lane_for(self, key) -> int:
+        return zlib.crc32(str(key).encode('utf-8')) % len(self._lanes)
+
+    def submit(self, key, fn, *args, **kwargs):
+        return self._lanes[self.lane_for(key)].submit(fn, *args, **kwargs)
+
+    def run_grouped(self, fn, items, key):
+        """
+        Chia `items` theo lane của key(item) (giữ thứ tự), gọi fn(nhóm) trên
+        từng lane và chờ tất cả hoàn tất. Lỗi của bất kỳ nhóm nào được ném lại.
+        """
+        groups = {}
+        for item in items:
+            groups.setdefault(self.lane_for(key(item)), []).append(item)
+        futures = [
+            self._lanes[lane].submit(_run_in_lane, fn, group) for lane, group in groups.items()
+        ]
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def shutdown(self, wait=True):
+        for lane in self._lanes:
+            lane.shutdown(wait=wait)
+
+
+def _worker_main(index, consumer_options):
+    # Import trong tiến trình con (spawn): module consumer tự gọi django.setup()
+    from events.consumers.order_consumer import run_consumer
+
+    logger.info(f"Consumer worker {index} started")
+    if consumer_options.get('metrics_port'):
+        # Mỗi worker phục vụ metric của mình ở một cổng riêng
+        consumer_options = dict(consumer_options, metrics_port=consumer_options['metrics_port'] + index)
+    run_consumer(**consumer_options)
+
+
+def run_worker_pool(workers, **consumer_options):
+    """
+    Chạy `workers` tiến trình consumer và giám sát chúng: tiến trình chết bất
+    thường được khởi động lại; khi nhận SIGTERM/SIGINT, chuyển tín hiệu cho các
+    worker và chờ chúng xử lý xong lô hiện tại, commit rồi thoát.
+    """
+    # librdkafka không an toàn khi fork, nên dùng spawn
+    context = multiprocessing.get_context('spawn')
+    stopping = False
+
+    def start(index):
+        process = context.Process(
+            target=_worker_main, args=(index, consumer_options), name=f'order-consumer-{index}'
+        )
+        process.start()
+        return process
+
+    def stop(signum, frame):
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        logger.info(f"Received signal {signum}, stopping {workers} consumer workers...")
+        for process in processes:
+            if process.is_alive():
+                process.terminate()  # SIGTERM: worker tự xử lý xong lô hiện tại
+
+    processes = [start(index) for index in range(workers)]
+    previous_handlers = {sig: signal.signal(sig, stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        while not stopping:
+            for index, process in enumerate(processes):
+                if not process.is_alive() and not stopping:
+                    logger.error(f"Consumer worker {index} exited with code {process.exitcode}, restarting")
+                    processes[index] = start(index)
+            time.sleep(1)
+
+        deadline = time.monotonic() + settings.KAFKA_CONSUMER_SHUTDOWN_TIMEOUT
+        for process in processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.error(f"Consumer worker {process.name} did not stop in time, killing it")
+                process.kill()
+                process.join()
+    finally:
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+    logger.info("All consumer workers stopped")
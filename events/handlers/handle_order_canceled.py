@@ -1,18 +1,20 @@
 import logging
+import uuid
 
 from config import settings
-from events.producers.order_producer import send_kafka_event
+from events.outbox import enqueue_event
 logger = logging.getLogger(__name__)
 def publish_order_canceled_event(order):
     event = {
+        "event_id": str(uuid.uuid4()),
         "event_type": "ORDER_CANCELED",
         "order_id": order.id,
         "user_id": order.user.id,
         "email": order.user.email,
         "items": [
-            {"product_id": item.product.id, "quantity": item.quantity}
+            {"product_id": item.product_id, "quantity": item.quantity}
             for item in order.order_items.all()
         ],
     }
-    logger.info(f"Sending ORDER_CANCELED event for order_id={order.id}")
-    send_kafka_event(settings.ORDER_TOPIC, event)
+    logger.info(f"Queueing ORDER_CANCELED event in outbox for order_id={order.id}")
+    enqueue_event(settings.ORDER_TOPIC, event, key=order.id)
@@ -1,6 +1,7 @@
 import logging
+import uuid
 from django.conf import settings
-from events.producers.order_producer import send_kafka_event
+from events.outbox import enqueue_event
 
 logger = logging.getLogger(__name__)
 
@@ -9,18 +10,21 @@ def publish_order_created_event(order):
     logger.info(f"Preparing to send ORDER_CREATED for order_id={order.id}")
 
     event = {
+        "event_id": str(uuid.uuid4()),
         "event_type": "ORDER_CREATED",
         "order_id": order.id,
         "user_id": order.user.id,
         "email": order.user.email,
         "items": [
-            {"product_id": item.product.id, "quantity": item.quantity}
+            {"product_id": item.product_id, "quantity": item.quantity}
             for item in order.order_items.all()
         ],
+        # Tồn kho đã được trừ khi tạo đơn, consumer không trừ lại
+        "stock_reserved": True,
     }
 
     logger.debug(f"Event payload: {event}")
 
-    send_kafka_event(settings.ORDER_TOPIC, event)
+    enqueue_event(settings.ORDER_TOPIC, event, key=order.id)
 
-    logger.info(f"Sent ORDER_CREATED event for order_id={order.id}")
+    logger.info(f"Queued ORDER_CREATED event in outbox for order_id={order.id}")
@@ -1,12 +1,15 @@
+import uuid
+
 from config import settings
-from events.producers.order_producer import send_kafka_event
+from events.outbox import enqueue_event
 
 
 def publish_order_delivered_event(order):
     event = {
+        "event_id": str(uuid.uuid4()),
         "event_type": "ORDER_DELIVERED",
         "order_id": order.id,
         "user_id": order.user.id,
         "email": order.user.email,
     }
-    send_kafka_event(settings.ORDER_TOPIC, event)
\ No newline at end of file
+    enqueue_event(settings.ORDER_TOPIC, event, key=order.id)
\ No newline at end of file
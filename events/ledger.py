@@ -0,0 +1,112 @@
+"""
+Sổ ghi sự kiện đã xử lý (ProcessedEvent) giúp consumer xử lý mỗi sự kiện đúng
+một lần dù Kafka giao lại (rebalance, crash, replay).
+
+- claim_events(): INSERT ... ON CONFLICT DO NOTHING RETURNING trong transaction
+  của tác động; sự kiện chỉ được xử lý nếu chính transaction này ghi được nó.
+  Transaction rollback thì bản ghi cũng mất, sự kiện sẽ được xử lý lại.
+- Redis (CACHES['default']) giữ các event_id vừa xử lý để bỏ qua sự kiện trùng
+  mà không cần mở transaction; DB vẫn là nguồn quyết định.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.orders.models import ProcessedEvent
+
+logger = logging.getLogger(__name__)
+
+# Mỗi sự kiện dùng 3 tham số; giữ mỗi câu lệnh dưới giới hạn tham số của Postgres
+LEDGER_CHUNK_SIZE = 10000
+
+
+def fallback_event_id(msg) -> str:
+    """
+    Sự kiện cũ không có event_id: dùng vị trí của message trong Kafka.
+    """
+    return f"{msg.topic()}:{msg.partition()}:{msg.offset()}"
+
+
+def _cache_key(event_id) -> str:
+    return f"events:processed:{event_id}"
+
+
+def recently_processed(event_ids) -> set:
+    """
+    Các event_id đã biết là xử lý xong theo Redis. Redis lỗi thì trả về rỗng.
+    """
+    if not settings.EVENT_LEDGER_CACHE_TIMEOUT or not event_ids:
+        return set()
+    try:
+        found = cache.get_many([_cache_key(event_id) for event_id in event_ids])
+    except Exception:
+        logger.exception("Event ledger cache unavailable")
+        return set()
+    return {event_id for event_id in event_ids if _cache_key(event_id) in found}
+
+
+def _remember(event_ids):
+    try:
+        cache.set_many(
+            {_cache_key(event_id): 1 for event_id in event_ids},
+            timeout=settings.EVENT_LEDGER_CACHE_TIMEOUT,
+        )
+    except Exception:
+        logger.exception("Failed to cache processed event ids")
+
+
+def claim_events(events) -> list:
+    """
+    Ghi event_id của các sự kiện vào sổ và trả về các sự kiện lần đầu được ghi
+    (giữ thứ tự, bỏ trùng trong cùng lô). Phải gọi trong transaction của tác động.
+    """
+    unique = {}
+    anonymous = []
+    for data in events:
+        if data.get("event_id"):
+            unique.setdefault(data["event_id"], data)
+        else:
+            # Không có định danh thì không thể chống trùng, vẫn xử lý như trước
+            anonymous.append(data)
+    if not unique:
+        return anonymous
+
+    table = connection.ops.quote_name(ProcessedEvent._meta.db_table)
+    now = timezone.now()
+    items = list(unique.values())
+    claimed = set()
+    for start in range(0, len(items), LEDGER_CHUNK_SIZE):
+        chunk = items[start:start + LEDGER_CHUNK_SIZE]
+        values = ', '.join(['(%s, %s, %s)'] * len(chunk))
+        params = []
+        for data in chunk:
+            params.extend((data["event_id"], data.get("event_type", ""), now))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (event_id, event_type, processed_at) VALUES {values} "
+                f"ON CONFLICT (event_id) DO NOTHING RETURNING event_id",
+                params,
+            )
+            claimed.update(row[0] for row in cursor.fetchall())
+
+    if settings.EVENT_LEDGER_CACHE_TIMEOUT:
+        transaction.on_commit(lambda: _remember(unique))
+    skipped = len(unique) - len(claimed)
+    if skipped:
+        logger.info(f"Skipped {skipped} already processed events")
+    return [data for event_id, data in unique.items() if event_id in claimed] + anonymous
+
+
+def prune_ledger(older_than_days=None) -> int:
+    """
+    Xóa bản ghi cũ hơn thời gian lưu giữ (lâu hơn khoảng thời gian Kafka có thể giao lại).
+    """
+    days = settings.EVENT_LEDGER_RETENTION_DAYS if older_than_days is None else older_than_days
+    deleted, _ = ProcessedEvent.objects.filter(
+        processed_at__lt=timezone.now() - timedelta(days=days)
+    ).delete()
+    return deleted
@@ -0,0 +1,156 @@
+"""
+Transactional outbox cho sự kiện đơn hàng.
+
+API chỉ ghi sự kiện vào bảng OutboxEvent trong cùng transaction với thay đổi
+đơn hàng; relay (`manage.py relay_outbox`) đọc các sự kiện chưa gửi theo lô,
+đẩy lên Kafka, chờ broker xác nhận một lần cho cả lô rồi đánh dấu đã gửi.
+
+Tại mỗi thời điểm chỉ một relay được gửi (advisory lock của Postgres): hai
+relay song song có thể gửi các sự kiện cùng key lệch thứ tự.
+"""
+import logging
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.orders.models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_TIMEOUT_ERROR = 'delivery not confirmed before flush timeout'
+HELD_BACK_ERROR = 'held back: an earlier event with the same key was not delivered'
+# Khóa advisory dùng chung cho mọi tiến trình relay
+RELAY_LOCK_ID = 0x6F7574626F78
+
+
+def enqueue_event(topic, event, key=None) -> OutboxEvent:
+    """
+    Ghi sự kiện vào outbox. Phải được gọi bên trong transaction của thay đổi
+    tương ứng để sự kiện chỉ tồn tại khi transaction commit.
+    """
+    return OutboxEvent.objects.create(
+        topic=topic,
+        key=None if key is None else str(key),
+        event_type=event.get('event_type', ''),
+        payload=event,
+    )
+
+
+def _record_delivery(results, event_id, err, msg):
+    results[event_id] = err
+
+
+@contextmanager
+def _relay_lock():
+    # Khóa mức session nên vẫn giữ được khi gửi lô ngoài transaction
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [RELAY_LOCK_ID])
+        acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [RELAY_LOCK_ID])
+
+
+def relay_pending_events(batch_size=None, flush_timeout=None) -> tuple:
+    """
+    Gửi một lô sự kiện chưa gửi theo thứ tự ghi; trả về (số đã gửi, số chưa gửi).
+    Nếu một relay khác đang giữ khóa thì không gửi gì và trả về (0, 0).
+    Sự kiện bị giữ lại vì sự kiện trước cùng key lỗi không bị tính là một lần thử.
+    """
+    # Import muộn để API (chỉ ghi outbox) không phải khởi tạo Kafka producer
+    from events.producers.order_producer import get_producer
+
+    producer = get_producer()
+
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    flush_timeout = flush_timeout or settings.OUTBOX_FLUSH_TIMEOUT
+
+    with _relay_lock() as acquired:
+        if not acquired:
+            logger.info("Another outbox relay holds the lock, skipping this batch")
+            return 0, 0
+        return _relay_batch(producer, batch_size, flush_timeout)
+
+
+def _relay_batch(producer, batch_size, flush_timeout) -> tuple:
+    # Chỉ một relay chạy nên không cần khóa dòng; không giữ transaction khi chờ broker
+    events = list(OutboxEvent.objects.filter(sent_at__isnull=True).order_by('id')[:batch_size])
+    if not events:
+        return 0, 0
+
+    results, failed_keys = {}, set()
+    for event in events:
+        if event.key is not None and event.key in failed_keys:
+            # Giữ nguyên thứ tự theo key: không gửi sự kiện sau khi sự kiện trước lỗi
+            results[event.pk] = HELD_BACK_ERROR
+            continue
+        try:
+            producer.produce(
+                event.topic, event.payload, key=event.key,
+                on_delivery=partial(_record_delivery, results, event.pk),
+            )
+        except Exception as exc:
+            results[event.pk] = exc
+            if event.key is not None:
+                failed_keys.add(event.key)
+    # Một lần chờ xác nhận cho cả lô thay vì mỗi message
+    producer.flush(flush_timeout)
+
+    # Sự kiện chưa có callback sau flush coi như lỗi và được gửi lại ở lô sau.
+    # Sự kiện đứng sau một sự kiện lỗi cùng key cũng bị giữ lại, kể cả khi
+    # broker đã nhận, để lần gửi lại đi đúng thứ tự.
+    errors, failed_keys = {}, set()
+    for event in events:
+        err = results.get(event.pk, DELIVERY_TIMEOUT_ERROR)
+        if event.key is not None and event.key in failed_keys:
+            err = HELD_BACK_ERROR
+        elif err is not None and event.key is not None:
+            failed_keys.add(event.key)
+        errors[event.pk] = err
+    sent_ids = [pk for pk, err in errors.items() if err is None]
+
+    failed = [event for event in events if errors[event.pk] not in (None, HELD_BACK_ERROR)]
+    held_back = len(events) - len(sent_ids) - len(failed)
+    for event in failed:
+        event.attempts += 1
+        event.last_error = str(errors[event.pk])
+        logger.warning(f"Outbox event {event.pk} not delivered (attempt {event.attempts}): {event.last_error}")
+    with transaction.atomic():
+        OutboxEvent.objects.filter(pk__in=sent_ids).update(sent_at=timezone.now())
+        OutboxEvent.objects.bulk_update(failed, ['attempts', 'last_error'])
+
+    logger.info(f"Relayed {len(sent_ids)} outbox events, {len(failed)} failed, {held_back} held back")
+    return len(sent_ids), len(failed) + held_back
+
+
+def mark_for_replay(event_ids=None, since=None, until=None, event_type=None) -> int:
+    """
+    Đánh dấu lại các sự kiện đã gửi là chưa gửi để relay phát lại.
+    """
+    queryset = OutboxEvent.objects.filter(sent_at__isnull=False)
+    if event_ids:
+        queryset = queryset.filter(pk__in=event_ids)
+    if since:
+        queryset = queryset.filter(created_at__gte=since)
+    if until:
+        queryset = queryset.filter(created_at__lt=until)
+    if event_type:
+        queryset = queryset.filter(event_type=event_type)
+    return queryset.update(sent_at=None, attempts=0, last_error='')
+
+
+def purge_sent_events(older_than_days=None) -> int:
+    """
+    Xóa các sự kiện đã gửi cũ hơn thời gian lưu giữ.
+    """
+    days = settings.OUTBOX_RETENTION_DAYS if older_than_days is None else older_than_days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = OutboxEvent.objects.filter(sent_at__lt=cutoff).delete()
+    return deleted
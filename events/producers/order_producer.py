@@ -1,29 +1,157 @@
-from confluent_kafka import Producer
+"""
+Kafka producer dùng chung cho sự kiện đơn hàng.
+
+Một producer sống suốt vòng đời tiến trình: message được librdkafka gom lô
+(linger.ms / batch.num.messages), nén, và xác nhận giao nhận qua callback do
+một thread nền poll. Hàng đợi cục bộ có giới hạn; khi đầy, produce() chờ tối
+đa KAFKA_PRODUCER_BLOCK_TIMEOUT giây rồi mới báo lỗi (backpressure). Khi tiến
+trình thoát, các message còn lại được flush.
+"""
+import atexit
+import logging
 import os
+import threading
+import time
+
 import django
-import json
-import logging
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 django.setup()
 
 from django.conf import settings
 
+from events import schema
+from events.transport import create_producer
+
 logger = logging.getLogger(__name__)
-producer = Producer({'bootstrap.servers': settings.KAFKA_BOOTSTRAP_SERVERS})
+
+
+def build_producer_config(**overrides):
+    """
+    Cấu hình librdkafka từ settings; `overrides` dùng tên key của librdkafka.
+    """
+    config = {
+        'bootstrap.servers': settings.KAFKA_BOOTSTRAP_SERVERS,
+        'linger.ms': settings.KAFKA_PRODUCER_LINGER_MS,
+        'batch.num.messages': settings.KAFKA_PRODUCER_BATCH_NUM_MESSAGES,
+        'batch.size': settings.KAFKA_PRODUCER_BATCH_BYTES,
+        'compression.type': settings.KAFKA_PRODUCER_COMPRESSION,
+        'queue.buffering.max.messages': settings.KAFKA_PRODUCER_QUEUE_MAX_MESSAGES,
+        # Giữ thứ tự theo partition và không ghi trùng khi librdkafka tự retry
+        'enable.idempotence': True,
+        'acks': 'all',
+    }
+    config.update(overrides)
+    return config
+
 
 def delivery_report(err, msg):
     if err is not None:
         logger.error(f"Message delivery failed: {err}")
     else:
-        logger.info(f"Message delivered to {msg.topic()} [{msg.partition()}] at offset {msg.offset()}")
+        logger.debug(f"Message delivered to {msg.topic()} [{msg.partition()}] at offset {msg.offset()}")
+
+
+def encode_event(event) -> bytes:
+    """
+    Mã hóa theo EVENT_ENCODING (json hoặc binary, xem events.schema).
+    """
+    return schema.encode_event(event)
+
+
+class OrderEventProducer:
+    """
+    Bọc producer của transport (confluent_kafka.Producer hoặc
+    events.transport.memory.InMemoryProducer) với thread poll nền.
+    """
+
+    def __init__(self, client=None, config=None, block_timeout=None):
+        self._client = client if client is not None else create_producer(config or build_producer_config())
+        self.block_timeout = settings.KAFKA_PRODUCER_BLOCK_TIMEOUT if block_timeout is None else block_timeout
+        self._stop = threading.Event()
+        self._poll_thread = threading.Thread(target=self._poll_loop, name='kafka-producer-poll', daemon=True)
+        self._poll_thread.start()
+
+    def _poll_loop(self):
+        while not self._stop.is_set():
+            try:
+                self._client.poll(0.1)
+            except Exception:
+                logger.exception("Kafka producer poll failed")
+
+    def __len__(self):
+        return len(self._client)
+
+    def produce(self, topic, event, key=None, on_delivery=None):
+        """
+        Đưa sự kiện vào hàng đợi, không chờ broker. Key mặc định là order_id để
+        mọi sự kiện của cùng một đơn vào cùng partition (giữ thứ tự).
+        """
+        if key is None and isinstance(event, dict) and event.get('order_id') is not None:
+            key = event['order_id']
+        payload = event if isinstance(event, bytes) else encode_event(event)
+        key = None if key is None else str(key).encode('utf-8')
+        self.produce_raw(topic, payload, key=key, on_delivery=on_delivery)
+
+    def produce_raw(self, topic, value, key=None, headers=None, on_delivery=None):
+        """
+        Gửi message đã mã hóa sẵn (vd. chuyển nguyên message sang topic retry/DLQ).
+        """
+        deadline = time.monotonic() + self.block_timeout
+        while True:
+            try:
+                self._client.produce(
+                    topic=topic, key=key, value=value, headers=headers,
+                    on_delivery=on_delivery or delivery_report,
+                )
+                return
+            except BufferError:
+                # Hàng đợi cục bộ đầy: chờ thread poll giải phóng bớt thay vì làm tràn bộ nhớ
+                if time.monotonic() >= deadline:
+                    logger.error(f"Kafka producer queue full for {self.block_timeout}s, dropping to caller")
+                    raise
+                self._client.poll(0.05)
+
+    def flush(self, timeout=None) -> int:
+        """
+        Chờ các message trong hàng đợi được xác nhận; trả về số message còn lại.
+        """
+        return self._client.flush(settings.KAFKA_PRODUCER_FLUSH_TIMEOUT if timeout is None else timeout)
+
+    def close(self, timeout=None) -> int:
+        remaining = self.flush(timeout)
+        self._stop.set()
+        self._poll_thread.join(timeout=1)
+        if remaining:
+            logger.error(f"Kafka producer closed with {remaining} undelivered messages")
+        return remaining
+
+
+_producer = None
+_producer_lock = threading.Lock()
+
+
+def get_producer() -> OrderEventProducer:
+    """
+    Producer dùng chung của tiến trình, khởi tạo ở lần dùng đầu tiên và được
+    flush khi tiến trình thoát.
+    """
+    global _producer
+    if _producer is None:
+        with _producer_lock:
+            if _producer is None:
+                _producer = OrderEventProducer()
+                atexit.register(_producer.close)
+    return _producer
+
 
-def send_kafka_event(topic, event):
+def send_kafka_event(topic, event, key=None):
+    """
+    Gửi sự kiện không chặn; lỗi giao nhận được báo qua delivery_report.
+    """
     try:
-        payload = json.dumps(event).encode("utf-8")
-        producer.produce(topic=topic, value=payload, callback=delivery_report)
-        producer.flush()
-        logger.info(f"Produced event to Kafka topic '{topic}'")
-    except Exception as e:
+        get_producer().produce(topic, event, key=key)
+        logger.info(f"Queued event for Kafka topic '{topic}'")
+    except Exception:
         logger.exception("Failed to send Kafka event")
         raise
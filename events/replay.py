@@ -0,0 +1,78 @@
+"""
+Replay sự kiện đơn hàng từ Kafka (`manage.py replay_order_events`).
+
+Mỗi lô được áp dụng trong một transaction cùng với việc dời checkpoint
+(ReplayCheckpoint), nên lượt replay bị dừng giữa chừng chạy tiếp đúng từ lô
+chưa commit. Tác động chọn được:
+
+- `stock`: áp dụng tồn kho cho các sự kiện chưa có trong sổ ProcessedEvent (sự
+  kiện đã xử lý bị bỏ qua, trừ khi ignore_ledger) và ghi chúng vào sổ. Consumer
+  bỏ qua sự kiện đã có trong sổ, nên chỉ replay tới offset consumer group đã
+  commit, để consumer vẫn gửi thông báo và email cho các sự kiện sau đó;
+- `notifications`: dựng lại thông báo (upsert theo event_id, chạy lại an toàn);
+- `all`: cả hai; `none`: chỉ đọc và đếm (dry-run).
+
+Replay không gửi email.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models import F
+
+from apps.orders.models import ReplayCheckpoint
+from events.consumers.processing import apply_stock, rebuild_notifications
+from events.ledger import claim_events
+
+logger = logging.getLogger(__name__)
+
+EFFECTS_ALL = 'all'
+EFFECTS_STOCK = 'stock'
+EFFECTS_NOTIFICATIONS = 'notifications'
+EFFECTS_NONE = 'none'
+EFFECTS = (EFFECTS_ALL, EFFECTS_STOCK, EFFECTS_NOTIFICATIONS, EFFECTS_NONE)
+
+
+def apply_replay_batch(events, effects=EFFECTS_ALL, ignore_ledger=False) -> dict:
+    """
+    Áp dụng một lô sự kiện đã decode; trả về số sự kiện theo từng loại tác động.
+    Phải gọi trong transaction cùng với save_progress().
+    """
+    stats = {'stock': 0, 'skipped': 0, 'notifications': 0}
+    if effects in (EFFECTS_ALL, EFFECTS_STOCK):
+        # Luôn ghi sổ để consumer đang chạy không áp dụng lại các sự kiện này
+        claimed = claim_events(events)
+        applied = events if ignore_ledger else claimed
+        # Replay không dừng vì một sự kiện cũ không còn áp dụng được; chỉ ghi log
+        apply_stock(applied, strict=False)
+        stats['stock'] = len(applied)
+        stats['skipped'] = len(events) - len(applied)
+    if effects in (EFFECTS_ALL, EFFECTS_NOTIFICATIONS):
+        stats['notifications'] = rebuild_notifications(events)
+    return stats
+
+
+def load_checkpoints(name) -> list:
+    return list(ReplayCheckpoint.objects.filter(name=name))
+
+
+@transaction.atomic
+def start_checkpoints(name, topic, ranges) -> list:
+    """
+    Bắt đầu lượt replay mới: `ranges` là [(partition, offset đầu, offset cuối)].
+    """
+    ReplayCheckpoint.objects.filter(name=name).delete()
+    return ReplayCheckpoint.objects.bulk_create([
+        ReplayCheckpoint(name=name, topic=topic, partition=partition, offset=start, end_offset=end)
+        for partition, start, end in ranges
+    ])
+
+
+def save_progress(name, offsets, counts):
+    """
+    Dời checkpoint: `offsets` là {(topic, partition): offset kế tiếp},
+    `counts` là {(topic, partition): số sự kiện đã replay trong lô}.
+    """
+    for (topic, partition), offset in offsets.items():
+        ReplayCheckpoint.objects.filter(name=name, topic=topic, partition=partition).update(
+            offset=offset, events=F('events') + counts.get((topic, partition), 0)
+        )
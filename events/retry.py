@@ -0,0 +1,162 @@
+"""
+Retry topic và dead-letter queue cho sự kiện đơn hàng.
+
+Sự kiện xử lý lỗi được chuyển sang topic retry tương ứng với số lần thử
+(`<topic>.retry.<giây>s`, độ trễ tăng dần theo ORDER_RETRY_DELAYS); hết số lần
+thử thì chuyển sang ORDER_DLQ_TOPIC. Message giữ nguyên key/value gốc, thông
+tin thử lại nằm trong header:
+
+- x-attempt: số lần đã thất bại
+- x-not-before: thời điểm (epoch ms) sớm nhất được xử lý lại
+- x-stage: bước bị lỗi; `notify` nghĩa là DB đã ghi xong, chỉ cần gửi lại thông báo
+- x-original-topic / x-original-partition / x-original-offset: vị trí ban đầu
+- x-original-timestamp: timestamp (epoch ms) của message ban đầu, để đo độ trễ từ đầu
+- x-error: lỗi gần nhất
+"""
+import logging
+import time
+import traceback
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+STAGE_DECODE = 'decode'
+STAGE_APPLY = 'apply'
+STAGE_NOTIFY = 'notify'
+
+HEADER_ATTEMPT = 'x-attempt'
+HEADER_NOT_BEFORE = 'x-not-before'
+HEADER_STAGE = 'x-stage'
+HEADER_ORIGINAL_TOPIC = 'x-original-topic'
+HEADER_ORIGINAL_PARTITION = 'x-original-partition'
+HEADER_ORIGINAL_OFFSET = 'x-original-offset'
+HEADER_ORIGINAL_TIMESTAMP = 'x-original-timestamp'
+HEADER_ERROR = 'x-error'
+HEADER_FAILED_AT = 'x-failed-at'
+
+MAX_ERROR_LENGTH = 2000
+
+
+def retry_topic(delay: int) -> str:
+    return f"{settings.ORDER_TOPIC}.retry.{delay}s"
+
+
+def retry_topics() -> list:
+    return [retry_topic(delay) for delay in settings.ORDER_RETRY_DELAYS]
+
+
+def message_headers(msg) -> dict:
+    """
+    Header của message dưới dạng dict str -> str.
+    """
+    headers = {}
+    for name, value in msg.headers() or []:
+        headers[name] = value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+    return headers
+
+
+def message_stage(msg) -> str:
+    return message_headers(msg).get(HEADER_STAGE, STAGE_APPLY)
+
+
+def not_before(msg) -> float:
+    """
+    Thời điểm (epoch giây) message retry được phép xử lý; 0 nếu không phải message retry.
+    """
+    value = message_headers(msg).get(HEADER_NOT_BEFORE)
+    return int(value) / 1000 if value else 0
+
+
+def original_timestamp(msg):
+    """
+    Timestamp (epoch ms) của message gốc: lấy từ header nếu đây là message
+    retry/DLQ, ngược lại là timestamp của chính message; None nếu không có.
+    """
+    value = message_headers(msg).get(HEADER_ORIGINAL_TIMESTAMP)
+    if value:
+        return int(value)
+    _, timestamp = msg.timestamp()
+    return timestamp if timestamp and timestamp > 0 else None
+
+
+def format_error(error) -> str:
+    if isinstance(error, BaseException):
+        text = ''.join(traceback.format_exception_only(type(error), error)).strip()
+    else:
+        text = str(error)
+    return text[:MAX_ERROR_LENGTH]
+
+
+class EventFailure:
+    """
+    Sự kiện (payload đã decode, hoặc None nếu không decode được) bị lỗi ở một bước.
+    """
+    __slots__ = ('data', 'stage', 'error')
+
+    def __init__(self, data, stage, error):
+        self.data = data
+        self.stage = stage
+        self.error = error
+
+
+class RoutingError(RuntimeError):
+    """
+    Message lỗi chưa được broker xác nhận ở topic retry/DLQ; không được commit offset của lô.
+    """
+
+
+class FailureRouter:
+    """
+    Đẩy message lỗi sang topic retry kế tiếp hoặc DLQ qua producer dùng chung.
+    Gọi flush() và chỉ commit offset khi mọi message đã được broker xác nhận.
+    """
+
+    def __init__(self, producer):
+        self.producer = producer
+        self._errors = []
+
+    def _on_delivery(self, err, msg):
+        if err is not None:
+            self._errors.append(err)
+
+    def route(self, msg, stage, error, dead_letter=False) -> str:
+        headers = message_headers(msg)
+        attempt = int(headers.get(HEADER_ATTEMPT, 0)) + 1
+        delays = settings.ORDER_RETRY_DELAYS
+        now = time.time()
+
+        routed = {
+            HEADER_ATTEMPT: str(attempt),
+            HEADER_STAGE: stage,
+            HEADER_ORIGINAL_TOPIC: headers.get(HEADER_ORIGINAL_TOPIC, msg.topic()),
+            HEADER_ORIGINAL_PARTITION: headers.get(HEADER_ORIGINAL_PARTITION, str(msg.partition())),
+            HEADER_ORIGINAL_OFFSET: headers.get(HEADER_ORIGINAL_OFFSET, str(msg.offset())),
+            HEADER_ERROR: format_error(error),
+            HEADER_FAILED_AT: str(int(now * 1000)),
+        }
+        timestamp = original_timestamp(msg)
+        if timestamp is not None:
+            routed[HEADER_ORIGINAL_TIMESTAMP] = str(timestamp)
+        if dead_letter or attempt > len(delays):
+            topic = settings.ORDER_DLQ_TOPIC
+            logger.error(f"Moving message {msg.topic()}[{msg.partition()}]@{msg.offset()} to DLQ after {attempt} attempts")
+        else:
+            delay = delays[attempt - 1]
+            topic = retry_topic(delay)
+            routed[HEADER_NOT_BEFORE] = str(int((now + delay) * 1000))
+            logger.warning(f"Retrying message {msg.topic()}[{msg.partition()}]@{msg.offset()} in {delay}s (attempt {attempt})")
+
+        self.producer.produce_raw(
+            topic, msg.value(), key=msg.key(), headers=list(routed.items()), on_delivery=self._on_delivery
+        )
+        return topic
+
+    def flush(self):
+        """
+        Chờ broker xác nhận; ném lỗi nếu có message chưa được ghi để không commit offset.
+        """
+        remaining = self.producer.flush()
+        errors, self._errors = self._errors, []
+        if remaining or errors:
+            raise RoutingError(f"Failed to route {remaining + len(errors)} failed events to retry/DLQ topics")
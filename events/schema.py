@@ -0,0 +1,289 @@
+"""
+Mã hóa sự kiện đơn hàng.
+
+Hai định dạng cùng tồn tại trong thời gian chuyển đổi:
+- `json`: JSON UTF-8 như trước (DjangoJSONEncoder);
+- `binary`: 3 byte đầu [MAGIC, phiên bản schema, cờ] rồi tới phần thân dạng
+  tag + giá trị (kiểu msgpack). Tên key và các giá trị hay gặp (event_type)
+  được thay bằng chỉ số trong bảng SYMBOLS của phiên bản, event_id dạng UUID
+  ghi thành 16 byte, số nguyên ghi dạng varint; danh sách các dict cùng bộ key
+  (vd. items) ghi tên key một lần rồi tới từng dòng giá trị. Thân lớn hơn
+  EVENT_COMPRESSION_THRESHOLD byte được nén zlib (cờ FLAG_ZLIB).
+
+decode_event() đọc được cả hai định dạng (JSON luôn bắt đầu bằng ký tự in được,
+không trùng MAGIC), nên cần triển khai consumer trước rồi mới đổi EVENT_ENCODING
+của producer sang `binary`.
+
+Bảng SYMBOLS của một phiên bản đã phát hành không được sửa: thêm key mới thì
+tạo phiên bản mới (sao chép bảng cũ rồi nối thêm) và tăng SCHEMA_VERSION.
+"""
+import json
+import struct
+import uuid
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+ENCODING_JSON = 'json'
+ENCODING_BINARY = 'binary'
+
+MAGIC = 0xE7
+FLAG_ZLIB = 0x01
+COMPRESSION_LEVEL = 6
+# Giới hạn thân sau giải nén, để payload nén hỏng/cố ý không làm cạn bộ nhớ
+MAX_DECOMPRESSED_SIZE = 16 * 1024 * 1024
+
+SYMBOLS = {
+    1: (
+        'event_id', 'event_type', 'order_id', 'user_id', 'email', 'items', 'product_id',
+        'quantity', 'stock_reserved', 'price', 'status', 'total_price',
+        'ORDER_CREATED', 'ORDER_CANCELED', 'ORDER_DELIVERED',
+    ),
+}
+SCHEMA_VERSION = 1
+
+TAG_NONE = 0x00
+TAG_FALSE = 0x01
+TAG_TRUE = 0x02
+TAG_INT = 0x03
+TAG_FLOAT = 0x04
+TAG_STR = 0x05
+TAG_SYMBOL = 0x06
+TAG_UUID = 0x07
+TAG_LIST = 0x08
+TAG_DICT = 0x09
+TAG_TABLE = 0x0A
+
+_DOUBLE = struct.Struct('>d')
+_SYMBOL_INDEX = {version: {name: index for index, name in enumerate(names)} for version, names in SYMBOLS.items()}
+_json_default = DjangoJSONEncoder().default
+
+
+class EventDecodeError(ValueError):
+    pass
+
+
+def _write_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _is_uuid(value) -> bool:
+    if len(value) != 36 or value[8] != '-':
+        return False
+    try:
+        return str(uuid.UUID(value)) == value
+    except ValueError:
+        return False
+
+
+def _table_keys(rows):
+    """
+    Bộ key chung (đúng thứ tự) nếu `rows` gồm ít nhất 2 dict có cùng key str.
+    """
+    if len(rows) < 2 or not isinstance(rows[0], dict):
+        return None
+    keys = tuple(rows[0])
+    if not keys or not all(isinstance(key, str) for key in keys):
+        return None
+    for row in rows:
+        if not isinstance(row, dict) or tuple(row) != keys:
+            return None
+    return keys
+
+
+def _write(out, value, symbols):
+    if value is None:
+        out.append(TAG_NONE)
+    elif value is True:
+        out.append(TAG_TRUE)
+    elif value is False:
+        out.append(TAG_FALSE)
+    elif isinstance(value, str):
+        index = symbols.get(value)
+        if index is not None:
+            out.append(TAG_SYMBOL)
+            _write_varint(out, index)
+        elif _is_uuid(value):
+            out.append(TAG_UUID)
+            out += uuid.UUID(value).bytes
+        else:
+            data = value.encode('utf-8')
+            out.append(TAG_STR)
+            _write_varint(out, len(data))
+            out += data
+    elif isinstance(value, int):
+        out.append(TAG_INT)
+        # zigzag: số âm nhỏ cũng chỉ tốn ít byte
+        _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+    elif isinstance(value, float):
+        out.append(TAG_FLOAT)
+        out += _DOUBLE.pack(value)
+    elif isinstance(value, dict):
+        out.append(TAG_DICT)
+        _write_varint(out, len(value))
+        for key, item in value.items():
+            if not isinstance(key, str):
+                key = str(key)
+            _write(out, key, symbols)
+            _write(out, item, symbols)
+    elif isinstance(value, (list, tuple)):
+        keys = _table_keys(value)
+        if keys is not None:
+            out.append(TAG_TABLE)
+            _write_varint(out, len(value))
+            _write_varint(out, len(keys))
+            for key in keys:
+                _write(out, key, symbols)
+            for row in value:
+                for item in row.values():
+                    _write(out, item, symbols)
+            return
+        out.append(TAG_LIST)
+        _write_varint(out, len(value))
+        for item in value:
+            _write(out, item, symbols)
+    else:
+        # Decimal, datetime, UUID...: cùng dạng chuỗi như bản JSON
+        _write(out, _json_default(value), symbols)
+
+
+class _Reader:
+    __slots__ = ('data', 'pos', 'symbols')
+
+    def __init__(self, data, symbols):
+        self.data = data
+        self.pos = 0
+        self.symbols = symbols
+
+    def varint(self):
+        data = self.data
+        result = shift = 0
+        while True:
+            byte = data[self.pos]
+            self.pos += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def count(self, min_size=1):
+        """
+        Số phần tử của list/dict; mỗi phần tử chiếm ít nhất `min_size` byte nên
+        số phần tử không thể vượt quá phần payload còn lại.
+        """
+        count = self.varint()
+        if count * min_size > len(self.data) - self.pos:
+            raise EventDecodeError("Element count exceeds event payload size")
+        return count
+
+    def take(self, size):
+        end = self.pos + size
+        if end > len(self.data):
+            raise EventDecodeError("Truncated event payload")
+        chunk = self.data[self.pos:end]
+        self.pos = end
+        return chunk
+
+    def value(self):
+        data = self.data
+        pos = self.pos
+        tag = data[pos]
+        # Đường tắt cho symbol và số nguyên nhỏ (varint 1 byte), chiếm phần lớn payload
+        if tag == TAG_SYMBOL or tag == TAG_INT:
+            byte = data[pos + 1]
+            if byte < 0x80:
+                self.pos = pos + 2
+                value = byte
+            else:
+                self.pos = pos + 1
+                value = self.varint()
+            if tag == TAG_SYMBOL:
+                return self.symbols[value]
+            return value >> 1 if not value & 1 else -((value + 1) >> 1)
+        self.pos = pos + 1
+        if tag == TAG_DICT:
+            return {self.value(): self.value() for _ in range(self.count(2))}
+        if tag == TAG_TABLE:
+            rows = self.varint()
+            keys = [self.value() for _ in range(self.count())]
+            # Bảng không có key thì mỗi dòng không tốn byte nào: số dòng không bị chặn
+            if not keys and rows:
+                raise EventDecodeError("Event table has rows but no keys")
+            if rows * len(keys) > len(data) - self.pos:
+                raise EventDecodeError("Element count exceeds event payload size")
+            value = self.value
+            return [{key: value() for key in keys} for _ in range(rows)]
+        if tag == TAG_LIST:
+            return [self.value() for _ in range(self.count())]
+        if tag == TAG_STR:
+            return str(self.take(self.varint()), 'utf-8')
+        if tag == TAG_UUID:
+            return str(uuid.UUID(bytes=bytes(self.take(16))))
+        if tag == TAG_NONE:
+            return None
+        if tag == TAG_TRUE:
+            return True
+        if tag == TAG_FALSE:
+            return False
+        if tag == TAG_FLOAT:
+            return _DOUBLE.unpack(self.take(8))[0]
+        raise EventDecodeError(f"Unknown tag {tag:#x} in event payload")
+
+
+def encode_event(event, encoding=None, compression_threshold=None) -> bytes:
+    """
+    Mã hóa theo `encoding` (mặc định EVENT_ENCODING); `compression_threshold`
+    = 0 để không nén.
+    """
+    encoding = encoding or settings.EVENT_ENCODING
+    if encoding == ENCODING_JSON:
+        return json.dumps(event, cls=DjangoJSONEncoder).encode('utf-8')
+    if encoding != ENCODING_BINARY:
+        raise ValueError(f"Unknown event encoding {encoding!r}")
+
+    body = bytearray()
+    _write(body, event, _SYMBOL_INDEX[SCHEMA_VERSION])
+    flags = 0
+    threshold = settings.EVENT_COMPRESSION_THRESHOLD if compression_threshold is None else compression_threshold
+    if threshold and len(body) >= threshold:
+        compressed = zlib.compress(body, COMPRESSION_LEVEL)
+        if len(compressed) < len(body):
+            body, flags = compressed, FLAG_ZLIB
+    return bytes((MAGIC, SCHEMA_VERSION, flags)) + body
+
+
+def is_binary(value) -> bool:
+    return bool(value) and value[0] == MAGIC
+
+
+def decode_event(value):
+    """
+    Giải mã payload JSON cũ hoặc nhị phân; payload hỏng ném ValueError.
+    """
+    if not is_binary(value):
+        return json.loads(value.decode('utf-8') if isinstance(value, (bytes, bytearray)) else value)
+
+    if len(value) < 3:
+        raise EventDecodeError("Truncated event payload")
+    version, flags = value[1], value[2]
+    symbols = SYMBOLS.get(version)
+    if symbols is None:
+        raise EventDecodeError(f"Unsupported event schema version {version}")
+    body = memoryview(value)[3:]
+    try:
+        if flags & FLAG_ZLIB:
+            decompressor = zlib.decompressobj()
+            body = memoryview(decompressor.decompress(body, MAX_DECOMPRESSED_SIZE))
+            if decompressor.unconsumed_tail:
+                raise EventDecodeError(f"Event payload exceeds {MAX_DECOMPRESSED_SIZE} bytes after decompression")
+        reader = _Reader(body, symbols)
+        event = reader.value()
+    except (IndexError, TypeError, zlib.error, UnicodeDecodeError, struct.error, RecursionError) as exc:
+        raise EventDecodeError(f"Malformed event payload: {exc}") from exc
+    if reader.pos != len(body):
+        raise EventDecodeError("Trailing bytes after event payload")
+    return event
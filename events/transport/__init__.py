@@ -0,0 +1,39 @@
+"""
+Transport của sự kiện, chọn bằng EVENT_TRANSPORT:
+
+- `kafka`: confluent_kafka.Producer/Consumer kết nối KAFKA_BOOTSTRAP_SERVERS;
+- `memory`: broker giả lập trong tiến trình (events.transport.memory), để chạy
+  test/benchmark toàn bộ pipeline mà không cần Kafka. Producer và consumer chỉ
+  thấy nhau khi chạy trong cùng một tiến trình.
+
+Cả hai nhận cùng dict cấu hình librdkafka.
+"""
+from django.conf import settings
+
+TRANSPORT_KAFKA = 'kafka'
+TRANSPORT_MEMORY = 'memory'
+
+
+def _transport(transport):
+    transport = transport or settings.EVENT_TRANSPORT
+    if transport not in (TRANSPORT_KAFKA, TRANSPORT_MEMORY):
+        raise ValueError(f"Unknown event transport {transport!r}")
+    return transport
+
+
+def create_producer(config, transport=None):
+    if _transport(transport) == TRANSPORT_MEMORY:
+        from events.transport.memory import InMemoryProducer
+        return InMemoryProducer(config)
+
+    from confluent_kafka import Producer
+    return Producer(config)
+
+
+def create_consumer(config, transport=None):
+    if _transport(transport) == TRANSPORT_MEMORY:
+        from events.transport.memory import InMemoryConsumer
+        return InMemoryConsumer(config)
+
+    from confluent_kafka import Consumer
+    return Consumer(config)
@@ -0,0 +1,447 @@
+"""
+Broker Kafka giả lập trong tiến trình, dùng cho benchmark và test.
+
+InMemoryProducer có cùng API produce/poll/flush/len với confluent_kafka.Producer
+và mô phỏng cách librdkafka gom message: message nằm trong hàng đợi cục bộ
+(giới hạn bởi queue.buffering.max.messages) cho tới khi đủ batch.num.messages
+hoặc quá linger.ms, mỗi lô gửi đi tốn một lượt "round trip" tới broker.
+
+InMemoryConsumer có phần API của confluent_kafka.Consumer mà consumer, replay
+và công cụ DLQ dùng: subscribe theo consumer group (chia partition giữa các
+thành viên, gọi on_assign/on_revoke khi rebalance), assign thủ công, consume/
+poll, commit/committed, seek, pause/resume, watermark và offsets_for_times.
+"""
+import itertools
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+
+from confluent_kafka import OFFSET_BEGINNING, OFFSET_END, OFFSET_INVALID, TopicPartition
+from confluent_kafka.admin import ClusterMetadata, PartitionMetadata, TopicMetadata
+
+TIMESTAMP_CREATE_TIME = 1
+
+
+class InMemoryMessage:
+    """
+    Message đã được broker ghi nhận, cùng các accessor như confluent_kafka.Message.
+    """
+    __slots__ = ('_topic', '_partition', '_offset', '_key', '_value', '_headers', '_timestamp')
+
+    def __init__(self, topic, partition, offset, key, value, headers=None, timestamp=None):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+        self._headers = headers
+        self._timestamp = timestamp if timestamp is not None else int(time.time() * 1000)
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def headers(self):
+        return self._headers
+
+    def timestamp(self):
+        return TIMESTAMP_CREATE_TIME, self._timestamp
+
+    def error(self):
+        return None
+
+    def __len__(self):
+        return len(self._value or b'')
+
+
+def _to_bytes(value):
+    if value is None or isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+
+class InMemoryBroker:
+    """
+    Lưu message theo topic/partition. `latency` (giây) mô phỏng thời gian một
+    request produce tới broker thật.
+    """
+
+    def __init__(self, num_partitions=3, latency=0.0):
+        self.num_partitions = num_partitions
+        self.latency = latency
+        self._lock = threading.Lock()
+        # Consumer chờ message mới trên condition này
+        self._arrived = threading.Condition(self._lock)
+        self._topics = defaultdict(lambda: [[] for _ in range(self.num_partitions)])
+        self._round_robin = itertools.count()
+        self.requests = 0
+        # group.id -> các consumer đã subscribe, theo thứ tự tham gia
+        self._members = defaultdict(list)
+        # (group.id, topic, partition) -> offset đã commit
+        self._committed = {}
+
+    def partition_for(self, key):
+        # Cùng key luôn vào cùng partition, giống partitioner mặc định của Kafka
+        if key is None:
+            return next(self._round_robin) % self.num_partitions
+        return zlib.crc32(key) % self.num_partitions
+
+    def append_batch(self, records):
+        """
+        Ghi một lô (topic, partition, key, value, headers) trong một request.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        messages = []
+        with self._lock:
+            self.requests += 1
+            for topic, partition, key, value, headers in records:
+                log = self._topics[topic][partition]
+                message = InMemoryMessage(topic, partition, len(log), key, value, headers)
+                log.append(message)
+                messages.append(message)
+            self._arrived.notify_all()
+        return messages
+
+    def messages(self, topic, partition=None):
+        with self._lock:
+            partitions = self._topics[topic]
+            if partition is not None:
+                return list(partitions[partition])
+            return [message for log in partitions for message in log]
+
+    def topics(self) -> list:
+        with self._lock:
+            return list(self._topics)
+
+    def partitions(self, topic) -> int:
+        with self._lock:
+            return len(self._topics[topic])
+
+    def watermarks(self, topic, partition) -> tuple:
+        with self._lock:
+            return 0, len(self._topics[topic][partition])
+
+    def read(self, topic, partition, offset, limit) -> list:
+        with self._lock:
+            return self._topics[topic][partition][offset:offset + limit]
+
+    def offset_for_time(self, topic, partition, timestamp) -> int:
+        """
+        Offset của message đầu tiên có timestamp >= `timestamp` (ms); -1 nếu không có.
+        """
+        with self._lock:
+            for message in self._topics[topic][partition]:
+                if message.timestamp()[1] >= timestamp:
+                    return message.offset()
+        return -1
+
+    def wait(self, timeout):
+        with self._arrived:
+            self._arrived.wait(timeout)
+
+    def commit(self, group_id, offsets):
+        with self._lock:
+            for topic, partition, offset in offsets:
+                self._committed[(group_id, topic, partition)] = offset
+
+    def committed(self, group_id, topic, partition) -> int:
+        with self._lock:
+            return self._committed.get((group_id, topic, partition), OFFSET_INVALID)
+
+    def join(self, group_id, member):
+        with self._lock:
+            if member not in self._members[group_id]:
+                self._members[group_id].append(member)
+            self._rebalance(group_id)
+
+    def leave(self, group_id, member):
+        with self._lock:
+            if member in self._members[group_id]:
+                self._members[group_id].remove(member)
+                self._rebalance(group_id)
+
+    def _rebalance(self, group_id):
+        """
+        Chia lại mọi partition của các topic được subscribe cho các thành viên
+        (xoay vòng); mỗi thành viên áp dụng phân công mới ở lần poll kế tiếp.
+        """
+        members = self._members[group_id]
+        assignments = {id(member): [] for member in members}
+        topics = sorted({topic for member in members for topic in member.subscription})
+        for topic in topics:
+            eligible = [member for member in members if topic in member.subscription]
+            for partition in range(len(self._topics[topic])):
+                assignments[id(eligible[partition % len(eligible)])].append((topic, partition))
+        for member in members:
+            member.pending_assignment = assignments[id(member)]
+        self._arrived.notify_all()
+
+    def take_assignment(self, member):
+        """
+        Phân công mới của thành viên sau rebalance (None nếu không có thay đổi).
+        """
+        with self._lock:
+            assignment, member.pending_assignment = member.pending_assignment, None
+        return assignment
+
+
+_default_broker = None
+_default_broker_lock = threading.Lock()
+
+
+def get_default_broker():
+    global _default_broker
+    with _default_broker_lock:
+        if _default_broker is None:
+            _default_broker = InMemoryBroker()
+        return _default_broker
+
+
+class InMemoryProducer:
+    """
+    Thay thế confluent_kafka.Producer, đọc các key cấu hình librdkafka liên
+    quan tới gom lô (linger.ms, batch.num.messages, queue.buffering.max.messages).
+    """
+
+    def __init__(self, config=None, broker=None):
+        config = config or {}
+        self.broker = broker or get_default_broker()
+        self.linger = float(config.get('linger.ms', 5)) / 1000
+        self.batch_size = int(config.get('batch.num.messages', 10000))
+        self.max_messages = int(config.get('queue.buffering.max.messages', 100000))
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def produce(self, topic, value=None, key=None, partition=None, on_delivery=None,
+                callback=None, headers=None, timestamp=None):
+        key = _to_bytes(key)
+        with self._lock:
+            if len(self._queue) >= self.max_messages:
+                raise BufferError('Local: Queue full')
+            if partition is None or partition < 0:
+                partition = self.broker.partition_for(key)
+            self._queue.append((
+                time.monotonic(), (topic, partition, key, _to_bytes(value), headers), on_delivery or callback
+            ))
+
+    def _take_batch(self, force):
+        with self._lock:
+            if not self._queue:
+                return []
+            oldest = self._queue[0][0]
+            if not force and len(self._queue) < self.batch_size and time.monotonic() - oldest < self.linger:
+                return []
+            return [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+    def _send(self, force):
+        with self._send_lock:
+            batch = self._take_batch(force)
+            if not batch:
+                return 0
+            messages = self.broker.append_batch([record for _, record, _ in batch])
+            # Gọi callback trong lock để flush() chỉ trả về khi mọi callback đã chạy
+            for (_, _, on_delivery), message in zip(batch, messages):
+                if on_delivery is not None:
+                    on_delivery(None, message)
+        return len(batch)
+
+    def poll(self, timeout=None):
+        served = self._send(force=False)
+        if not served and timeout:
+            time.sleep(min(timeout, self.linger or timeout))
+            served = self._send(force=False)
+        return served
+
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._send(force=True)
+            with self._send_lock:
+                remaining = len(self._queue)
+            # Thread khác có thể vừa produce thêm: chỉ dừng khi hàng đợi rỗng hoặc hết thời gian
+            if not remaining or (deadline is not None and time.monotonic() >= deadline):
+                return remaining
+
+
+class InMemoryConsumer:
+    """
+    Thay thế confluent_kafka.Consumer. Đọc các key cấu hình group.id,
+    auto.offset.reset và enable.auto.commit. Mỗi consumer chỉ dùng trong một thread.
+    """
+
+    def __init__(self, config=None, broker=None):
+        config = config or {}
+        self.broker = broker or get_default_broker()
+        self.group_id = config.get('group.id')
+        self.auto_offset_reset = config.get('auto.offset.reset', 'latest')
+        self.auto_commit = str(config.get('enable.auto.commit', True)).lower() in ('true', '1')
+        self.subscription = ()
+        # Phân công mới do broker đặt khi rebalance, được áp dụng trong consume/poll
+        self.pending_assignment = None
+        self._on_assign = None
+        self._on_revoke = None
+        self._positions = {}
+        self._paused = set()
+        self._next = 0
+
+    # Phân công partition
+
+    def subscribe(self, topics, on_assign=None, on_revoke=None, on_lost=None):
+        self.subscription = tuple(topics)
+        self._on_assign = on_assign
+        self._on_revoke = on_revoke
+        self.broker.join(self.group_id, self)
+
+    def assign(self, partitions):
+        self._positions = {}
+        self._paused = set()
+        for tp in partitions:
+            self._positions[(tp.topic, tp.partition)] = self._resolve(tp.topic, tp.partition, tp.offset)
+
+    def unassign(self):
+        self._positions = {}
+        self._paused = set()
+
+    def assignment(self):
+        return [TopicPartition(topic, partition) for topic, partition in self._positions]
+
+    def _resolve(self, topic, partition, offset):
+        low, high = self.broker.watermarks(topic, partition)
+        if offset == OFFSET_BEGINNING:
+            return low
+        if offset == OFFSET_END:
+            return high
+        if offset is None or offset < 0:
+            committed = self.broker.committed(self.group_id, topic, partition)
+            if committed >= 0:
+                return committed
+            return low if self.auto_offset_reset in ('earliest', 'smallest', 'beginning') else high
+        return offset
+
+    def _serve_rebalance(self):
+        assignment = self.broker.take_assignment(self)
+        if assignment is None:
+            return
+        if self._positions and self._on_revoke is not None:
+            self._on_revoke(self, self.assignment())
+        if self.auto_commit:
+            self.commit(asynchronous=False)
+        self.assign([TopicPartition(topic, partition) for topic, partition in assignment])
+        if self._on_assign is not None:
+            self._on_assign(self, self.assignment())
+
+    # Đọc message
+
+    def consume(self, num_messages=1, timeout=-1):
+        deadline = None if timeout is None or timeout < 0 else time.monotonic() + timeout
+        while True:
+            self._serve_rebalance()
+            messages = self._read(num_messages)
+            if messages:
+                if self.auto_commit:
+                    self.commit(asynchronous=False)
+                return messages
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return []
+            self.broker.wait(remaining if remaining is not None else 1.0)
+
+    def _read(self, limit):
+        partitions = [position for position in self._positions if position not in self._paused]
+        if not partitions:
+            return []
+        messages = []
+        # Xoay vòng partition bắt đầu để không partition nào bị bỏ đói
+        self._next = (self._next + 1) % len(partitions)
+        for topic, partition in partitions[self._next:] + partitions[:self._next]:
+            if len(messages) >= limit:
+                break
+            batch = self.broker.read(topic, partition, self._positions[(topic, partition)], limit - len(messages))
+            if batch:
+                self._positions[(topic, partition)] = batch[-1].offset() + 1
+                messages.extend(batch)
+        return messages
+
+    def poll(self, timeout=None):
+        messages = self.consume(1, -1 if timeout is None else timeout)
+        return messages[0] if messages else None
+
+    def seek(self, partition):
+        self._positions[(partition.topic, partition.partition)] = self._resolve(
+            partition.topic, partition.partition, partition.offset
+        )
+
+    def pause(self, partitions):
+        self._paused.update((tp.topic, tp.partition) for tp in partitions)
+
+    def resume(self, partitions):
+        self._paused.difference_update((tp.topic, tp.partition) for tp in partitions)
+
+    def position(self, partitions):
+        return [
+            TopicPartition(tp.topic, tp.partition, self._positions.get((tp.topic, tp.partition), OFFSET_INVALID))
+            for tp in partitions
+        ]
+
+    # Offset
+
+    def commit(self, message=None, offsets=None, asynchronous=True):
+        if message is not None:
+            offsets = [TopicPartition(message.topic(), message.partition(), message.offset() + 1)]
+        elif offsets is None:
+            offsets = [TopicPartition(topic, partition, offset) for (topic, partition), offset in self._positions.items()]
+        self.broker.commit(self.group_id, [(tp.topic, tp.partition, tp.offset) for tp in offsets])
+        return None if asynchronous else offsets
+
+    def committed(self, partitions, timeout=None):
+        return [
+            TopicPartition(tp.topic, tp.partition, self.broker.committed(self.group_id, tp.topic, tp.partition))
+            for tp in partitions
+        ]
+
+    def get_watermark_offsets(self, partition, timeout=None, cached=False):
+        return self.broker.watermarks(partition.topic, partition.partition)
+
+    def offsets_for_times(self, partitions, timeout=None):
+        return [
+            TopicPartition(tp.topic, tp.partition, self.broker.offset_for_time(tp.topic, tp.partition, tp.offset))
+            for tp in partitions
+        ]
+
+    def list_topics(self, topic=None, timeout=-1):
+        metadata = ClusterMetadata()
+        names = [topic] if topic is not None else self.broker.topics()
+        for name in names:
+            topic_metadata = TopicMetadata()
+            topic_metadata.topic = name
+            for partition in range(self.broker.partitions(name)):
+                partition_metadata = PartitionMetadata()
+                partition_metadata.id = partition
+                topic_metadata.partitions[partition] = partition_metadata
+            metadata.topics[name] = topic_metadata
+        return metadata
+
+    def close(self):
+        if self.auto_commit and self._positions:
+            self.commit(asynchronous=False)
+        if self.subscription:
+            self.broker.leave(self.group_id, self)
+        self.subscription = ()
+        self._positions = {}